@@ -1,8 +1,13 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FLythrough'))
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import nibabel as nib
 import pyvista as pv
 from pyvista import examples
+import smoothing
+import nifti_io
 
 # Global variable for storing the segmentation
 segmentation = None
@@ -14,13 +19,13 @@ def load_nifti_file():
     nifti_file = filedialog.askopenfilename(title='Select NIfTI File', filetypes=[("NIfTI files", "*.nii;*.nii.gz")])
     if nifti_file:
         try:
-            nifti_data = nib.load(nifti_file)
-            segmentation = nifti_data.get_fdata()
+            # Keep the on-disk dtype (memory-mapped when uncompressed) and the voxel spacing/origin
+            segmentation, spacing, origin = nifti_io.load_nifti_volume(nifti_file)
 
             # Visualize the segmentation using PyVista
-            volume = pv.wrap(segmentation)
+            volume = nifti_io.volume_to_grid(segmentation, spacing, origin)
             contours = volume.contour([0.3])
-            smoothed_contours = contours.smooth(n_iter=30, relaxation_factor=0.3)
+            smoothed_contours = smoothing.smooth_mesh(contours, n_iter=30, relaxation_factor=0.3)
             plotter = pv.Plotter()
             plotter.add_mesh(smoothed_contours, color="pink", opacity=1.0)
             plotter.show()
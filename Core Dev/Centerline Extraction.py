@@ -1,106 +1,42 @@
-import vtk
-import vmtk.vmtkscripts as vmtk
-import pyvista as pv
-
-def extract_network_and_center_curves(nifti_file, output_network_file, output_centerline_file, reduction_factor=0.5, label_value=1, smoothing_iterations=20, relaxation_factor=0.1, verbose=False):
-    try:
-        if verbose:
-            print(f"Reading NIFTI file: {nifti_file}")
-        reader = vtk.vtkNIFTIImageReader()
-        reader.SetFileName(nifti_file)
-        reader.Update()
-        
-        if verbose:
-            print("Converting the image to a VTK PolyData surface using Marching Cubes")
-        marchingCubes = vtk.vtkMarchingCubes()
-        marchingCubes.SetInputConnection(reader.GetOutputPort())
-        marchingCubes.SetValue(0, label_value)
-        marchingCubes.Update()
-        
-        surface = marchingCubes.GetOutput()
-
-        if verbose:
-            print("Smoothing the surface using vtkSmoothPolyDataFilter")
-        smoother = vtk.vtkSmoothPolyDataFilter()
-        smoother.SetInputData(surface)
-        smoother.SetNumberOfIterations(smoothing_iterations)
-        smoother.SetRelaxationFactor(relaxation_factor)
-        smoother.FeatureEdgeSmoothingOff()
-        smoother.BoundarySmoothingOn()
-        smoother.Update()
-
-        smoothed_surface = smoother.GetOutput()
-        
-        if verbose:
-            print(f"Decimating the surface with a reduction factor of {reduction_factor}")
-        decimate = vtk.vtkDecimatePro()
-        decimate.SetInputData(smoothed_surface)
-        decimate.SetTargetReduction(reduction_factor)
-        decimate.PreserveTopologyOn()
-        decimate.Update()
-        
-        decimated_surface = decimate.GetOutput()
-        
-        if verbose:
-            print("Visualizing the decimated surface for verification")
-        visualize_surface(decimated_surface)
-        
-        if verbose:
-            print("Extracting network curves using vmtk")
-        network_filter = vmtk.vmtkNetworkExtraction()
-        network_filter.Surface = decimated_surface
-        network_filter.Execute()
-        
-        network_curves = network_filter.Network
-        
-        if verbose:
-            print(f"Writing network curves to the output file: {output_network_file}")
-        writer_network = vtk.vtkXMLPolyDataWriter()
-        writer_network.SetFileName(output_network_file)
-        writer_network.SetInputData(network_curves)
-        writer_network.Write()
-
-        if verbose:
-            print("Extracting centerline using vmtk")
-        centerline_filter = vmtk.vmtkCenterlines()
-        centerline_filter.Surface = decimated_surface
-        centerline_filter.Execute()
-        
-        centerlines = centerline_filter.Centerlines
-        
-        if verbose:
-            print(f"Writing centerline to the output file: {output_centerline_file}")
-        writer_centerline = vtk.vtkXMLPolyDataWriter()
-        writer_centerline.SetFileName(output_centerline_file)
-        writer_centerline.SetInputData(centerlines)
-        writer_centerline.Write()
-
-        if verbose:
-            print("Centerline extraction and writing completed successfully")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-def visualize_surface(surface):
-    """Utility function to visualize the surface for debugging."""
-    pv_surface = pv.wrap(surface)
-    plotter = pv.Plotter()
-    plotter.add_mesh(pv_surface, color='lightblue', show_edges=True)
-    plotter.show()
- 
-# def visualize_curves(curves_file):
-#     """Utility function to visualize the curves in PyVista."""
-#     curves = pv.read(curves_file)
-#     plotter = pv.Plotter()
-#     plotter.add_mesh(curves, color='red', line_width=2)
-#     plotter.camera_position = 'xy'
-#     plotter.show()
-
-# Usage example
-nifti_file = "D:\\dicom\\combined_segmentation.nii.gz"
-output_network_file = 'network_curves5.vtp'
-output_centerline_file = 'centerline5.vtp'
-extract_network_and_center_curves(nifti_file, output_network_file, output_centerline_file, reduction_factor=0.3, label_value=1, smoothing_iterations=20, relaxation_factor=0.1, verbose=True)
-
-# Visualize the resulting network curves and centerline
-# visualize_curves(output_network_file)
-# visualize_curves(output_centerline_file)
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FLythrough'))
+import json
+import argparse
+import centerline
+import profiling
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract network curves and centerlines from colon segmentations, one case per worker process.")
+    parser.add_argument("inputs", nargs="+", help="Segmentation .nii/.nii.gz files, directories of them, or manifest files (.txt/.csv, one path per line)")
+    parser.add_argument("--out-dir", default="centerlines", help="Each case writes <out-dir>/<case>/network.vtp and centerline.vtp")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument("--backend", choices=("vmtk", "skeleton"), default="vmtk")
+    parser.add_argument("--reduction-factor", type=float, default=0.3)
+    parser.add_argument("--label-value", type=float, default=1)
+    parser.add_argument("--smoothing-iterations", type=int, default=20)
+    parser.add_argument("--relaxation-factor", type=float, default=0.1)
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every stage instead of reusing checkpointed outputs")
+    parser.add_argument("--report", help="JSON file for the per-case results (default <out-dir>/report.json)")
+    parser.add_argument("--profile", help="Append per-stage time and memory records to this JSON-lines log")
+    parser.add_argument("--profile-memory", action="store_true", help="With --profile, also trace allocation peaks (slows the run)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable(args.profile, track_allocations=args.profile_memory)
+
+    cases = centerline.find_cases(args.inputs)
+    print(f"{len(cases)} cases, {args.workers} workers, {args.backend} backend")
+    results = centerline.run_batch(cases, args.out_dir, workers=args.workers, backend=args.backend,
+                                   reduction_factor=args.reduction_factor, label_value=args.label_value,
+                                   smoothing_iterations=args.smoothing_iterations, relaxation_factor=args.relaxation_factor,
+                                   use_cache=not args.no_cache, verbose=args.verbose)
+    centerline.print_report(results)
+    if args.profile:
+        profiling.print_summary(profiling.read_log(args.profile))
+
+    report = args.report or os.path.join(args.out_dir, "report.json")
+    with open(report, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {report}")
+    sys.exit(0 if all(r['status'] == 'ok' for r in results) else 1)
@@ -1,37 +1,74 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FLythrough'))
+import numpy as np
 import pyvista as pv
 import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+import surface_extraction
  
-def load_nifti_as_surface(nifti_file, contour_value):
-    """Load NIfTI file and convert to a surface using Marching Cubes."""
+def read_nifti(nifti_file):
+    """Read the NIfTI file once; every later step works on the returned vtkImageData."""
     reader = vtk.vtkNIFTIImageReader()
     reader.SetFileName(nifti_file)
     reader.Update()
+    return reader.GetOutput()
  
-    # Create a surface using the Marching Cubes algorithm
-    marching_cubes = vtk.vtkMarchingCubes()
-    marching_cubes.SetInputConnection(reader.GetOutputPort())
-    marching_cubes.SetValue(0, contour_value)  # Set the contour value
-    marching_cubes.Update()
+def volume_histogram(image, levels, chunk_size=1 << 24):
+    """Value range and voxel counts between consecutive levels, in a single chunked pass over the scalars."""
+    values = vtk_to_numpy(image.GetPointData().GetScalars()).ravel()
+    edges = np.concatenate(([-np.inf], levels, [np.inf]))
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    vmin, vmax = np.inf, -np.inf
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        vmin = min(vmin, chunk.min())
+        vmax = max(vmax, chunk.max())
+        counts += np.histogram(chunk, bins=edges)[0]
+    return vmin, vmax, counts
  
-    output = marching_cubes.GetOutput()
-    if output.GetNumberOfPoints() == 0:
+def choose_contour_value(image, possible_contour_values):
+    """Pick the first level that has voxels both below and at/above it, so marching cubes will produce a surface."""
+    levels = np.sort(np.asarray(possible_contour_values, dtype=np.float64))
+    vmin, vmax, counts = volume_histogram(image, levels)
+    total = counts.sum()
+ 
+    print(f"Volume value range: [{vmin}, {vmax}]")
+    for i, level in enumerate(levels):
+        above = counts[i + 1:].sum()
+        print(f"  level {level:.2f}: {above} voxels at or above ({100.0 * above / total:.3f}%)")
+ 
+    for i, level in enumerate(levels):
+        above = counts[i + 1:].sum()
+        below = total - above
+        if above > 0 and below > 0:
+            print(f"Chosen contour value: {level} ({below} voxels below, {above} at or above; "
+                  f"it is the lowest candidate inside the value range ({vmin}, {vmax}])")
+            return level
+    return None
+ 
+def extract_surface(image, contour_value):
+    """Convert an already loaded image to a surface using cropped, multi-threaded Marching Cubes."""
+    surface = surface_extraction.extract_surface(image, contour_value)
+    if surface.n_points == 0:
         print(f"Warning: No surface was created with contour value {contour_value}.")
         return None
  
-    return pv.wrap(output)
+    return surface
  
 def main():
     model_file = "new seg.nii 1.gz"
     centerline_file = "centerline.vtp"
  
-    # Try different contour values within the range
+    # Read the volume once and pick a contour value from its histogram before meshing
     possible_contour_values = [0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
-    for contour_value in possible_contour_values:
-        print(f"Trying contour value: {contour_value}")
-        model_surface = load_nifti_as_surface(model_file, contour_value)
-        if model_surface is not None:
-            break
+    image = read_nifti(model_file)
+    contour_value = choose_contour_value(image, possible_contour_values)
+    if contour_value is None:
+        print("Failed to create a surface with any of the contour values.")
+        return
  
+    model_surface = extract_surface(image, contour_value)
     if model_surface is None:
         print("Failed to create a surface with any of the contour values.")
         return
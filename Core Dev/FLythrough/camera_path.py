@@ -0,0 +1,112 @@
+
+import os
+import json
+import numpy as np
+import pyvista as pv
+from scipy.interpolate import CubicSpline
+from scipy.ndimage import gaussian_filter1d
+import nifti_io
+import centerline_graph
+import profiling
+
+# Bump when the path construction changes so stale cache files are rebuilt
+CAMERA_PATH_VERSION = 1
+
+class CameraPath:
+    """Camera positions with direction and up vectors at uniform arc-length spacing.
+
+    Because the samples are evenly spaced, looking up a frame by arc length is an index computation and one linear
+    interpolation, whatever the path length. Up vectors come from parallel transport, so they turn smoothly with
+    the colon instead of flipping where the path runs parallel to a fixed up axis.
+    """
+
+    def __init__(self, positions, directions, ups, length):
+        self.positions = np.asarray(positions, dtype=np.float64)
+        self.directions = np.asarray(directions, dtype=np.float64)
+        self.ups = np.asarray(ups, dtype=np.float64)
+        self.length = float(length)
+        self.step = self.length / max(len(self.positions) - 1, 1)
+
+    @classmethod
+    @profiling.span('camera_path_build')
+    def build(cls, points, n_samples=2000, resample_points=150, sigma=2.0, oversample=8, world_up=(0.0, 1.0, 0.0)):
+        """Smooth the centerline, fit a cubic spline through it and sample it at n_samples equal arc-length steps."""
+        points = np.asarray(points, dtype=np.float64)
+        chord = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))])
+        keep = np.concatenate([[True], np.diff(chord) > 0])
+        points, chord = points[keep], chord[keep]
+
+        # Same preprocessing the GUIs used: resample evenly, then Gaussian smoothing
+        u = np.linspace(0.0, chord[-1], resample_points)
+        control = gaussian_filter1d(np.stack([np.interp(u, chord, points[:, dim]) for dim in range(3)], axis=1), sigma=sigma, axis=0)
+        spline = CubicSpline(np.linspace(0.0, 1.0, resample_points), control, axis=0)
+
+        # Re-parameterise by arc length from a dense evaluation of the spline
+        t = np.linspace(0.0, 1.0, n_samples * oversample)
+        dense = spline(t)
+        arc = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(dense, axis=0), axis=1))])
+        t_uniform = np.interp(np.linspace(0.0, arc[-1], n_samples), arc, t)
+
+        positions = spline(t_uniform)
+        directions = spline(t_uniform, 1)
+        directions /= np.maximum(np.linalg.norm(directions, axis=1, keepdims=True), 1e-12)
+
+        # Start from the world up vector projected off the first direction, then transport it along the path
+        ups, _ = centerline_graph.parallel_transport_frames(directions)
+        first = np.asarray(world_up, dtype=np.float64) - directions[0] * np.dot(world_up, directions[0])
+        if np.linalg.norm(first) > 1e-6:
+            first /= np.linalg.norm(first)
+            angle = np.arctan2(np.dot(np.cross(ups[0], first), directions[0]), np.dot(ups[0], first))
+            ups = cls._rotate(ups, directions, angle)
+        return cls(positions, directions, ups, arc[-1])
+
+    @staticmethod
+    def _rotate(vectors, axes, angle):
+        """Rodrigues rotation of vectors perpendicular to their axes by the same angle."""
+        return vectors * np.cos(angle) + np.cross(axes, vectors) * np.sin(angle)
+
+    @classmethod
+    def from_centerline(cls, centerline_file, use_cache=True, **params):
+        """Camera path for a centerline .vtp, cached as <centerline>_camera_path.npz and rebuilt if the file changes."""
+        cache_file = cache_path(centerline_file)
+        key = json.dumps({'file': nifti_io.file_digest(centerline_file), 'version': CAMERA_PATH_VERSION, **params}, sort_keys=True)
+        if use_cache and os.path.exists(cache_file):
+            path, cached_key = cls.load(cache_file)
+            if cached_key == key:
+                return path
+        path = cls.build(pv.read(centerline_file).points, **params)
+        if use_cache:
+            path.save(cache_file, key)
+        return path
+
+    def save(self, path, key=''):
+        np.savez(path, positions=self.positions, directions=self.directions, ups=self.ups, length=self.length, key=key)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['positions'], data['directions'], data['ups'], data['length']), str(data['key'])
+
+    @property
+    def n_frames(self):
+        return len(self.positions)
+
+    def frame(self, index):
+        """(position, direction, up) of a frame index."""
+        return self.positions[index], self.directions[index], self.ups[index]
+
+    def at(self, s):
+        """(position, direction, up) at arc length s (scalar or array), clipped to the path."""
+        x = np.clip(np.asarray(s, dtype=np.float64) / self.step, 0.0, self.n_frames - 1)
+        lo = np.minimum(np.floor(x).astype(np.int64), self.n_frames - 2)
+        w = (x - lo)[..., None]
+        position = self.positions[lo] * (1 - w) + self.positions[lo + 1] * w
+        direction = self.directions[lo] * (1 - w) + self.directions[lo + 1] * w
+        up = self.ups[lo] * (1 - w) + self.ups[lo + 1] * w
+        direction /= np.linalg.norm(direction, axis=-1, keepdims=True)
+        up = up - direction * np.sum(up * direction, axis=-1, keepdims=True)
+        up /= np.linalg.norm(up, axis=-1, keepdims=True)
+        return position, direction, up
+
+def cache_path(centerline_file):
+    return os.path.splitext(centerline_file)[0] + '_camera_path.npz'
@@ -0,0 +1,234 @@
+
+import os
+import glob
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+import vtk
+import pyvista as pv
+import nifti_io
+import surface_extraction
+import smoothing
+import skeleton_centerline
+import stage_cache
+import profiling
+
+STAGES = ('read', 'marching_cubes', 'smoothing', 'decimation', 'network', 'centerline')
+
+def read_segmentation(nifti_file):
+    if not os.path.isfile(nifti_file):
+        raise FileNotFoundError(nifti_file)
+    reader = vtk.vtkNIFTIImageReader()
+    reader.SetFileName(nifti_file)
+    reader.Update()
+    return reader.GetOutput()
+
+def decimate_surface(surface, reduction_factor):
+    decimate = vtk.vtkDecimatePro()
+    decimate.SetInputData(surface)
+    decimate.SetTargetReduction(reduction_factor)
+    decimate.PreserveTopologyOn()
+    decimate.Update()
+    return decimate.GetOutput()
+
+def extract_network(surface):
+    import vmtk.vmtkscripts as vmtk
+    network_filter = vmtk.vmtkNetworkExtraction()
+    network_filter.Surface = surface
+    network_filter.Execute()
+    return network_filter.Network
+
+def network_end_points(network):
+    """The two free ends of the network curves that lie furthest apart, used to seed vmtkCenterlines."""
+    network = pv.wrap(network)
+    lines = network.lines
+    ends, i = [], 0
+    while i < len(lines):
+        n = lines[i]
+        ends.extend([lines[i + 1], lines[i + n]])
+        i += n + 1
+    ids, counts = np.unique(ends, return_counts=True)
+    free = ids[counts == 1] if np.any(counts == 1) else ids
+    if len(free) < 2:
+        raise ValueError("The network has fewer than two end points to seed the centerline")
+    points = network.points[free]
+    a, b = np.unravel_index(np.argmax(squareform(pdist(points))), (len(points), len(points)))
+    return points[a], points[b]
+
+def extract_centerlines(surface, source_point, target_point):
+    """vmtkCenterlines between two seed points, without the interactive seed picker."""
+    import vmtk.vmtkscripts as vmtk
+    centerline_filter = vmtk.vmtkCenterlines()
+    centerline_filter.Surface = surface
+    centerline_filter.SeedSelectorName = 'pointlist'
+    centerline_filter.SourcePoints = [float(v) for v in source_point]
+    centerline_filter.TargetPoints = [float(v) for v in target_point]
+    centerline_filter.Execute()
+    return centerline_filter.Centerlines
+
+def write_polydata(polydata, path):
+    writer = vtk.vtkXMLPolyDataWriter()
+    writer.SetFileName(path)
+    writer.SetInputData(polydata)
+    writer.Write()
+
+def extract_network_and_center_curves(nifti_file, output_network_file, output_centerline_file, reduction_factor=0.5, label_value=1,
+                                      smoothing_iterations=20, relaxation_factor=0.1, backend='vmtk', n_threads=None, use_cache=True,
+                                      timings=None, cache_report=None, verbose=False):
+    """Segmentation -> surface -> network and centerline .vtp files. Returns the wall time of each stage.
+
+    backend='vmtk' meshes, smooths and decimates the surface and runs vmtkNetworkExtraction and vmtkCenterlines on
+    it; backend='skeleton' computes the centerline from the voxels (see skeleton_centerline) and writes no network.
+    Every stage output is checkpointed by stage_cache, so a re-run with e.g. a new reduction_factor starts from the
+    cached smoothed surface. Errors are raised to the caller; stages finished before the error are already in
+    timings and cache_report (a list of stage_cache records) when those are passed in.
+    """
+    timings = {} if timings is None else timings
+    pipeline = stage_cache.StagePipeline(nifti_file, use_cache=use_cache, verbose=verbose)
+    try:
+        if backend == 'skeleton':
+            read = pipeline.source('read', nifti_io.load_nifti_volume)
+            centerlines = pipeline.stage('centerline', {'backend': 'skeleton', 'label_value': label_value}, [read],
+                                         lambda volume: skeleton_centerline.skeleton_centerline(volume[0], volume[1], label_value=label_value))
+            write_polydata(centerlines.value(), output_centerline_file)
+            return timings
+        elif backend != 'vmtk':
+            raise ValueError(f"Unknown centerline backend: {backend}")
+
+        def marching_cubes(image):
+            surface = surface_extraction.extract_surface(image, label_value, n_threads=n_threads)
+            if surface.n_points == 0:
+                raise ValueError(f"No surface at label value {label_value}")
+            return surface
+
+        read = pipeline.source('read', read_segmentation)
+        surface = pipeline.stage('marching_cubes', {'label_value': label_value}, [read], marching_cubes)
+        smoothed = pipeline.stage('smoothing', {'n_iter': smoothing_iterations, 'relaxation_factor': relaxation_factor,
+                                                'ordering': smoothing.DEFAULT_ORDERING}, [surface],
+                                  lambda mesh: smoothing.smooth_mesh(mesh, n_iter=smoothing_iterations, relaxation_factor=relaxation_factor,
+                                                                     boundary_smoothing=True, n_threads=n_threads))
+        decimated = pipeline.stage('decimation', {'reduction_factor': reduction_factor}, [smoothed],
+                                   lambda mesh: decimate_surface(mesh, reduction_factor))
+        network = pipeline.stage('network', {}, [decimated], extract_network)
+        centerlines = pipeline.stage('centerline', {'seeds': 'network_end_points'}, [decimated, network],
+                                     lambda mesh, curves: extract_centerlines(mesh, *network_end_points(curves)))
+
+        write_polydata(network.value(), output_network_file)
+        write_polydata(centerlines.value(), output_centerline_file)
+        return timings
+    finally:
+        timings.update(pipeline.timings())
+        if cache_report is not None:
+            cache_report.extend(pipeline.report())
+        if verbose:
+            stage_cache.print_cache_report(pipeline.report())
+
+def case_name(nifti_file):
+    name = os.path.basename(nifti_file)
+    for ext in ('.nii.gz', '.nii'):
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+def find_cases(inputs):
+    """Segmentation files from directories (every .nii/.nii.gz inside), manifests (one path per line) or plain paths."""
+    cases = []
+    for item in inputs:
+        if os.path.isdir(item):
+            cases.extend(sorted(glob.glob(os.path.join(item, '*.nii')) + glob.glob(os.path.join(item, '*.nii.gz'))))
+        elif item.endswith(('.txt', '.lst', '.csv')):
+            base = os.path.dirname(os.path.abspath(item))
+            with open(item) as f:
+                for line in f:
+                    line = line.split(',')[0].strip()
+                    if line and not line.startswith('#'):
+                        cases.append(line if os.path.isabs(line) else os.path.join(base, line))
+        else:
+            cases.append(item)
+    return cases
+
+def run_case(nifti_file, out_dir, **kwargs):
+    """One batch case in a worker process; failures are returned in the result instead of raised."""
+    case_dir = os.path.join(out_dir, case_name(nifti_file))
+    outputs = {'network': os.path.join(case_dir, 'network.vtp'), 'centerline': os.path.join(case_dir, 'centerline.vtp')}
+    start = time.perf_counter()
+    result = {'case': case_name(nifti_file), 'file': nifti_file, 'status': 'ok', 'error': '', 'timings': {}, 'cache': []}
+    try:
+        os.makedirs(case_dir, exist_ok=True)
+        with profiling.span('centerline_case', case=result['case']):
+            extract_network_and_center_curves(nifti_file, outputs['network'], outputs['centerline'], timings=result['timings'],
+                                              cache_report=result['cache'], **kwargs)
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['traceback'] = traceback.format_exc()
+    result['total'] = time.perf_counter() - start
+    return result
+
+def _crashed(case, error):
+    return {'case': case_name(case), 'file': case, 'status': 'failed', 'error': error, 'timings': {}, 'cache': [], 'total': 0.0}
+
+def _run_pool(cases, out_dir, workers, kwargs, report):
+    """Run cases with at most workers in flight; returns the cases that were running when a worker process died."""
+    pending = list(cases)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while pending or running:
+            while pending and len(running) < workers:
+                case = pending.pop(0)
+                running[executor.submit(run_case, case, out_dir, **kwargs)] = case
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    report(future.result())
+                except BrokenProcessPool:
+                    # The pool is unusable now; every case still running is a suspect, the queued ones are not
+                    suspects = []
+                    for other, case in running.items():
+                        if other.done() and other.exception() is None:
+                            report(other.result())
+                        else:
+                            suspects.append(case)
+                    return suspects, pending
+                del running[future]
+    return [], []
+
+def run_batch(cases, out_dir, workers=1, **kwargs):
+    """Run every case in a process pool, one case per worker, printing each result as it completes.
+
+    A worker process that dies (out of memory, a crash in VTK) breaks the pool. The cases that were running are
+    then retried one at a time in fresh pools, so only the case that kills its worker on its own is reported as
+    failed; the other cases carry on in a new pool.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+    kwargs.setdefault('n_threads', threads)
+    results = []
+
+    def report(result):
+        results.append(result)
+        print(f"{result['case']}: {result['status']} in {result['total']:.1f}s {result['error']}")
+
+    pending = list(cases)
+    while pending:
+        suspects, pending = _run_pool(pending, out_dir, workers, kwargs, report)
+        for case in suspects:
+            if len(suspects) == 1 or _run_pool([case], out_dir, 1, kwargs, report)[0]:
+                report(_crashed(case, "BrokenProcessPool: the worker process died (e.g. out of memory or a crash)"))
+    return sorted(results, key=lambda r: r['case'])
+
+def print_report(results):
+    """Per-case stage timings (* marks a stage loaded from the stage cache), followed by the failures."""
+    print(f"{'case':<30}" + "".join(f"{name:>15}" for name in STAGES) + f"{'total':>10}  status")
+    for result in results:
+        hits = {record['stage'] for record in result['cache'] if record['status'] == 'hit'}
+        row = "".join((f"{result['timings'][name]:>14.2f}" + ('*' if name in hits else ' ')) if name in result['timings'] else f"{'-':>15}"
+                      for name in STAGES)
+        print(f"{result['case']:<30}{row}{result['total']:>10.2f}  {result['status']}")
+    failed = [r for r in results if r['status'] != 'ok']
+    print(f"{len(results) - len(failed)}/{len(results)} cases succeeded")
+    for result in failed:
+        print(f"FAILED {result['file']}: {result['error']}")
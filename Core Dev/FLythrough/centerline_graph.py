@@ -0,0 +1,233 @@
+
+import sys
+import time
+import numpy as np
+import pyvista as pv
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+
+RADIUS_ARRAY = 'MaximumInscribedSphereRadius'
+
+def polylines_from_polydata(polydata, radius_array=RADIUS_ARRAY):
+    """Point coordinates (and radii, when present) of every line cell in a .vtp network or centerline."""
+    polydata = pv.wrap(polydata)
+    points = np.asarray(polydata.points, dtype=np.float64)
+    radius = np.asarray(polydata.point_data[radius_array], dtype=np.float64) if radius_array in polydata.point_data else None
+    lines = np.asarray(polydata.lines)
+    polylines, radii, i = [], [], 0
+    while i < len(lines):
+        ids = lines[i + 1:i + 1 + lines[i]]
+        i += lines[i] + 1
+        if len(ids) < 2:
+            continue
+        polylines.append(points[ids])
+        radii.append(radius[ids] if radius is not None else None)
+    return polylines, (radii if radius is not None else None)
+
+def parallel_transport_frames(tangents):
+    """Rotation-minimising (normal, binormal) frames along a curve given its unit tangents.
+
+    Each normal is the previous one with its tangent component removed, so the frame does not flip at inflection
+    points or become undefined on straight sections as the Frenet frame does.
+    """
+    tangents = np.asarray(tangents, dtype=np.float64)
+    normals = np.empty_like(tangents)
+    axis = np.eye(3)[np.argmin(np.abs(tangents[0]))]
+    normal = axis - tangents[0] * np.dot(axis, tangents[0])
+    for i, tangent in enumerate(tangents):
+        normal = normal - tangent * np.dot(normal, tangent)
+        normal /= np.linalg.norm(normal)
+        normals[i] = normal
+    return normals, np.cross(tangents, normals)
+
+class CenterlineGraph:
+    """Centerline network split into branches between end points and junctions, with arc length and a KD-tree.
+
+    Branch points are stored back to back: points[branch_offsets[b]:branch_offsets[b + 1]] is branch b, arc_length
+    holds the distance along its branch for each point, and branch_nodes gives each branch's (start, end) node.
+    Lines are joined wherever they share points, so both vmtk networks and overlapping vmtkCenterlines output work.
+    """
+
+    def __init__(self, polylines, radii=None, tol=None):
+        all_points = np.concatenate(polylines)
+        all_radii = np.concatenate(radii) if radii is not None else None
+        tol = tol if tol is not None else 1e-6 * max(np.ptp(all_points, axis=0).max(), 1.0)
+
+        # Merge coincident points, then keep each consecutive pair once as an undirected edge
+        grid = np.round(all_points / tol).astype(np.int64)
+        first, inverse = np.unique(grid, axis=0, return_index=True, return_inverse=True)[1:]
+        inverse = inverse.ravel()
+        vertices = all_points[first]
+        same_line = np.ones(len(all_points) - 1, dtype=bool)
+        same_line[np.cumsum([len(line) for line in polylines])[:-1] - 1] = False
+        edges = np.sort(np.stack([inverse[:-1], inverse[1:]], axis=1)[same_line], axis=1)
+        edges = np.unique(edges[edges[:, 0] != edges[:, 1]], axis=0)
+
+        n = len(vertices)
+        adjacency = sp.csr_matrix((np.arange(1, len(edges) + 1).repeat(2), (edges.ravel(), edges[:, ::-1].ravel())), shape=(n, n))
+        degree = np.diff(adjacency.indptr)
+
+        # Walk chains of degree-2 vertices between nodes (ends and junctions); overlapping lines, as vmtkCenterlines
+        # writes one per target, collapse onto shared edges and split where they diverge
+        used = np.zeros(len(edges) + 1, dtype=bool)
+        is_node = degree != 2
+        chains = []
+        # Visit vertices in input order so a single line keeps its original direction
+        order = np.argsort(first)
+        for start in list(order[is_node[order]]) + list(order):
+            for k in range(adjacency.indptr[start], adjacency.indptr[start + 1]):
+                if used[adjacency.data[k]]:
+                    continue
+                chain, current = [start], adjacency.indices[k]
+                used[adjacency.data[k]] = True
+                while not is_node[current] and current != start:
+                    chain.append(current)
+                    unused = [j for j in range(adjacency.indptr[current], adjacency.indptr[current + 1]) if not used[adjacency.data[j]]]
+                    if not unused:
+                        break
+                    used[adjacency.data[unused[0]]] = True
+                    current = adjacency.indices[unused[0]]
+                chain.append(current)
+                chains.append(chain)
+            # A closed loop with no node gets one at its first vertex
+            if not is_node.any():
+                is_node[start] = True
+
+        node_ids = {}
+        branches, branch_radii, branch_nodes = [], [], []
+        for chain in chains:
+            branches.append(vertices[chain])
+            branch_radii.append(all_radii[first[chain]] if all_radii is not None else None)
+            branch_nodes.append((node_ids.setdefault(chain[0], len(node_ids)), node_ids.setdefault(chain[-1], len(node_ids))))
+
+        self.branch_nodes = np.array(branch_nodes, dtype=np.int64).reshape(-1, 2)
+        self.branch_offsets = np.concatenate([[0], np.cumsum([len(branch) for branch in branches])])
+        self.points = np.concatenate(branches)
+        self.branch_id = np.repeat(np.arange(len(branches)), np.diff(self.branch_offsets))
+        self.radius = np.concatenate(branch_radii) if radii is not None else None
+
+        step = np.linalg.norm(np.diff(self.points, axis=0), axis=1)
+        step[self.branch_offsets[1:-1] - 1] = 0.0
+        cumulative = np.concatenate([[0.0], np.cumsum(step)])
+        self.arc_length = cumulative - cumulative[self.branch_offsets[:-1]][self.branch_id]
+        self.branch_length = self.arc_length[self.branch_offsets[1:] - 1]
+
+        self.node_degree = np.bincount(self.branch_nodes.ravel(), minlength=len(node_ids))
+        self.junctions = np.flatnonzero(self.node_degree >= 3)
+        self.end_nodes = np.flatnonzero(self.node_degree == 1)
+        self.tree = cKDTree(self.points)
+
+    @classmethod
+    def from_polydata(cls, polydata, radius_array=RADIUS_ARRAY, tol=None):
+        polylines, radii = polylines_from_polydata(polydata, radius_array)
+        if not polylines:
+            raise ValueError("The polydata has no line cells")
+        return cls(polylines, radii, tol=tol)
+
+    @classmethod
+    def load(cls, path, radius_array=RADIUS_ARRAY, tol=None):
+        return cls.from_polydata(pv.read(path), radius_array, tol=tol)
+
+    @property
+    def n_branches(self):
+        return len(self.branch_nodes)
+
+    def branch_points(self, branch):
+        return self.points[self.branch_offsets[branch]:self.branch_offsets[branch + 1]]
+
+    def nearest(self, query, k=4):
+        """Closest centerline location to each query point, projected onto the line segments.
+
+        Returns (branch, arc_length, position, distance) arrays. The k nearest vertices from the KD-tree supply the
+        candidate segments, so no query scans the whole centerline.
+        """
+        query = np.atleast_2d(np.asarray(query, dtype=np.float64))
+        k = min(k, len(self.points))
+        _, vertex = self.tree.query(query, k=k)
+        vertex = vertex.reshape(len(query), k)
+
+        # Each candidate vertex contributes the segment before and after it, when both ends are on its branch
+        starts = np.concatenate([vertex - 1, vertex], axis=1)
+        starts = np.clip(starts, 0, len(self.points) - 2)
+        valid = self.branch_id[starts] == self.branch_id[starts + 1]
+
+        a, b = self.points[starts], self.points[starts + 1]
+        ab = b - a
+        denom = np.maximum(np.einsum('ijk,ijk->ij', ab, ab), 1e-300)
+        t = np.clip(np.einsum('ijk,ijk->ij', query[:, None] - a, ab) / denom, 0.0, 1.0)
+        projected = a + t[..., None] * ab
+        distance = np.linalg.norm(projected - query[:, None], axis=2)
+        distance[~valid] = np.inf
+
+        best = np.argmin(distance, axis=1)
+        rows = np.arange(len(query))
+        segment = starts[rows, best]
+        t = t[rows, best]
+        arc_length = self.arc_length[segment] + t * (self.arc_length[segment + 1] - self.arc_length[segment])
+        return self.branch_id[segment], arc_length, projected[rows, best], distance[rows, best]
+
+    def arc_length_of(self, query):
+        """(branch, arc_length) of the nearest centerline location to each query point."""
+        branch, arc_length, _, _ = self.nearest(query)
+        return branch, arc_length
+
+    def _interp(self, values, arc_length, branch):
+        arc_length = np.atleast_1d(np.asarray(arc_length, dtype=np.float64))
+        branch = np.broadcast_to(np.asarray(branch, dtype=np.int64), arc_length.shape)
+        values = values.reshape(len(values), -1)
+        out = np.empty((len(arc_length), values.shape[1]))
+        for b in np.unique(branch):
+            rows = branch == b
+            lo, hi = self.branch_offsets[b], self.branch_offsets[b + 1]
+            s = np.clip(arc_length[rows], 0.0, self.branch_length[b])
+            for dim in range(values.shape[1]):
+                out[rows, dim] = np.interp(s, self.arc_length[lo:hi], values[lo:hi, dim])
+        return out
+
+    def position_at(self, arc_length, branch=0):
+        """Point at each arc length along a branch (arc lengths are clipped to the branch)."""
+        return self._interp(self.points, arc_length, branch)
+
+    def radius_at(self, arc_length, branch=0):
+        if self.radius is None:
+            raise ValueError(f"The centerline has no {RADIUS_ARRAY} array")
+        return self._interp(self.radius, arc_length, branch)[:, 0]
+
+    def tangent_at(self, arc_length, branch=0, step=1.0):
+        """Unit tangent at each arc length, by central difference over +-step."""
+        arc_length = np.atleast_1d(np.asarray(arc_length, dtype=np.float64))
+        tangent = self.position_at(arc_length + step, branch) - self.position_at(arc_length - step, branch)
+        return tangent / np.maximum(np.linalg.norm(tangent, axis=1, keepdims=True), 1e-12)
+
+    def to_polydata(self):
+        """The branches as one line cell each, with arc length, branch id and radius as point data."""
+        cells = np.concatenate([np.concatenate([[hi - lo], np.arange(lo, hi)])
+                                for lo, hi in zip(self.branch_offsets[:-1], self.branch_offsets[1:])])
+        polydata = pv.PolyData(self.points.copy())
+        polydata.lines = cells
+        polydata.point_data['ArcLength'] = self.arc_length
+        polydata.point_data['BranchId'] = self.branch_id
+        if self.radius is not None:
+            polydata.point_data[RADIUS_ARRAY] = self.radius
+        return polydata
+
+if __name__ == "__main__":
+    centerline_file = sys.argv[1] if len(sys.argv) > 1 else 'centerline.vtp'
+    graph = CenterlineGraph.load(centerline_file)
+    print(f"{graph.n_branches} branches, {len(graph.junctions)} junctions, {len(graph.end_nodes)} end points, "
+          f"total length {graph.branch_length.sum():.1f}")
+
+    rng = np.random.default_rng(0)
+    query = graph.points[rng.integers(len(graph.points), size=200000)] + rng.normal(scale=10.0, size=(200000, 3))
+
+    start = time.perf_counter()
+    branch, arc_length, position, distance = graph.nearest(query)
+    print(f"Nearest for {len(query)} points: {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    brute = np.array([np.linalg.norm(graph.points - q, axis=1).min() for q in query[:2000]])
+    print(f"Brute-force vertex scan for 2000 points: {time.perf_counter() - start:.3f}s")
+    print(f"Projected distance never exceeds the nearest vertex distance: {bool(np.all(distance[:2000] <= brute + 1e-9))}")
+
+    roundtrip = graph.arc_length_of(graph.position_at(arc_length, branch))[1]
+    print(f"Max arc-length round-trip error: {np.abs(roundtrip - arc_length).max():.2e}")
@@ -0,0 +1,197 @@
+
+import sys
+import time
+import numpy as np
+import pyvista as pv
+from scipy.spatial import cKDTree
+
+def morton_codes(points, bits=10):
+    """30-bit Morton (Z-order) codes of points quantised to a 2**bits grid over their bounding box."""
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    grid = ((points - lo) / np.maximum(hi - lo, 1e-12) * ((1 << bits) - 1)).astype(np.uint64)
+
+    def spread(v):
+        # Insert two zero bits between each of the low 10 bits
+        v = (v | (v << np.uint64(16))) & np.uint64(0x030000FF)
+        v = (v | (v << np.uint64(8))) & np.uint64(0x0300F00F)
+        v = (v | (v << np.uint64(4))) & np.uint64(0x030C30C3)
+        v = (v | (v << np.uint64(2))) & np.uint64(0x09249249)
+        return v
+
+    return (spread(grid[:, 0]) << np.uint64(2)) | (spread(grid[:, 1]) << np.uint64(1)) | spread(grid[:, 2])
+
+class TriangleBVH:
+    """Linear bounding-volume hierarchy over triangles for batched any-hit (occlusion) queries.
+
+    Triangles are sorted by the Morton code of their centroid and grouped into fixed-size leaves; a complete binary
+    tree over the leaves is stored level by level as arrays of box bounds, so both the build and the traversal are
+    whole-array NumPy operations. Traversal is breadth-first over (ray, node) pairs: each level keeps the pairs
+    whose box the ray segment crosses, and the surviving leaves are tested against all their triangles at once.
+    Geometry is kept in float32 by default, which halves the memory traffic of every level.
+    """
+
+    def __init__(self, vertices, faces, leaf_size=8, dtype=np.float32):
+        vertices = np.asarray(vertices, dtype=np.float64)
+        faces = np.asarray(faces, dtype=np.int64)
+        corners = vertices[faces]
+        order = np.argsort(morton_codes(corners.mean(axis=1)), kind='stable')
+
+        n_leaves = 1 << int(np.ceil(np.log2(max(1, -(-len(faces) // leaf_size)))))
+        self.leaf_size = leaf_size
+        self.depth = int(np.log2(n_leaves))
+        self.triangle = np.full(n_leaves * leaf_size, -1, dtype=np.int64)
+        self.triangle[:len(faces)] = order
+
+        # Padded slots repeat the first triangle so every leaf has finite bounds; their -1 id keeps them out of tests
+        sorted_corners = np.empty((n_leaves * leaf_size, 3, 3), dtype=dtype)
+        sorted_corners[:] = corners[order[0]] if len(faces) else 0.0
+        sorted_corners[:len(faces)] = corners[order]
+        self.a = sorted_corners[:, 0]
+        self.e1 = sorted_corners[:, 1] - sorted_corners[:, 0]
+        self.e2 = sorted_corners[:, 2] - sorted_corners[:, 0]
+
+        leaf_corners = sorted_corners.reshape(n_leaves, -1, 3)
+        leaf_lo, leaf_hi = leaf_corners.min(axis=1), leaf_corners.max(axis=1)
+
+        self.lo, self.hi = [leaf_lo], [leaf_hi]
+        while len(self.lo[0]) > 1:
+            self.lo.insert(0, np.minimum(self.lo[0][0::2], self.lo[0][1::2]))
+            self.hi.insert(0, np.maximum(self.hi[0][0::2], self.hi[0][1::2]))
+
+    def _box_hit(self, level, node, origin, inv_dir, t_max):
+        """Slab test of each ray segment (origin + t * dir, 0 <= t <= t_max) against its paired node's box."""
+        lo, hi = self.lo[level][node], self.hi[level][node]
+        t_near = np.zeros(len(node), dtype=lo.dtype)
+        t_far = np.broadcast_to(t_max, len(node)).astype(lo.dtype)
+        for axis in range(3):
+            t0 = (lo[:, axis] - origin[..., axis]) * inv_dir[:, axis]
+            t1 = (hi[:, axis] - origin[..., axis]) * inv_dir[:, axis]
+            np.maximum(t_near, np.minimum(t0, t1), out=t_near)
+            np.minimum(t_far, np.maximum(t0, t1), out=t_far)
+        return t_near <= t_far
+
+    def occluded(self, origins, targets, exclude=None, t_min=1e-6, t_max=1.0 - 1e-3):
+        """For each segment origin -> target, whether some triangle (other than exclude) crosses it strictly inside.
+
+        origins is either one (3,) point shared by all segments, as for a camera, or one origin per target. t_max
+        (scalar or per segment) is where along the segment the search stops, as a fraction of its length.
+        """
+        targets = np.asarray(targets, dtype=self.a.dtype)
+        origins = np.asarray(origins, dtype=self.a.dtype)
+        shared = origins.ndim == 1
+        direction = targets - origins
+        # Nudge zero components so the slab test never computes 0 * inf
+        direction[direction == 0] = 1e-30
+        inv_dir = 1.0 / direction
+        t_max = np.broadcast_to(np.asarray(t_max, dtype=self.a.dtype), len(targets))
+        hit = np.zeros(len(targets), dtype=bool)
+
+        ray = np.arange(len(targets))
+        node = np.zeros(len(targets), dtype=np.int64)
+        for level in range(self.depth + 1):
+            if level > 0:
+                ray = np.repeat(ray, 2)
+                node = (np.repeat(node, 2) << 1) | np.tile(np.array([0, 1]), len(node))
+            keep = self._box_hit(level, node, origins if shared else origins[ray], inv_dir[ray], t_max[ray])
+            ray, node = ray[keep], node[keep]
+
+        # Moller-Trumbore on every (ray, triangle) pair of the surviving leaves
+        slot = (node[:, None] * self.leaf_size + np.arange(self.leaf_size)).ravel()
+        ray = np.repeat(ray, self.leaf_size)
+        valid = self.triangle[slot] >= 0
+        if exclude is not None:
+            valid &= self.triangle[slot] != np.asarray(exclude)[ray]
+        slot, ray = slot[valid], ray[valid]
+
+        d = direction[ray]
+        e1, e2 = self.e1[slot], self.e2[slot]
+        p = np.cross(d, e2)
+        det = np.einsum('ij,ij->i', e1, p)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_det = 1.0 / det
+            s = (origins if shared else origins[ray]) - self.a[slot]
+            u = np.einsum('ij,ij->i', s, p) * inv_det
+            q = np.cross(s, e1)
+            v = np.einsum('ij,ij->i', d, q) * inv_det
+            t = np.einsum('ij,ij->i', e2, q) * inv_det
+            crosses = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > t_min) & (t < t_max[ray])
+        hit[ray[crosses]] = True
+        return hit
+
+def frustum_mask(points, position, direction, up, fov=140, aspect=1.0, near=0.5):
+    """Points inside a perspective frustum with vertical view angle fov (degrees), as VTK's view_angle defines it."""
+    offset = points - position
+    right = np.cross(direction, up)
+    z = offset @ direction
+    y = offset @ up
+    x = offset @ right
+    half = np.tan(np.radians(fov) / 2)
+    return (z > near) & (np.abs(y) <= half * z) & (np.abs(x) <= aspect * half * z)
+
+def surface_coverage(mesh, camera_path, fov=140, aspect=1.0, every=4, max_distance=40.0, batch_rays=50000, verbose=False):
+    """Replay a CameraPath and mark every triangle whose centroid is in view and unoccluded from some frame.
+
+    Returns (seen_triangles, per-vertex seen fraction weighted by triangle area, uncovered area percentage).
+    Only unseen triangles within max_distance of the camera that face it are ray cast, so the cost falls as the
+    flythrough progresses. A wall seen from inside the lumen shows its inner side, so with outward-oriented
+    triangles (the orientation is taken from the sign of the enclosed volume) the camera is on their back side.
+    """
+    mesh = pv.wrap(mesh)
+    if not mesh.is_all_triangles:
+        mesh = mesh.triangulate()
+    vertices = np.asarray(mesh.points, dtype=np.float64)
+    faces = np.asarray(mesh.faces).reshape(-1, 4)[:, 1:]
+
+    start = time.perf_counter()
+    bvh = TriangleBVH(vertices, faces)
+    centroids = vertices[faces].mean(axis=1)
+    normals = np.cross(vertices[faces[:, 1]] - vertices[faces[:, 0]], vertices[faces[:, 2]] - vertices[faces[:, 0]])
+    area = 0.5 * np.linalg.norm(normals, axis=1)
+    orientation = np.sign(np.einsum('ij,ij->', vertices[faces[:, 0]], normals)) or 1.0
+    tree = cKDTree(centroids)
+    build_time = time.perf_counter() - start
+
+    seen = np.zeros(len(faces), dtype=bool)
+    n_rays = 0
+    start = time.perf_counter()
+    for index in range(0, camera_path.n_frames, every):
+        position, direction, up = camera_path.frame(index)
+        nearby = np.asarray(tree.query_ball_point(position, max_distance), dtype=np.int64)
+        candidates = nearby[~seen[nearby]]
+        candidates = candidates[frustum_mask(centroids[candidates], position, direction, up, fov=fov, aspect=aspect)]
+        facing = orientation * np.einsum('ij,ij->i', centroids[candidates] - position, normals[candidates]) > 0
+        candidates = candidates[facing]
+        for lo in range(0, len(candidates), batch_rays):
+            batch = candidates[lo:lo + batch_rays]
+            seen[batch[~bvh.occluded(position, centroids[batch], exclude=batch)]] = True
+            n_rays += len(batch)
+    cast_time = time.perf_counter() - start
+
+    # Per-vertex seen fraction: area of seen incident triangles over total incident area
+    seen_area = np.zeros(len(vertices))
+    total_area = np.zeros(len(vertices))
+    for corner in range(3):
+        np.add.at(seen_area, faces[:, corner], area * seen)
+        np.add.at(total_area, faces[:, corner], area)
+    vertex_seen = np.divide(seen_area, total_area, out=np.zeros_like(seen_area), where=total_area > 0)
+    uncovered = 100.0 * area[~seen].sum() / max(area.sum(), 1e-12)
+
+    if verbose:
+        print(f"{len(faces)} triangles, BVH depth {bvh.depth}, built in {build_time:.2f}s; {n_rays} rays over "
+              f"{len(range(0, camera_path.n_frames, every))} viewpoints in {cast_time:.2f}s ({n_rays / max(cast_time, 1e-9):.0f} rays/s)")
+    return seen, vertex_seen, uncovered
+
+if __name__ == "__main__":
+    import visualize
+    import camera_path
+
+    nifti_file = sys.argv[1] if len(sys.argv) > 1 else 'new seg.nii.gz'
+    centerline_file = sys.argv[2] if len(sys.argv) > 2 else 'centerline.vtp'
+    mesh = visualize.load_nifti_as_surface(nifti_file, 0.5)
+    path = camera_path.CameraPath.from_centerline(centerline_file)
+
+    seen, vertex_seen, uncovered = surface_coverage(mesh, path, verbose=True)
+    print(f"Uncovered surface: {uncovered:.1f}% of the area ({np.count_nonzero(~seen)} of {len(seen)} triangles)")
+    mesh.point_data['seen'] = vertex_seen
+    mesh.save('coverage.vtp')
+    print("Wrote coverage.vtp with the per-vertex 'seen' scalar")
@@ -0,0 +1,143 @@
+
+import time
+from collections import deque
+import numpy as np
+import pyvista as pv
+
+class FlythroughController:
+    """Timer-driven camera flythrough along a precomputed path.
+
+    The camera follows a camera_path.CameraPath, looking along its direction with its parallel-transported up
+    vector. The marker sphere in the overview is created once and moved with SetPosition, and the endoscopic camera is
+    updated in place, so a frame costs two renders and no actor rebuilds. Playback is time-based: each tick moves
+    speed * elapsed seconds along the path (interpolating between path samples), so when a render overruns its
+    budget the next frame lands where it should be instead of the flythrough slowing down. With a
+    mesh_chunks.MeshChunks for the endoscopic view, only the surface chunks near the camera are drawn each frame.
+    """
+
+    def __init__(self, camera_view, overview_view, camera_path, fps=30, speed=20.0, fov=140, marker_radius=4,
+                 marker_color='yellow', step=None, history=240, chunks=None):
+        self.camera_view = camera_view
+        self.overview_view = overview_view
+        self.path = camera_path
+        self.chunks = chunks
+        self.length = camera_path.length
+
+        self.fps = fps
+        self.speed = speed
+        self.direction = 1
+        self.step = step if step is not None else camera_path.step
+        self.position = 0.0
+        self.playing = False
+
+        self.frame_times = deque(maxlen=history)
+        self.visible_triangles = deque(maxlen=history)
+        self.tick_intervals = deque(maxlen=history)
+        self.dropped_frames = 0
+        self._last_tick = None
+        self._timer = None
+
+        self.marker = overview_view.add_mesh(pv.Sphere(center=(0.0, 0.0, 0.0), radius=marker_radius), pickable=False, color=marker_color)
+        self.camera_view.camera.view_angle = fov
+        self.show()
+
+    def show(self):
+        """Move the camera and marker to the current position and render both views."""
+        start = time.perf_counter()
+        position, direction, up = self.path.at(self.position)
+
+        camera = self.camera_view.camera
+        camera.SetPosition(*position)
+        camera.SetFocalPoint(*(position + direction * self.step))
+        camera.SetViewUp(*up)
+        if self.chunks is not None:
+            self.visible_triangles.append(self.chunks.update(self.position))
+        self.camera_view.renderer.ResetCameraClippingRange()
+        self.marker.SetPosition(*position)
+
+        self.camera_view.render()
+        self.overview_view.render()
+        self.frame_times.append(time.perf_counter() - start)
+
+    def seek(self, s):
+        self.position = float(np.clip(s, 0.0, self.length))
+        self.show()
+
+    def step_forward(self):
+        self.seek(self.position + self.step)
+
+    def step_backward(self):
+        self.seek(self.position - self.step)
+
+    def tick(self, now=None):
+        """Advance by the wall time since the previous tick and redraw; called by the timer."""
+        now = time.perf_counter() if now is None else now
+        if self._last_tick is not None:
+            elapsed = now - self._last_tick
+            self.tick_intervals.append(elapsed)
+            budget = 1.0 / self.fps
+            if elapsed > 1.5 * budget:
+                self.dropped_frames += int(elapsed / budget) - 1
+            self.position = float(np.clip(self.position + self.direction * self.speed * elapsed, 0.0, self.length))
+        self._last_tick = now
+        self.show()
+        if self.playing and self.position == (self.length if self.direction > 0 else 0.0):
+            self.pause()
+
+    def play(self, direction=None):
+        from PyQt5.QtCore import QTimer
+        if direction is not None:
+            self.direction = direction
+        if self._timer is None:
+            self._timer = QTimer()
+            self._timer.timeout.connect(self.tick)
+        self._timer.setInterval(int(round(1000.0 / self.fps)))
+        self._last_tick = None
+        self.playing = True
+        self._timer.start()
+
+    def pause(self):
+        if self._timer is not None:
+            self._timer.stop()
+        self.playing = False
+        self._last_tick = None
+
+    def toggle(self):
+        if self.playing:
+            self.pause()
+        else:
+            self.play()
+
+    def reverse(self):
+        self.direction = -self.direction
+
+    def faster(self, factor=1.25):
+        self.speed *= factor
+
+    def slower(self, factor=1.25):
+        self.speed /= factor
+
+    def frame_stats(self):
+        """Render time and achieved frame rate over the recent frames."""
+        frame_times = np.array(self.frame_times) if self.frame_times else np.zeros(1)
+        intervals = np.array(self.tick_intervals) if self.tick_intervals else None
+        return {
+            'frames': len(self.frame_times),
+            'render_ms_mean': 1000.0 * frame_times.mean(),
+            'render_ms_p95': 1000.0 * np.percentile(frame_times, 95),
+            'achieved_fps': 1.0 / intervals.mean() if intervals is not None else 0.0,
+            'target_fps': self.fps,
+            'dropped_frames': self.dropped_frames,
+            'visible_triangles_mean': float(np.mean(self.visible_triangles)) if self.visible_triangles else None,
+        }
+
+    def bind_keys(self, plotter):
+        """c/v step forward/back, space plays or pauses, x reverses, +/- change the speed, k prints frame stats."""
+        plotter.add_key_event('c', self.step_forward)
+        plotter.add_key_event('v', self.step_backward)
+        plotter.add_key_event('space', self.toggle)
+        plotter.add_key_event('x', self.reverse)
+        plotter.add_key_event('plus', self.faster)
+        plotter.add_key_event('equal', self.faster)
+        plotter.add_key_event('minus', self.slower)
+        plotter.add_key_event('k', lambda: print(self.frame_stats()))
@@ -0,0 +1,100 @@
+
+import numpy as np
+import pyvista as pv
+import vtk
+import mesh_cache
+
+# Fraction of triangles removed at each level; level 0 is the full-resolution mesh
+LOD_REDUCTIONS = (0.0, 0.5, 0.8, 0.93, 0.98)
+
+def decimate(mesh, reduction):
+    decimate = vtk.vtkDecimatePro()
+    decimate.SetInputData(mesh)
+    decimate.SetTargetReduction(reduction)
+    decimate.PreserveTopologyOn()
+    decimate.Update()
+    return pv.wrap(decimate.GetOutput())
+
+def geometric_error(full, level, n_samples=20000, percentile=99.0, seed=0):
+    """Distance from full-resolution vertices to the decimated surface, in world units.
+
+    A high percentile over a random vertex sample is used instead of the maximum, because decimation drops tiny
+    disconnected fragments whose distance would otherwise dominate.
+    """
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(full.n_points, min(n_samples, full.n_points), replace=False)
+
+    distance = vtk.vtkDistancePolyDataFilter()
+    distance.SetInputData(0, pv.PolyData(np.asarray(full.points)[sample]))
+    distance.SetInputData(1, level)
+    distance.SignedDistanceOff()
+    distance.ComputeSecondDistanceOff()
+    distance.Update()
+    return float(np.percentile(pv.wrap(distance.GetOutput())['Distance'], percentile))
+
+def cached_pyramid(nifti_file, params, load_full, reductions=LOD_REDUCTIONS):
+    """List of meshes, one per reduction, each carrying its 'GeometricError' in field data and cached on disk."""
+    full = []
+
+    def _full():
+        if not full:
+            full.append(load_full())
+        return full[0]
+
+    levels = []
+    for reduction in reductions:
+        def build(reduction=reduction):
+            base = _full()
+            if base is None:
+                return None
+            if reduction == 0:
+                level = base.copy()
+                level.field_data['GeometricError'] = [0.0]
+            else:
+                level = decimate(base, reduction)
+                level.field_data['GeometricError'] = [geometric_error(base, level)]
+            return level
+
+        level = mesh_cache.cached_surface(nifti_file, {**params, 'lod_reduction': reduction}, build)
+        if level is None:
+            return None
+        levels.append(level)
+    return levels
+
+class LODActor:
+    """A single actor whose mesh is swapped before each render for the coarsest level within a screen-space error budget."""
+
+    def __init__(self, plotter, levels, pixel_tolerance=1.0, **mesh_kwargs):
+        self.plotter = plotter
+        self.levels = levels
+        self.errors = np.array([float(level.field_data['GeometricError'][0]) for level in levels])
+        self.pixel_tolerance = pixel_tolerance
+        self.current = 0
+        self.actor = plotter.add_mesh(levels[0], **mesh_kwargs)
+
+        bounds = np.array(levels[0].bounds).reshape(3, 2)
+        self.center = bounds.mean(axis=1)
+        self.radius = 0.5 * np.linalg.norm(bounds[:, 1] - bounds[:, 0])
+
+        plotter.renderer.AddObserver('StartEvent', self._on_render)
+
+    def screen_space_errors(self):
+        """Projected geometric error of every level, in pixels, for the renderer's current camera."""
+        camera = self.plotter.renderer.GetActiveCamera()
+        height = max(self.plotter.renderer.GetSize()[1], 1)
+        if camera.GetParallelProjection():
+            return self.errors * height / (2.0 * camera.GetParallelScale())
+
+        distance = np.linalg.norm(np.array(camera.GetPosition()) - self.center) - self.radius
+        distance = max(distance, 1e-6)
+        return self.errors * height / (2.0 * distance * np.tan(np.radians(camera.GetViewAngle()) / 2.0))
+
+    def select_level(self):
+        within = np.flatnonzero(self.screen_space_errors() <= self.pixel_tolerance)
+        return int(within[-1]) if len(within) else 0
+
+    def _on_render(self, *args):
+        level = self.select_level()
+        if level != self.current:
+            self.current = level
+            self.actor.GetMapper().SetInputData(self.levels[level])
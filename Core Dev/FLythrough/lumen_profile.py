@@ -0,0 +1,148 @@
+
+import os
+import sys
+import time
+import numpy as np
+from scipy import ndimage
+import nifti_io
+import centerline_graph
+from skeleton_centerline import label_mask
+
+def edt_radius(data, spacing, points, label_value=1):
+    """Distance from each point to the lumen wall, sampled from the label's Euclidean distance transform."""
+    spacing = np.asarray(spacing, dtype=np.float64)
+    mask, offset = label_mask(data, label_value)
+    if mask is None:
+        return np.zeros(len(points))
+    distance = ndimage.distance_transform_edt(mask, sampling=spacing).astype(np.float32)
+    del mask
+    voxel = (np.asarray(points) / spacing - offset).T
+    # Half a voxel less, as in skeleton_centerline, so the radius reaches the iso-surface rather than the outside voxel
+    return np.maximum(ndimage.map_coordinates(distance, voxel, order=1, mode='constant') - 0.5 * spacing.min(), 0.0)
+
+def ray_march_sections(data, spacing, points, normals, binormals, label_value=1, n_rays=64, max_radius=40.0, step=None,
+                       chunk_points=128):
+    """Radius of the lumen along n_rays directions in each cross-sectional plane, shape (n_points, n_rays).
+
+    Every ray of a chunk of points is marched at once: all sample positions are built as one array, looked up in
+    the label volume (nearest voxel; outside the volume counts as outside the lumen) and the first sample that
+    leaves the lumen gives the radius. Rays that never leave within max_radius report max_radius.
+    """
+    spacing = np.asarray(spacing, dtype=np.float64)
+    step = step or 0.5 * spacing.min()
+    radii = np.arange(1, int(np.ceil(max_radius / step)) + 1) * step
+    angles = np.linspace(0.0, 2 * np.pi, n_rays, endpoint=False)
+    shape = np.array(data.shape[:3])
+    out = np.empty((len(points), n_rays))
+
+    for start in range(0, len(points), chunk_points):
+        stop = min(start + chunk_points, len(points))
+        # (points, rays, 3) directions in each point's cross-sectional plane
+        directions = (np.cos(angles)[None, :, None] * normals[start:stop, None, :] +
+                      np.sin(angles)[None, :, None] * binormals[start:stop, None, :])
+        samples = points[start:stop, None, None, :] + radii[None, None, :, None] * directions[:, :, None, :]
+        voxel = np.rint(samples / spacing).astype(np.int64)
+        inside_volume = np.all((voxel >= 0) & (voxel < shape), axis=-1)
+        voxel = np.where(inside_volume[..., None], voxel, 0)
+        inside = inside_volume & (data[voxel[..., 0], voxel[..., 1], voxel[..., 2]] >= label_value)
+
+        leaves = ~inside
+        first_out = np.where(leaves.any(axis=-1), np.argmax(leaves, axis=-1), len(radii))
+        # The wall lies between the last inside sample and the first outside one
+        out[start:stop] = np.where(first_out < len(radii), (first_out + 0.5) * step, max_radius)
+    return out
+
+def section_metrics(ray_radii):
+    """Area, equivalent and extreme diameters, and ellipse eccentricity of each star-shaped cross-section."""
+    n_rays = ray_radii.shape[1]
+    angles = np.linspace(0.0, 2 * np.pi, n_rays, endpoint=False)
+    area = 0.5 * np.sin(2 * np.pi / n_rays) * np.sum(ray_radii * np.roll(ray_radii, -1, axis=1), axis=1)
+
+    x, y = ray_radii * np.cos(angles), ray_radii * np.sin(angles)
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+    sxx, syy, sxy = (x * x).mean(axis=1), (y * y).mean(axis=1), (x * y).mean(axis=1)
+    # Eigenvalues of the 2x2 second-moment matrix, largest first
+    half_trace = 0.5 * (sxx + syy)
+    root = np.sqrt(np.maximum(half_trace ** 2 - (sxx * syy - sxy ** 2), 0.0))
+    major, minor = half_trace + root, half_trace - root
+    eccentricity = np.sqrt(np.clip(1.0 - minor / np.maximum(major, 1e-12), 0.0, 1.0))
+
+    diameters = ray_radii[:, :n_rays // 2] + ray_radii[:, n_rays // 2:n_rays // 2 * 2]
+    return {
+        'area': area,
+        'equivalent_diameter': 2.0 * np.sqrt(area / np.pi),
+        'min_diameter': diameters.min(axis=1),
+        'max_diameter': diameters.max(axis=1),
+        'eccentricity': eccentricity,
+    }
+
+def lumen_profile(data, spacing, graph, label_value=1, n_rays=64, max_radius=40.0, narrowing_window=31, verbose=False):
+    """Radius, area, eccentricity and narrowing at every point of a CenterlineGraph, for all branches in one pass.
+
+    narrowing is 1 - area / (running median area over narrowing_window points), so a value of 0.5 means the lumen
+    is at half its local typical cross-section.
+    """
+    start = time.perf_counter()
+    tangents = np.empty_like(graph.points)
+    normals = np.empty_like(graph.points)
+    binormals = np.empty_like(graph.points)
+    for branch in range(graph.n_branches):
+        rows = slice(graph.branch_offsets[branch], graph.branch_offsets[branch + 1])
+        tangents[rows] = graph.tangent_at(graph.arc_length[rows], branch)
+        normals[rows], binormals[rows] = centerline_graph.parallel_transport_frames(tangents[rows])
+
+    profile = {
+        'points': graph.points,
+        'branch': graph.branch_id,
+        'arc_length': graph.arc_length,
+        'tangent': tangents,
+        'normal': normals,
+        'binormal': binormals,
+        'edt_radius': edt_radius(data, spacing, graph.points, label_value),
+    }
+    edt_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ray_radii = ray_march_sections(data, spacing, graph.points, normals, binormals, label_value=label_value,
+                                   n_rays=n_rays, max_radius=max_radius)
+    profile['ray_radii'] = ray_radii
+    profile.update(section_metrics(ray_radii))
+    profile['open_rays'] = np.count_nonzero(ray_radii >= max_radius, axis=1)
+
+    narrowing = np.zeros(len(graph.points))
+    for branch in range(graph.n_branches):
+        rows = slice(graph.branch_offsets[branch], graph.branch_offsets[branch + 1])
+        typical = ndimage.median_filter(profile['area'][rows], size=narrowing_window, mode='nearest')
+        narrowing[rows] = 1.0 - profile['area'][rows] / np.maximum(typical, 1e-12)
+    profile['narrowing'] = narrowing
+
+    if verbose:
+        print(f"Frames and distance transform: {edt_time:.2f}s; {len(graph.points)} sections x {n_rays} rays: {time.perf_counter() - start:.2f}s")
+    return profile
+
+def profile_path(centerline_file):
+    """centerline.vtp -> centerline_profile.npz in the same directory."""
+    return os.path.splitext(centerline_file)[0] + '_profile.npz'
+
+def save_profile(profile, path):
+    np.savez(path, **profile)
+
+def load_profile(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+if __name__ == "__main__":
+    nifti_file = sys.argv[1] if len(sys.argv) > 1 else 'new seg.nii.gz'
+    centerline_file = sys.argv[2] if len(sys.argv) > 2 else 'centerline.vtp'
+
+    data, spacing, _ = nifti_io.load_nifti_volume(nifti_file)
+    graph = centerline_graph.CenterlineGraph.load(centerline_file)
+    profile = lumen_profile(data, spacing, graph, verbose=True)
+    save_profile(profile, profile_path(centerline_file))
+
+    narrowest = int(np.argmin(profile['equivalent_diameter']))
+    print(f"Length {graph.branch_length.sum():.1f} mm, median diameter {np.median(profile['equivalent_diameter']):.1f} mm")
+    print(f"Narrowest section: {profile['equivalent_diameter'][narrowest]:.1f} mm at {profile['arc_length'][narrowest]:.1f} mm "
+          f"along branch {profile['branch'][narrowest]}")
+    print(f"Wrote {profile_path(centerline_file)}")
@@ -0,0 +1,74 @@
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import pyvista as pv
+import nifti_io
+
+# Bump when the stored layout changes so stale entries are ignored
+CACHE_VERSION = 3
+
+def cache_dir_for(nifti_file):
+    """Cache directory: $MESH_CACHE_DIR if set, otherwise .mesh_cache next to the NIfTI file."""
+    return os.environ.get('MESH_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(nifti_file)), '.mesh_cache')
+
+def cache_key(nifti_file, params):
+    """Key from the file content hash plus every parameter that affects the mesh."""
+    payload = json.dumps({'file': nifti_io.file_digest(nifti_file), 'version': CACHE_VERSION, **params}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def mesh_to_arrays(mesh):
+    """Split a triangle mesh into float32 points, int32 (n, 3) faces, its point normals and its field data."""
+    arrays = {
+        'points': np.asarray(mesh.points, dtype=np.float32),
+        'faces': np.asarray(mesh.faces, dtype=np.int32).reshape(-1, 4)[:, 1:],
+    }
+    normals = mesh.GetPointData().GetNormals()
+    if normals is not None:
+        arrays['normals'] = np.asarray(pv.convert_array(normals), dtype=np.float32)
+    for name in mesh.field_data.keys():
+        arrays[f'field_{name}'] = np.asarray(mesh.field_data[name])
+    return arrays
+
+def arrays_to_mesh(points, faces, normals=None, field_data=None):
+    """Build a PolyData from (n, 3) triangle indices without a Python loop."""
+    faces = np.asarray(faces, dtype=np.int64)
+    cells = np.hstack([np.full((len(faces), 1), 3, dtype=np.int64), faces]).ravel()
+    mesh = pv.PolyData(np.asarray(points), cells)
+    if normals is not None:
+        mesh.point_data['Normals'] = normals
+        mesh.GetPointData().SetActiveNormals('Normals')
+    for name, values in (field_data or {}).items():
+        mesh.field_data[name] = values
+    return mesh
+
+def save_mesh(path, mesh):
+    """Write a mesh atomically as an uncompressed .npz."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **mesh_to_arrays(mesh))
+    os.replace(tmp_path, path)
+
+def load_mesh(path):
+    with np.load(path) as data:
+        normals = data['normals'] if 'normals' in data.files else None
+        field_data = {key[len('field_'):]: data[key] for key in data.files if key.startswith('field_')}
+        return arrays_to_mesh(data['points'], data['faces'], normals, field_data)
+
+def cached_surface(nifti_file, params, build):
+    """Return the mesh for (file content, params) from disk, calling build() and storing its result on a miss."""
+    path = os.path.join(cache_dir_for(nifti_file), cache_key(nifti_file, params) + '.npz')
+    if os.path.exists(path):
+        try:
+            return load_mesh(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: ignoring unreadable mesh cache entry {path}: {e}")
+
+    mesh = build()
+    if mesh is not None:
+        save_mesh(path, mesh)
+    return mesh
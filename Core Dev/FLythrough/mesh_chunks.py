@@ -0,0 +1,70 @@
+
+import numpy as np
+import pyvista as pv
+from scipy.spatial import cKDTree
+import mesh_cache
+
+class MeshChunks:
+    """Colon surface split into pieces along the camera path, shown only near the camera and inside its frustum.
+
+    Each triangle goes to the arc-length bin of its nearest path sample, so a chunk is a short stretch of lumen
+    wall. update() hides every chunk outside [s - behind, s + ahead] or whose bounding sphere is outside the view
+    frustum, so the endoluminal frame cost follows the local geometry instead of the size of the whole colon.
+    """
+
+    def __init__(self, mesh, camera_path, chunk_length=20.0, behind=20.0, ahead=120.0):
+        mesh = pv.wrap(mesh)
+        if not mesh.is_all_triangles:
+            mesh = mesh.triangulate()
+        points = np.asarray(mesh.points)
+        faces = np.asarray(mesh.faces).reshape(-1, 4)[:, 1:]
+        normals = mesh.point_data['Normals'] if 'Normals' in mesh.point_data else None
+
+        _, nearest = cKDTree(camera_path.positions).query(points[faces].mean(axis=1))
+        chunk_of = (nearest * camera_path.step // chunk_length).astype(np.int64)
+
+        self.chunk_length = chunk_length
+        self.behind = behind
+        self.ahead = ahead
+        self.meshes = []
+        self.start = []
+        order = np.argsort(chunk_of, kind='stable')
+        bounds = np.flatnonzero(np.diff(chunk_of[order])) + 1
+        for group in np.split(order, bounds):
+            used, local = np.unique(faces[group], return_inverse=True)
+            piece = mesh_cache.arrays_to_mesh(points[used], local.reshape(-1, 3),
+                                              normals[used] if normals is not None else None)
+            self.meshes.append(piece)
+            self.start.append(chunk_of[group[0]] * chunk_length)
+        self.start = np.array(self.start)
+        self.centers = np.array([piece.center for piece in self.meshes])
+        self.radii = np.array([0.5 * piece.length for piece in self.meshes])
+        self.n_triangles = np.array([piece.n_cells for piece in self.meshes])
+        self.actors = []
+        self.visible = np.ones(len(self.meshes), dtype=bool)
+
+    def add_to(self, plotter, **mesh_kwargs):
+        """Add one actor per chunk with the given add_mesh styling."""
+        self.plotter = plotter
+        self.actors = [plotter.add_mesh(piece, **mesh_kwargs) for piece in self.meshes]
+        return self.actors
+
+    def frustum_mask(self, camera, aspect):
+        """Chunks whose bounding sphere is at least partly inside the camera's view frustum."""
+        planes = np.zeros(24)
+        camera.GetFrustumPlanes(aspect, planes)
+        # Left, right, bottom and top planes only: near and far follow the clipping range, which is reset from
+        # the visible chunks afterwards. Normals point into the frustum; a sphere fully behind one plane is outside
+        planes = planes.reshape(6, 4)[:4]
+        distance = self.centers @ planes[:, :3].T + planes[:, 3]
+        return np.all(distance >= -self.radii[:, None] * np.linalg.norm(planes[:, :3], axis=1), axis=1)
+
+    def update(self, s):
+        """Show the chunks around arc length s that the plotter's camera can see; returns the visible triangle count."""
+        window = (self.start + self.chunk_length >= s - self.behind) & (self.start <= s + self.ahead)
+        aspect = self.plotter.renderer.GetTiledAspectRatio()
+        visible = window & self.frustum_mask(self.plotter.camera, aspect)
+        for i in np.flatnonzero(visible != self.visible):
+            self.actors[i].SetVisibility(bool(visible[i]))
+        self.visible = visible
+        return int(self.n_triangles[visible].sum())
@@ -0,0 +1,151 @@
+
+import os
+import gzip
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import nibabel as nib
+import pyvista as pv
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk
+import profiling
+
+# Most recently read images, so the GUI's repeated reads of one file share a vtkImageData without pinning every
+# volume a long-lived process has ever read
+IMAGE_CACHE_SIZE = 2
+
+_digests = {}
+_images = OrderedDict()
+
+def file_digest(path, chunk_size=1 << 20):
+    """Content hash of a file, memoised per process on (path, size, mtime)."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _digests:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha1.update(chunk)
+        _digests[key] = sha1.hexdigest()
+    return _digests[key]
+
+def read_nifti_image(nifti_file, use_cache=True):
+    """vtkImageData of a NIfTI file, shared with other callers while it is one of the IMAGE_CACHE_SIZE latest read.
+
+    Pass use_cache=False for one-off reads (e.g. in pipeline workers) so the volume is freed once the caller drops it.
+    """
+    if not use_cache:
+        reader = vtk.vtkNIFTIImageReader()
+        reader.SetFileName(nifti_file)
+        reader.Update()
+        return reader.GetOutput()
+    digest = file_digest(nifti_file)
+    if digest in _images:
+        _images.move_to_end(digest)
+    else:
+        _images[digest] = read_nifti_image(nifti_file, use_cache=False)
+        while len(_images) > IMAGE_CACHE_SIZE:
+            _images.popitem(last=False)
+    return _images[digest]
+
+def clear_images():
+    _images.clear()
+
+def _has_scaling(img):
+    slope, inter = img.dataobj.slope, img.dataobj.inter
+    return not ((np.isnan(slope) or slope == 1) and (np.isnan(inter) or inter == 0))
+
+def _read_gzip_into(nifti_file, offset, out, chunk_bytes):
+    """Stream-decompress the voxel block straight into out's buffer, chunk_bytes at a time."""
+    buffer = memoryview(out.reshape(-1, order='F')).cast('B')
+    with gzip.open(nifti_file, 'rb') as f:
+        f.seek(offset)
+        position = 0
+        while position < len(buffer):
+            n = f.readinto(buffer[position:position + chunk_bytes])
+            if n == 0:
+                raise IOError(f"Unexpected end of file in {nifti_file}")
+            position += n
+
+@profiling.span('load_nifti_volume')
+def load_nifti_volume(nifti_file, chunk_bytes=8 << 20):
+    """Voxel array in its on-disk dtype, plus voxel spacing and origin.
+
+    Uncompressed files are memory-mapped and .nii.gz files are decompressed in chunks into one preallocated array,
+    so a uint8 label map costs one byte per voxel instead of get_fdata()'s eight. The array is Fortran-ordered
+    (i fastest) like the file. Only files with intensity scaling fall back to float32. As with
+    vtkNIFTIImageReader, the direction part of the affine is not applied.
+    """
+    img = nib.load(nifti_file)
+    spacing = tuple(float(z) for z in img.header.get_zooms()[:3])
+    origin = tuple(float(v) for v in img.affine[:3, 3])
+
+    if _has_scaling(img):
+        return img.get_fdata(dtype=np.float32), spacing, origin
+
+    if not nifti_file.endswith('.gz'):
+        return img.dataobj.get_unscaled(), spacing, origin
+
+    dtype = img.get_data_dtype()
+    data = np.empty(img.shape, dtype=dtype, order='F')
+    _read_gzip_into(nifti_file, img.dataobj.offset, data, chunk_bytes)
+    if not dtype.isnative:
+        data = data.astype(dtype.newbyteorder('='), order='F')
+    return data, spacing, origin
+
+def volume_to_grid(data, spacing, origin, name='labels'):
+    """Wrap a Fortran-ordered voxel array as a PyVista image without copying or changing its dtype."""
+    grid_class = getattr(pv, 'ImageData', None) or pv.UniformGrid
+    grid = grid_class(dimensions=data.shape[:3], spacing=spacing, origin=origin)
+    grid.point_data[name] = np.asarray(data).reshape(-1, order='F')
+    return grid
+
+def iter_nifti_slabs(nifti_file, slab_slices=64, overlap=1, chunk_bytes=8 << 20):
+    """Yield (k0, slab) with slab a Fortran-ordered (nx, ny, n) block of raw voxels starting at slice k0.
+
+    Consecutive slabs share `overlap` slices. Only one slab is held in memory at a time: uncompressed files are
+    sliced from a memory map and .nii.gz files are decompressed sequentially, slice by slice.
+    """
+    img = nib.load(nifti_file)
+    nx, ny, nz = img.shape[:3]
+    dtype = img.get_data_dtype()
+    step = max(slab_slices - overlap, 1)
+
+    if not nifti_file.endswith('.gz'):
+        data = img.dataobj.get_unscaled()
+        for k0 in range(0, max(nz - overlap, 1), step):
+            yield k0, np.asarray(data[:, :, k0:k0 + slab_slices], dtype=dtype.newbyteorder('='), order='F')
+        return
+
+    slice_bytes = nx * ny * dtype.itemsize
+    with gzip.open(nifti_file, 'rb') as f:
+        f.seek(img.dataobj.offset)
+        carried = np.empty((nx, ny, 0), dtype=dtype, order='F')
+        for k0 in range(0, max(nz - overlap, 1), step):
+            n_new = min(slab_slices, nz - k0) - carried.shape[2]
+            fresh = np.empty((nx, ny, n_new), dtype=dtype, order='F')
+            buffer = memoryview(fresh.reshape(-1, order='F')).cast('B')
+            position = 0
+            while position < len(buffer):
+                n = f.readinto(buffer[position:position + max(chunk_bytes // slice_bytes, 1) * slice_bytes])
+                if n == 0:
+                    raise IOError(f"Unexpected end of file in {nifti_file}")
+                position += n
+            slab = np.concatenate([carried, fresh], axis=2)
+            if not dtype.isnative:
+                slab = slab.astype(dtype.newbyteorder('='), order='F')
+            yield k0, np.asfortranarray(slab)
+            carried = np.asfortranarray(fresh[:, :, fresh.shape[2] - overlap:]) if overlap else carried
+
+def array_to_image(data, spacing, origin=(0.0, 0.0, 0.0), k0=0):
+    """vtkImageData sharing memory with a Fortran-ordered (nx, ny, nz) block that starts at slice k0."""
+    nx, ny, nz = data.shape
+    flat = np.asarray(data).reshape(-1, order='F')
+    image = vtk.vtkImageData()
+    image.SetExtent(0, nx - 1, 0, ny - 1, k0, k0 + nz - 1)
+    image.SetSpacing(*spacing)
+    image.SetOrigin(*origin)
+    scalars = numpy_to_vtk(flat, deep=False)
+    scalars._numpy_reference = flat
+    image.GetPointData().SetScalars(scalars)
+    return image
@@ -0,0 +1,159 @@
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import numpy as np
+import pyvista as pv
+import phantom
+import segmentation
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perf_baselines.json')
+# Names the machine baselines are stored under, e.g. a CI runner pool; overrides the CPU-derived default
+MACHINE_ENV = 'COLON_PERF_MACHINE'
+STAGES = ('dicom_load', 'unet_inference', 'meshing', 'smoothing', 'centerline', 'camera_path')
+
+# Phantom sizes timed by default; 'medium' is about a tenth of a clinical CT colonography volume
+CASES = {
+    'small': dict(shape=(128, 128, 96), spacing=(1.8, 1.8, 2.4), radius=10.0),
+    'medium': dict(shape=(256, 256, 192), spacing=(0.9, 0.9, 1.2), radius=12.0),
+}
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+def machine_info():
+    return {'node': platform.node(), 'cpu': cpu_model(), 'cpus': os.cpu_count(), 'platform': platform.platform()}
+
+def machine_key(info, name=None):
+    """Baselines are only comparable on the same CPUs, so they are keyed by CPU model and count rather than host
+    name, which changes on every ephemeral CI runner. name (or COLON_PERF_MACHINE) labels a machine explicitly.
+    """
+    return name or os.environ.get(MACHINE_ENV) or f"{info['cpu']}/{info['cpus']}cpu"
+
+def best_time(function, repeats):
+    """Fastest of repeats calls of function, and its last result."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def time_case(paths, repeats=3, model_file=None, centerline_backend='skeleton'):
+    """Best-of-repeats seconds of each stage on one phantom; stages that cannot run here are None."""
+    import nifti_io
+    import surface_extraction
+    import smoothing
+    import centerline
+    import camera_path
+
+    seconds = dict.fromkeys(STAGES)
+    if paths['dicom'] is not None:
+        seconds['dicom_load'], (hu, _) = best_time(lambda: phantom.read_dicom_series(paths['dicom']), repeats)
+        if model_file:
+            try:
+                model = segmentation.load_unet(model_file)
+                seconds['unet_inference'], _ = best_time(lambda: segmentation.unet_inference(model, hu), repeats)
+            except ImportError:
+                print("TensorFlow is not installed; skipping U-Net inference")
+
+    image = nifti_io.read_nifti_image(paths['labels'])
+    seconds['meshing'], surface = best_time(lambda: surface_extraction.extract_surface(image, 0.5), repeats)
+    seconds['smoothing'], _ = best_time(lambda: smoothing.smooth_mesh(surface, n_iter=50, relaxation_factor=0.5), repeats)
+
+    with tempfile.TemporaryDirectory(prefix='perf_') as tmp:
+        network_file, centerline_file = os.path.join(tmp, 'network.vtp'), os.path.join(tmp, 'centerline.vtp')
+        seconds['centerline'], _ = best_time(lambda: centerline.extract_network_and_center_curves(
+            paths['labels'], network_file, centerline_file, backend=centerline_backend, use_cache=False), repeats)
+        points = pv.read(centerline_file).points
+    seconds['camera_path'], _ = best_time(lambda: camera_path.CameraPath.build(points), repeats)
+    return seconds
+
+def compare(results, baselines, threshold=0.25, min_seconds=0.05):
+    """Rows of (case, stage, seconds, baseline, ratio, status); a stage regresses when it is more than threshold
+    slower than its baseline and also at least min_seconds slower, so timer noise on tiny stages is ignored.
+
+    baselines are this machine's entry from load_baselines; absolute seconds from another machine say nothing.
+    """
+    rows = []
+    for case, stages in results.items():
+        for stage in STAGES:
+            seconds = stages.get(stage)
+            baseline = (baselines or {}).get('cases', {}).get(case, {}).get(stage)
+            if seconds is None:
+                rows.append((case, stage, None, baseline, None, 'skipped'))
+            elif baseline is None:
+                rows.append((case, stage, seconds, None, None, 'new'))
+            else:
+                ratio = seconds / baseline
+                regressed = ratio > 1.0 + threshold and seconds - baseline > min_seconds
+                rows.append((case, stage, seconds, baseline, ratio, 'REGRESSION' if regressed else 'ok'))
+    return rows
+
+def print_rows(rows):
+    fmt = lambda v, spec: format(v, spec) if v is not None else '-'
+    print(f"{'case':<8} {'stage':<16} {'seconds':>9} {'baseline':>9} {'ratio':>7}  status")
+    for case, stage, seconds, baseline, ratio, status in rows:
+        print(f"{case:<8} {stage:<16} {fmt(seconds, '9.3f'):>9} {fmt(baseline, '9.3f'):>9} {fmt(ratio, '7.2f'):>7}  {status}")
+
+def load_baselines(path=BASELINE_FILE):
+    """All recorded baselines, {machine_key: {'machine': machine_info, 'cases': {case: {stage: seconds}}}}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get('machines', {})
+
+def save_baselines(results, path=BASELINE_FILE, name=None):
+    """Store results as this machine's baselines, keeping the other machines' entries."""
+    machines = load_baselines(path)
+    info = machine_info()
+    machines[machine_key(info, name)] = {'machine': info, 'cases': results}
+    with open(path, 'w') as f:
+        json.dump({'machines': machines}, f, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time each pipeline stage on synthetic colon phantoms and check for regressions.")
+    parser.add_argument("--cases", nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown over the baseline, as a fraction")
+    parser.add_argument("--baselines", default=BASELINE_FILE)
+    parser.add_argument("--update-baselines", action="store_true", help="Store this run's times as this machine's baselines")
+    parser.add_argument("--model", help="U-Net .h5 model to time inference with (needs TensorFlow)")
+    parser.add_argument("--centerline-backend", default='skeleton', choices=['skeleton', 'vmtk'])
+    parser.add_argument("--work-dir", help="Where the phantoms are written (default: a temporary directory)")
+    parser.add_argument("--machine", help=f"Name the baselines are stored under (default: ${MACHINE_ENV}, else CPU model and count)")
+    parser.add_argument("--allow-missing-baselines", action="store_true", help="Exit 0 when this machine has no baselines")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='phantoms_') as tmp:
+        work_dir = args.work_dir or tmp
+        results = {}
+        for case in args.cases:
+            paths = phantom.generate_phantom(os.path.join(work_dir, case), seed=0, **CASES[case])
+            results[case] = time_case(paths, repeats=args.repeats, model_file=args.model, centerline_backend=args.centerline_backend)
+
+    key = machine_key(machine_info(), args.machine)
+    baselines = load_baselines(args.baselines).get(key)
+    if baselines is None:
+        print(f"No baselines recorded for {key}; not comparing against other machines. Record them with --update-baselines")
+    rows = compare(results, baselines, threshold=args.threshold)
+    print_rows(rows)
+
+    if args.update_baselines:
+        save_baselines(results, args.baselines, args.machine)
+        print(f"Wrote {args.baselines}")
+    elif any(row[-1] == 'REGRESSION' for row in rows):
+        sys.exit(1)
+    elif baselines is None and not args.allow_missing_baselines:
+        sys.exit(2)
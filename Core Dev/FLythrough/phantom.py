@@ -0,0 +1,230 @@
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import nibabel as nib
+import pyvista as pv
+from scipy import ndimage
+from scipy.interpolate import CubicSpline
+import profiling
+
+# Rectum -> sigmoid -> descending -> transverse -> ascending -> caecum, in a unit box (x, y lateral, z axial)
+COLON_FRAME = np.array([
+    (0.50, 0.50, 0.05), (0.50, 0.45, 0.22), (0.72, 0.50, 0.30), (0.80, 0.55, 0.50), (0.80, 0.50, 0.88),
+    (0.50, 0.40, 0.82), (0.20, 0.50, 0.88), (0.20, 0.55, 0.50), (0.22, 0.50, 0.15),
+])
+
+# CT numbers of the synthetic series: insufflated lumen and outside air, soft tissue, stored with this intercept
+AIR_HU = -1000.0
+TISSUE_HU = 40.0
+RESCALE_INTERCEPT = -1024.0
+
+def colon_curve(extent, margin, tortuosity=0.5, seed=0, step=0.5):
+    """Colon-shaped 3D curve inside a box of the given world extent, sampled every step mm.
+
+    tortuosity adds seeded random bends between the frame points: 0 is the smooth frame, 1 bends by about a tenth
+    of the box per control point. margin (mm) is kept clear on every side.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0.0, 1.0, len(COLON_FRAME))
+    frame = CubicSpline(t, COLON_FRAME, axis=0)
+    t_control = np.linspace(0.0, 1.0, 3 * len(COLON_FRAME))
+    control = frame(t_control) + tortuosity * 0.1 * rng.standard_normal((len(t_control), 3))
+    control[[0, -1]] = frame(t_control[[0, -1]])
+    control = np.clip(control, 0.0, 1.0)
+
+    extent = np.asarray(extent, dtype=np.float64)
+    curve = CubicSpline(t_control, margin + control * (extent - 2 * margin), axis=0)
+    dense = curve(np.linspace(0.0, 1.0, 20000))
+    arc = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(dense, axis=0), axis=1))])
+    s = np.arange(0.0, arc[-1], step)
+    return np.stack([np.interp(s, arc, dense[:, dim]) for dim in range(3)], axis=1), s
+
+def haustral_radius(s, radius, haustra=0.25, haustra_spacing=30.0):
+    """Lumen radius along arc length s, narrowed by up to the fraction haustra at each haustral fold."""
+    return radius * (1.0 - haustra * 0.5 * (1.0 - np.cos(2 * np.pi * s / haustra_spacing)))
+
+def colon_phantom(shape=(256, 256, 192), spacing=(0.9, 0.9, 1.2), radius=12.0, tortuosity=0.5, haustra=0.25,
+                  haustra_spacing=30.0, seed=0):
+    """Tubular colon-like label volume (uint8, i-fastest like a NIfTI file) and its centerline.
+
+    Returns (labels, centerline_points, centerline_radius) with points in the vtkNIFTIImageReader frame (spacing
+    applied, origin at zero). The lumen is the union of balls swept along the curve, so its centerline and radius
+    are known exactly.
+    """
+    spacing = np.asarray(spacing, dtype=np.float64)
+    shape = tuple(int(n) for n in shape)
+    extent = (np.array(shape) - 1) * spacing
+    points, s = colon_curve(extent, margin=radius + 3 * spacing.max(), tortuosity=tortuosity, seed=seed,
+                            step=0.5 * spacing.min())
+    radii = haustral_radius(s, radius, haustra=haustra, haustra_spacing=haustra_spacing)
+
+    labels = np.zeros(shape, dtype=np.uint8, order='F')
+    for point, r in zip(points, radii):
+        lo = np.maximum(np.floor((point - r) / spacing).astype(int), 0)
+        hi = np.minimum(np.ceil((point + r) / spacing).astype(int) + 1, shape)
+        axes = [np.arange(lo[dim], hi[dim]) * spacing[dim] - point[dim] for dim in range(3)]
+        inside = axes[0][:, None, None] ** 2 + axes[1][None, :, None] ** 2 + axes[2][None, None, :] ** 2 <= r * r
+        labels[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]] |= inside
+    return labels, points, radii
+
+def add_polyps(labels, spacing, points, radii, n_polyps=4, radius_range=(3.0, 6.0), seed=0):
+    """Carve n_polyps hemispherical polyps into the lumen in place, evenly spaced along the centerline.
+
+    Each polyp is a ball of tissue centred on the wall at a random angle around the axis. Returns one dict per
+    polyp with its centre, radius (mm) and the index of its centerline point.
+    """
+    rng = np.random.default_rng(seed)
+    spacing = np.asarray(spacing, dtype=np.float64)
+    shape = labels.shape
+    tangents = np.gradient(points, axis=0)
+    polyps = []
+    for index in np.linspace(0, len(points) - 1, n_polyps + 2).astype(int)[1:-1]:
+        tangent = tangents[index] / np.linalg.norm(tangents[index])
+        direction = np.cross(tangent, rng.standard_normal(3))
+        direction /= np.linalg.norm(direction)
+        r = rng.uniform(*radius_range)
+        center = points[index] + radii[index] * direction
+        lo = np.maximum(np.floor((center - r) / spacing).astype(int), 0)
+        hi = np.minimum(np.ceil((center + r) / spacing).astype(int) + 1, shape)
+        axes = [np.arange(lo[dim], hi[dim]) * spacing[dim] - center[dim] for dim in range(3)]
+        inside = axes[0][:, None, None] ** 2 + axes[1][None, :, None] ** 2 + axes[2][None, None, :] ** 2 <= r * r
+        labels[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]][inside] = 0
+        polyps.append({'center': center.tolist(), 'radius_mm': float(r), 'centerline_index': int(index)})
+    return polyps
+
+def ct_volume(labels, spacing, noise=20.0, blur=0.7, seed=0):
+    """Synthetic CT colonography intensities (HU, float32) for a label volume.
+
+    An elliptical soft-tissue body fills each slice; the lumen and everything outside the body are air. A Gaussian
+    blur stands in for partial volume and Gaussian noise for quantum noise.
+    """
+    nx, ny, _ = labels.shape
+    x = (np.arange(nx) - (nx - 1) / 2) / (0.48 * nx)
+    y = (np.arange(ny) - (ny - 1) / 2) / (0.45 * ny)
+    body = (x[:, None] ** 2 + y[None, :] ** 2) <= 1.0
+    hu = np.where(body[:, :, None] & (labels == 0), TISSUE_HU, AIR_HU).astype(np.float32)
+    if blur > 0:
+        hu = ndimage.gaussian_filter(hu, sigma=blur / np.asarray(spacing) * min(spacing))
+    if noise > 0:
+        hu += np.random.default_rng(seed).normal(0.0, noise, hu.shape).astype(np.float32)
+    return hu
+
+def save_nifti(labels, spacing, nifti_file):
+    nib.save(nib.Nifti1Image(labels, np.diag([*spacing, 1.0])), nifti_file)
+
+def write_dicom_series(hu, spacing, out_dir, patient_name='PHANTOM^COLON'):
+    """Write a HU volume as a CT DICOM series, one file per axial slice (needs pydicom)."""
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    os.makedirs(out_dir, exist_ok=True)
+    ct_image_storage = '1.2.840.10008.5.1.4.1.1.2'
+    study_uid, series_uid, frame_uid = generate_uid(), generate_uid(), generate_uid()
+    stored = np.clip(np.round(hu - RESCALE_INTERCEPT), 0, 4095).astype(np.uint16)
+    files = []
+    for k in range(hu.shape[2]):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = ct_image_storage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = ct_image_storage
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID, ds.SeriesInstanceUID, ds.FrameOfReferenceUID = study_uid, series_uid, frame_uid
+        ds.Modality = 'CT'
+        ds.PatientName = patient_name
+        ds.PatientID = 'PHANTOM'
+        ds.SeriesNumber = 1
+        ds.InstanceNumber = k + 1
+        ds.ImagePositionPatient = [0.0, 0.0, float(k * spacing[2])]
+        ds.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+        ds.PixelSpacing = [float(spacing[1]), float(spacing[0])]
+        ds.SliceThickness = float(spacing[2])
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = 'MONOCHROME2'
+        ds.Rows, ds.Columns = hu.shape[1], hu.shape[0]
+        ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 12, 11
+        ds.PixelRepresentation = 0
+        ds.RescaleIntercept = RESCALE_INTERCEPT
+        ds.RescaleSlope = 1.0
+        # DICOM rows run along y, so each slice is stored transposed
+        ds.PixelData = np.ascontiguousarray(stored[:, :, k].T).tobytes()
+
+        path = os.path.join(out_dir, f'slice_{k:04d}.dcm')
+        if int(pydicom.__version__.split('.')[0]) >= 3:
+            ds.save_as(path, enforce_file_format=True)
+        else:
+            ds.is_little_endian, ds.is_implicit_VR = True, False
+            ds.save_as(path, write_like_original=False)
+        files.append(path)
+    return files
+
+@profiling.span('dicom_decode')
+def read_dicom_series(directory):
+    """HU volume (float32, x-y-z order) and (x, y, z) spacing of the *.dcm series in a directory, sorted by position."""
+    import pydicom
+    from glob import glob
+
+    slices = [pydicom.dcmread(path) for path in glob(os.path.join(directory, '*.dcm'))]
+    if not slices:
+        raise FileNotFoundError(f"No DICOM files in {directory}")
+    slices.sort(key=lambda ds: float(ds.ImagePositionPatient[2]))
+    hu = np.empty((int(slices[0].Columns), int(slices[0].Rows), len(slices)), dtype=np.float32, order='F')
+    for k, ds in enumerate(slices):
+        hu[:, :, k] = ds.pixel_array.T * float(ds.RescaleSlope) + float(ds.RescaleIntercept)
+    dz = float(slices[1].ImagePositionPatient[2]) - float(slices[0].ImagePositionPatient[2]) if len(slices) > 1 else float(slices[0].SliceThickness)
+    return hu, (float(slices[0].PixelSpacing[1]), float(slices[0].PixelSpacing[0]), dz)
+
+def generate_phantom(out_dir, shape=(256, 256, 192), spacing=(0.9, 0.9, 1.2), radius=12.0, tortuosity=0.5, haustra=0.25,
+                     seed=0, dicom=True, polyps=0):
+    """Write labels.nii.gz, the ground-truth centerline.vtp and, with pydicom available, a dicom/ CT series.
+
+    With polyps > 0 that many polyps are added and their ground truth written to polyps.json. Returns the paths
+    written, keyed 'labels', 'centerline', 'dicom' and 'polyps' (None when not written).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    labels, points, radii = colon_phantom(shape, spacing, radius=radius, tortuosity=tortuosity, haustra=haustra, seed=seed)
+    paths = {'labels': os.path.join(out_dir, 'labels.nii.gz'), 'centerline': os.path.join(out_dir, 'centerline.vtp'), 'dicom': None,
+             'polyps': None}
+    if polyps > 0:
+        paths['polyps'] = os.path.join(out_dir, 'polyps.json')
+        with open(paths['polyps'], 'w') as f:
+            json.dump(add_polyps(labels, spacing, points, radii, n_polyps=polyps, seed=seed), f, indent=1)
+    save_nifti(labels, spacing, paths['labels'])
+
+    centerline = pv.lines_from_points(points)
+    centerline.point_data['MaximumInscribedSphereRadius'] = radii
+    centerline.save(paths['centerline'])
+
+    if dicom:
+        try:
+            write_dicom_series(ct_volume(labels, spacing, seed=seed), spacing, os.path.join(out_dir, 'dicom'))
+            paths['dicom'] = os.path.join(out_dir, 'dicom')
+        except ImportError:
+            print("pydicom is not installed; skipping the DICOM series")
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic colon phantom: label volume, centerline and CT DICOM series.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 256, 192])
+    parser.add_argument("--spacing", type=float, nargs=3, default=[0.9, 0.9, 1.2])
+    parser.add_argument("--radius", type=float, default=12.0, help="Lumen radius in mm")
+    parser.add_argument("--tortuosity", type=float, default=0.5)
+    parser.add_argument("--haustra", type=float, default=0.25, help="Fractional narrowing at the haustral folds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-dicom", action="store_true")
+    parser.add_argument("--polyps", type=int, default=0, help="Number of hemispherical polyps to add (3-6 mm radius)")
+    args = parser.parse_args()
+
+    paths = generate_phantom(args.out_dir, tuple(args.shape), tuple(args.spacing), radius=args.radius, tortuosity=args.tortuosity,
+                             haustra=args.haustra, seed=args.seed, dicom=not args.no_dicom, polyps=args.polyps)
+    for name, path in paths.items():
+        print(f"{name}: {path}")
+    sys.exit(0)
@@ -0,0 +1,497 @@
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import traceback
+import multiprocessing as mp
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from glob import glob
+import numpy as np
+import nibabel as nib
+import nifti_io
+import stage_cache
+import profiling
+
+# Bump when a task's outputs change for the same inputs so stale store entries are not reused
+PIPELINE_VERSION = 2
+
+# function(inputs, out_dir, params, n_threads) writes its files into out_dir; inputs maps upstream task -> its directory.
+# cpu, memory_gb and gpu are what the scheduler reserves while the task runs.
+Task = namedtuple('Task', 'function inputs cpu memory_gb gpu')
+
+DEFAULT_PARAMS = {
+    'dicom_index': {},
+    'volume': {},
+    'segmentation': {'segmenter': 'threshold', 'model': None, 'air_hu': -500.0},
+    'postprocess': {'closing_radius': 0, 'fill_holes': True, 'chunk_slices': 64},
+    'mesh': {'method': 'flying_edges', 'contour_value': 0.5, 'n_iter': 50, 'relaxation_factor': 0.5},
+    'centerline': {'backend': 'skeleton', 'reduction_factor': 0.3, 'label_value': 1},
+    'camera_path': {'n_samples': 2000},
+    'render_assets': {'reductions': [0.0, 0.5, 0.8, 0.93, 0.98]},
+    'polyp_candidates': {'method': 'flying_edges', 'contour_value': 0.5, 'n_iter': 20, 'relaxation_factor': 0.5, 'rings': 2, 'shape_index_min': 0.9, 'grow_shape_index': 0.8,
+                         'curvedness_range': [0.08, 1.0], 'min_area_mm2': 2.0},
+}
+
+def file_list_digest(paths):
+    """Content hash of a set of files, independent of where they live."""
+    digest = hashlib.sha1()
+    for path in sorted(paths, key=os.path.basename):
+        digest.update(os.path.basename(path).encode())
+        digest.update(nifti_io.file_digest(path).encode())
+    return digest.hexdigest()
+
+def dicom_files(directory):
+    """DICOM files directly inside directory, by their 'DICM' preamble; subdirectories with a series are cases of their own."""
+    import pydicom.misc
+
+    return sorted(p for p in glob(os.path.join(directory, '*')) if os.path.isfile(p) and pydicom.misc.is_dicom(p))
+
+def output_digest(out_dir):
+    return file_list_digest([path for path in glob(os.path.join(out_dir, '*')) if os.path.basename(path) != 'manifest.json'])
+
+def index_dicom(inputs, out_dir, params, n_threads):
+    """Group the DICOM files of a directory by series and write the largest series, sorted by slice position.
+
+    File names are stored relative to the directory so the index, and everything keyed on it, does not depend on
+    where the series lives.
+    """
+    import pydicom
+
+    series = {}
+    for path in dicom_files(params['path']):
+        try:
+            ds = pydicom.dcmread(path, stop_before_pixels=True)
+        except pydicom.errors.InvalidDicomError:
+            continue
+        if 'ImagePositionPatient' not in ds:
+            continue
+        series.setdefault(str(ds.SeriesInstanceUID), []).append(
+            {'file': os.path.relpath(path, params['path']), 'z': float(ds.ImagePositionPatient[2]), 'spacing': [float(v) for v in ds.PixelSpacing]})
+    if not series:
+        raise FileNotFoundError(f"No DICOM images in {params['path']}")
+    uid, slices = max(series.items(), key=lambda item: len(item[1]))
+    slices.sort(key=lambda s: s['z'])
+    dz = slices[1]['z'] - slices[0]['z'] if len(slices) > 1 else 1.0
+    index = {'series': uid, 'files': [s['file'] for s in slices],
+             'spacing': [slices[0]['spacing'][1], slices[0]['spacing'][0], dz]}
+    with open(os.path.join(out_dir, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+
+def assemble_volume(inputs, out_dir, params, n_threads):
+    """Stack the indexed slices into an int16 HU volume (x-y-z order) saved as volume.nii.gz."""
+    import pydicom
+
+    with open(os.path.join(inputs['dicom_index'], 'index.json')) as f:
+        index = json.load(f)
+
+    def read(name):
+        ds = pydicom.dcmread(os.path.join(params['path'], name))
+        return ds.pixel_array.T * float(getattr(ds, 'RescaleSlope', 1.0)) + float(getattr(ds, 'RescaleIntercept', 0.0))
+
+    with profiling.span('dicom_decode', slices=len(index['files'])), ThreadPoolExecutor(max_workers=n_threads) as executor:
+        slices = list(executor.map(read, index['files']))
+    hu = np.stack(slices, axis=2).round().astype(np.int16)
+    nib.save(nib.Nifti1Image(hu, np.diag([*index['spacing'], 1.0])), os.path.join(out_dir, 'volume.nii.gz'))
+
+def segment(inputs, out_dir, params, n_threads):
+    """Lumen mask of the HU volume, from the U-Net (segmenter='unet', needs model) or an air threshold."""
+    import segmentation
+
+    data, spacing, _ = nifti_io.load_nifti_volume(os.path.join(inputs['volume'], 'volume.nii.gz'))
+    hu = np.asarray(data, dtype=np.float32)
+    if params['segmenter'] == 'unet':
+        mask = segmentation.unet_inference(segmentation.load_unet(params['model']), hu)
+    elif params['segmenter'] == 'threshold':
+        mask = segmentation.threshold_lumen(hu, air_hu=params['air_hu'])
+    else:
+        raise ValueError(f"Unknown segmenter: {params['segmenter']}")
+    nib.save(nib.Nifti1Image(mask, np.diag([*spacing, 1.0])), os.path.join(out_dir, 'mask.nii.gz'))
+
+def import_labels(inputs, out_dir, params, n_threads):
+    """Source task for a case that starts from an existing segmentation."""
+    shutil.copyfile(params['path'], os.path.join(out_dir, 'mask.nii.gz'))
+
+def postprocess(inputs, out_dir, params, n_threads):
+    """Optional closing, largest connected component and hole filling of the mask (see mask_postprocess)."""
+    import mask_postprocess
+
+    data, spacing, _ = nifti_io.load_nifti_volume(os.path.join(inputs['segmentation'], 'mask.nii.gz'))
+    mask, stats = mask_postprocess.postprocess_mask(data, closing_radius=params['closing_radius'], fill_holes=params['fill_holes'],
+                                                    chunk_slices=params['chunk_slices'])
+    if stats['voxels_out'] == 0:
+        raise ValueError("Empty segmentation")
+    nib.save(nib.Nifti1Image(mask, np.diag([*spacing, 1.0])), os.path.join(out_dir, 'mask.nii.gz'))
+    # Counts only, so recomputing the same mask gives the same output digest
+    with open(os.path.join(out_dir, 'postprocess.json'), 'w') as f:
+        json.dump({k: v for k, v in stats.items() if k != 'seconds'}, f, indent=1)
+
+def mesh(inputs, out_dir, params, n_threads):
+    import surface_extraction
+    import smoothing
+
+    image = nifti_io.read_nifti_image(os.path.join(inputs['postprocess'], 'mask.nii.gz'), use_cache=False)
+    surface = surface_extraction.extract_surface(image, params['contour_value'], method=params['method'], n_threads=n_threads)
+    if surface.n_points == 0:
+        raise ValueError(f"No surface at contour value {params['contour_value']}")
+    surface = smoothing.smooth_mesh(surface, n_iter=params['n_iter'], relaxation_factor=params['relaxation_factor'], n_threads=n_threads)
+    stage_cache.write_polydata(surface, os.path.join(out_dir, 'surface.vtp'))
+
+def extract_centerline(inputs, out_dir, params, n_threads):
+    import centerline
+
+    centerline.extract_network_and_center_curves(os.path.join(inputs['postprocess'], 'mask.nii.gz'), os.path.join(out_dir, 'network.vtp'),
+                                                 os.path.join(out_dir, 'centerline.vtp'), reduction_factor=params['reduction_factor'],
+                                                 label_value=params['label_value'], backend=params['backend'], n_threads=n_threads,
+                                                 use_cache=False)
+
+def build_camera_path(inputs, out_dir, params, n_threads):
+    import camera_path
+
+    points = stage_cache.read_polydata(os.path.join(inputs['centerline'], 'centerline.vtp')).points
+    camera_path.CameraPath.build(points, n_samples=params['n_samples']).save(os.path.join(out_dir, 'camera_path.npz'))
+
+def render_assets(inputs, out_dir, params, n_threads):
+    """Level-of-detail pyramid of the surface for the overview, plus the camera path alongside it."""
+    import lod
+
+    surface = stage_cache.read_polydata(os.path.join(inputs['mesh'], 'surface.vtp'))
+    for i, reduction in enumerate(params['reductions']):
+        level = surface if reduction == 0 else lod.decimate(surface, reduction)
+        stage_cache.write_polydata(level, os.path.join(out_dir, f'lod_{i}.vtp'))
+    shutil.copyfile(os.path.join(inputs['camera_path'], 'camera_path.npz'), os.path.join(out_dir, 'camera_path.npz'))
+
+def detect_polyp_candidates(inputs, out_dir, params, n_threads):
+    """Shape-index polyp candidates on a surface smoothed less than the display mesh, so small polyps keep their caps."""
+    import surface_extraction
+    import smoothing
+    import centerline_graph
+    import polyp_detection
+
+    image = nifti_io.read_nifti_image(os.path.join(inputs['postprocess'], 'mask.nii.gz'), use_cache=False)
+    surface = surface_extraction.extract_surface(image, params['contour_value'], method=params['method'], n_threads=n_threads)
+    if surface.n_points == 0:
+        raise ValueError(f"No surface at contour value {params['contour_value']}")
+    surface = smoothing.smooth_mesh(surface, n_iter=params['n_iter'], relaxation_factor=params['relaxation_factor'], n_threads=n_threads)
+    graph = centerline_graph.CenterlineGraph.load(os.path.join(inputs['centerline'], 'centerline.vtp'))
+    candidates, _, _ = polyp_detection.detect_polyps(surface, graph, rings=params['rings'], shape_index_min=params['shape_index_min'],
+                                                     grow_shape_index=params['grow_shape_index'],
+                                                     curvedness_range=tuple(params['curvedness_range']), min_area_mm2=params['min_area_mm2'])
+    polyp_detection.save_candidates(candidates, os.path.join(out_dir, 'candidates.json'), **params)
+
+TASKS = {
+    'dicom_index': Task(index_dicom, (), cpu=1, memory_gb=0.5, gpu=0),
+    'volume': Task(assemble_volume, ('dicom_index',), cpu=2, memory_gb=2.0, gpu=0),
+    'segmentation': Task(segment, ('volume',), cpu=2, memory_gb=4.0, gpu=1),
+    'postprocess': Task(postprocess, ('segmentation',), cpu=1, memory_gb=2.0, gpu=0),
+    'mesh': Task(mesh, ('postprocess',), cpu=4, memory_gb=3.0, gpu=0),
+    'centerline': Task(extract_centerline, ('postprocess',), cpu=2, memory_gb=3.0, gpu=0),
+    'camera_path': Task(build_camera_path, ('centerline',), cpu=1, memory_gb=0.5, gpu=0),
+    'render_assets': Task(render_assets, ('mesh', 'camera_path'), cpu=1, memory_gb=2.0, gpu=0),
+    'polyp_candidates': Task(detect_polyp_candidates, ('postprocess', 'centerline'), cpu=2, memory_gb=3.0, gpu=0),
+}
+
+class Case:
+    """One input (a DICOM directory or a label NIfTI) and the tasks of the DAG that apply to it."""
+
+    def __init__(self, path, params=None):
+        self.path = path
+        self.is_labels = path.endswith(('.nii', '.nii.gz'))
+        base = os.path.basename(os.path.normpath(path))
+        self.name = base[:-len('.nii.gz')] if base.endswith('.nii.gz') else os.path.splitext(base)[0]
+        self.params = {name: {**DEFAULT_PARAMS[name], **(params or {}).get(name, {})} for name in DEFAULT_PARAMS}
+        self.tasks = dict(TASKS)
+        if self.is_labels:
+            # Starts from the segmentation, which becomes a source task reading the file
+            for name in ('dicom_index', 'volume'):
+                del self.tasks[name]
+            self.tasks['segmentation'] = TASKS['segmentation']._replace(function=import_labels, inputs=(), cpu=1, memory_gb=0.5, gpu=0)
+            self.params['segmentation'] = {'path': path}
+        else:
+            self.params['dicom_index'] = {'path': path}
+            self.params['volume'] = {'path': path}
+        if self.params['segmentation'].get('segmenter') != 'unet':
+            self.tasks['segmentation'] = self.tasks['segmentation']._replace(gpu=0)
+
+    def source_digest(self):
+        if self.is_labels:
+            return nifti_io.file_digest(self.path)
+        return file_list_digest(dicom_files(self.path))
+
+def find_cases(inputs):
+    """Label NIfTI files and DICOM directories (directories that directly contain DICOM files) among the inputs."""
+    import pydicom.misc
+
+    cases = []
+    for path in inputs:
+        if os.path.isfile(path) and path.endswith(('.txt', '.csv')):
+            with open(path) as f:
+                cases += find_cases([line.strip().split(',')[0] for line in f if line.strip() and not line.startswith('#')])
+        elif os.path.isfile(path):
+            cases.append(path)
+        elif os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                labels = sorted(os.path.join(root, f) for f in files if f.endswith(('.nii', '.nii.gz')))
+                cases += labels
+                if any(pydicom.misc.is_dicom(os.path.join(root, f)) for f in files):
+                    cases.append(root)
+        else:
+            raise FileNotFoundError(path)
+    return cases
+
+def make_cases(paths, params=None):
+    """Cases for the given inputs; names shared by several inputs (e.g. series directories all called dicom) are
+    prefixed with their parent directories until they are unique."""
+    cases = [Case(path, params) for path in paths]
+    base_names = [case.name for case in cases]
+    for depth in range(1, 8):
+        names = [case.name for case in cases]
+        clashes = {name for name in names if names.count(name) > 1}
+        if not clashes:
+            break
+        for case, base in zip(cases, base_names):
+            if case.name in clashes:
+                parents = os.path.normpath(os.path.abspath(case.path)).split(os.sep)[:-1]
+                case.name = '_'.join([*parents[-depth:], base])
+    return cases
+
+def task_ranks(tasks):
+    """Length of the longest chain of tasks from each task to the end of the DAG; the scheduler starts the longest first."""
+    ranks = {}
+
+    def rank(name):
+        if name not in ranks:
+            ranks[name] = 1 + max((rank(child) for child, task in tasks.items() if name in task.inputs), default=0)
+        return ranks[name]
+
+    for name in tasks:
+        rank(name)
+    return ranks
+
+def run_task(function, inputs, store_dir, key, params, n_threads, extra):
+    """Worker entry point: run one task into a temporary directory and move it into the store when complete."""
+    tmp_dir = os.path.join(store_dir, f'{key}.tmp.{os.getpid()}')
+    final_dir = os.path.join(store_dir, key)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    start = time.perf_counter()
+    try:
+        with profiling.span(extra.get('task', function.__name__), case=extra.get('case')):
+            function(inputs, tmp_dir, params, n_threads)
+        seconds = time.perf_counter() - start
+        manifest = {'key': key, 'params': params, 'seconds': seconds, 'output_digest': output_digest(tmp_dir), **extra}
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=1, default=str)
+        try:
+            os.replace(tmp_dir, final_dir)
+        except OSError:
+            # Another run finished the same key first; its outputs are identical
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return manifest
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+class Scheduler:
+    """Runs the task DAGs of many cases on a process pool within CPU, memory and GPU budgets.
+
+    A task is ready once its inputs are done. Its store key hashes its name, parameters and the content digests of
+    its inputs' outputs (for a source task, the digest of the input files), so an unchanged upstream result keeps
+    every downstream key, whatever path the input came from. A ready task whose key is in the store is done without
+    running. Otherwise ready tasks start longest-remaining-chain first while their cpu, memory_gb and gpu fit in
+    what is free; when nothing is running the next task starts even if it asks for more than the budget.
+
+    A worker process that dies (out of memory, a crash in native code) breaks the pool, and which of the tasks running
+    at that moment caused it is unknown. They all go back to pending and are retried in a fresh pool one at a time,
+    with nothing else running beside them; a task whose worker dies more than max_retries times fails and its case's
+    downstream tasks are skipped.
+    """
+
+    def __init__(self, store_dir, cpus=None, memory_gb=None, gpus=0, use_cache=True, verbose=False, max_retries=1):
+        self.store_dir = store_dir
+        self.cpus = cpus or os.cpu_count() or 1
+        self.memory_gb = memory_gb or available_memory_gb()
+        self.gpus = gpus
+        self.use_cache = use_cache
+        self.verbose = verbose
+        self.max_retries = max_retries
+
+    def task_key(self, case, name, upstream_digests):
+        params = {k: v for k, v in case.params[name].items() if k != 'path'}
+        if not case.tasks[name].inputs:
+            params['source'] = case.source_digest()
+        return stage_cache.stage_key(f'{name}@{PIPELINE_VERSION}', params, upstream_digests)
+
+    def run(self, cases):
+        """Run every case to completion; returns {case name: {task: record}} with status hit, computed, failed or skipped."""
+        os.makedirs(self.store_dir, exist_ok=True)
+        records = {case.name: {name: {'status': 'pending', 'seconds': 0.0, 'dir': None, 'digest': None, 'error': ''}
+                               for name in case.tasks} for case in cases}
+        ranks = {case.name: task_ranks(case.tasks) for case in cases}
+        free = {'cpu': self.cpus, 'memory_gb': self.memory_gb, 'gpu': self.gpus}
+        running = {}
+        # (case name, task) -> how many pools died while it ran; tasks with a crash behind them run alone
+        crashes = {}
+
+        def ready():
+            nodes = []
+            for order, case in enumerate(cases):
+                for name, task in case.tasks.items():
+                    record = records[case.name][name]
+                    if record['status'] == 'pending' and all(records[case.name][i]['status'] in ('hit', 'computed') for i in task.inputs):
+                        nodes.append((-ranks[case.name][name], order, case, name))
+            return [(case, name) for _, _, case, name in sorted(nodes, key=lambda n: n[:2])]
+
+        def skip_downstream(case, name):
+            for child, task in case.tasks.items():
+                if name in task.inputs and records[case.name][child]['status'] == 'pending':
+                    records[case.name][child].update(status='skipped', error=f'{name} failed')
+                    skip_downstream(case, child)
+
+        def finish(case, name, status, manifest=None, error=''):
+            record = records[case.name][name]
+            record.update(status=status, error=error)
+            crashes.pop((case.name, name), None)
+            if manifest is not None:
+                record.update(seconds=manifest['seconds'] if status == 'computed' else 0.0, digest=manifest['output_digest'],
+                              dir=os.path.join(self.store_dir, name, manifest['key']))
+            if self.verbose or status == 'failed':
+                print(f"{case.name}/{name}: {status} {record['seconds']:.2f}s {error}")
+            if status == 'failed':
+                skip_downstream(case, name)
+
+        def new_executor():
+            return ProcessPoolExecutor(max_workers=self.cpus, mp_context=mp.get_context('spawn'))
+
+        def release(future):
+            case, name, need, key = running.pop(future)
+            for r in need:
+                free[r] += need[r]
+            return case, name, key
+
+        def recover():
+            """Settle every task of a broken pool: those that had finished keep their results, the rest are retried
+            alone unless their worker has already died max_retries times."""
+            for future in list(running):
+                case, name, key = release(future)
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    finish(case, name, 'computed', future.result())
+                    continue
+                for tmp_dir in glob(os.path.join(self.store_dir, name, f'{key}.tmp.*')):
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                count = crashes[case.name, name] = crashes.get((case.name, name), 0) + 1
+                if count > self.max_retries:
+                    finish(case, name, 'failed', error=f"BrokenProcessPool: a worker process died (e.g. out of memory or a crash) {count} times")
+                else:
+                    records[case.name][name]['status'] = 'pending'
+                    if self.verbose:
+                        print(f"{case.name}/{name}: worker process died, retrying alone")
+            executor.shutdown(wait=True)
+            return new_executor()
+
+        executor = new_executor()
+        try:
+            while True:
+                started = False
+                for case, name in ready():
+                    if any((c.name, n) in crashes for c, n, _, _ in running.values()):
+                        break
+                    task = case.tasks[name]
+                    upstream = [records[case.name][i]['digest'] for i in task.inputs]
+                    try:
+                        key = self.task_key(case, name, upstream)
+                    except Exception as e:
+                        finish(case, name, 'failed', error=f"{type(e).__name__}: {e}")
+                        continue
+                    manifest_file = os.path.join(self.store_dir, name, key, 'manifest.json')
+                    if self.use_cache and os.path.exists(manifest_file):
+                        with open(manifest_file) as f:
+                            finish(case, name, 'hit', json.load(f))
+                        started = True
+                        continue
+
+                    need = {'cpu': min(task.cpu, self.cpus), 'memory_gb': min(task.memory_gb, self.memory_gb), 'gpu': min(task.gpu, self.gpus)}
+                    if running and ((case.name, name) in crashes or any(need[r] > free[r] for r in need)):
+                        continue
+                    for r in need:
+                        free[r] -= need[r]
+                    inputs = {i: records[case.name][i]['dir'] for i in task.inputs}
+                    try:
+                        future = executor.submit(run_task, task.function, inputs, os.path.join(self.store_dir, name), key,
+                                                 case.params[name], need['cpu'], {'case': case.name, 'task': name})
+                    except BrokenProcessPool:
+                        # A running task took the pool down before this one could start; it stays pending
+                        for r in need:
+                            free[r] += need[r]
+                        executor = recover()
+                        started = True
+                        break
+                    running[future] = (case, name, need, key)
+                    records[case.name][name]['status'] = 'running'
+                    started = True
+
+                if not running:
+                    if started:
+                        continue
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                    executor = recover()
+                    continue
+                for future in done:
+                    case, name, _ = release(future)
+                    try:
+                        finish(case, name, 'computed', future.result())
+                    except Exception as e:
+                        finish(case, name, 'failed', error=f"{type(e).__name__}: {e}")
+                        if self.verbose:
+                            traceback.print_exception(type(e), e, e.__traceback__)
+        finally:
+            executor.shutdown(wait=True)
+        return records
+
+def available_memory_gb():
+    """Physical memory available to new work, from psutil or /proc/meminfo; 8 GB when neither is readable."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1 << 30)
+    except ImportError:
+        pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / (1 << 20)
+    except OSError:
+        pass
+    return 8.0
+
+def write_case_summaries(records, cases, out_dir):
+    """<out_dir>/<case>.json with the status and store directory of each task, for the viewers to pick up."""
+    os.makedirs(out_dir, exist_ok=True)
+    for case in cases:
+        with open(os.path.join(out_dir, f'{case.name}.json'), 'w') as f:
+            json.dump({'input': case.path, 'tasks': records[case.name]}, f, indent=1)
+
+def print_report(records):
+    """Per-case task times (* marks a store hit), followed by the failures."""
+    names = list(TASKS)
+    print(f"{'case':<24}" + "".join(f"{name[:13]:>14}" for name in names))
+    for case, tasks in records.items():
+        cells = []
+        for name in names:
+            record = tasks.get(name)
+            if record is None or record['status'] in ('skipped', 'pending'):
+                cells.append(f"{'-':>14}")
+            elif record['status'] == 'failed':
+                cells.append(f"{'FAILED':>14}")
+            else:
+                cells.append(f"{record['seconds']:>13.2f}" + ('*' if record['status'] == 'hit' else ' '))
+        print(f"{case:<24}" + "".join(cells))
+    for case, tasks in records.items():
+        for name, record in tasks.items():
+            if record['status'] in ('failed', 'skipped'):
+                print(f"{record['status'].upper()} {case}/{name}: {record['error']}")
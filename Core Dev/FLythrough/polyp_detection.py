@@ -0,0 +1,271 @@
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+import pyvista as pv
+import profiling
+from smoothing import mesh_edges
+
+# Koenderink's shape index runs from -1 (cup) through 0 (saddle) to +1 (cap). With normals pointing into the lumen a
+# polyp seen from inside is a cap, the colon wall a rut (-0.5) and a haustral fold a ridge (+0.5).
+SHAPE_INDEX_MIN = 0.9
+GROW_SHAPE_INDEX = 0.8
+# Curvedness of a sphere is 1 / radius, so (0.08, 1.0) per mm keeps caps of roughly 1-12 mm radius
+CURVEDNESS_RANGE = (0.08, 1.0)
+MIN_AREA_MM2 = 2.0
+# Smoothing iterations for meshes made for detection; the 50 used for display flattens polyps under about 4 mm
+DETECTION_SMOOTHING = 20
+
+def mesh_arrays(mesh):
+    """float64 points and int64 (n, 3) faces of a triangle mesh."""
+    if not mesh.is_all_triangles:
+        mesh = mesh.triangulate()
+    return np.asarray(mesh.points, dtype=np.float64), np.asarray(mesh.faces, dtype=np.int64).reshape(-1, 4)[:, 1:]
+
+def vertex_normals(points, faces):
+    """Area-weighted vertex normals and each vertex's area (a third of its triangles' areas)."""
+    cross = np.cross(points[faces[:, 1]] - points[faces[:, 0]], points[faces[:, 2]] - points[faces[:, 0]])
+    normals = np.stack([np.bincount(faces.ravel(), weights=np.repeat(cross[:, k], 3), minlength=len(points)) for k in range(3)], axis=1)
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+    area = np.bincount(faces.ravel(), weights=np.repeat(np.linalg.norm(cross, axis=1) / 6.0, 3), minlength=len(points))
+    return normals, area
+
+def lumen_orientation(points, faces):
+    """+1 when the faces wind with normals into the enclosed lumen, -1 when they point out of it (signed volume)."""
+    volume = np.einsum('ij,ij->i', points[faces[:, 0]], np.cross(points[faces[:, 1]], points[faces[:, 2]])).sum()
+    return -1.0 if volume > 0 else 1.0
+
+def ring_neighbourhood(faces, n_points, rings=2):
+    """Sparse boolean matrix whose row i marks the vertices within rings edges of vertex i (i itself excluded)."""
+    edges, _ = mesh_edges(faces, n_points)
+    adjacency = sp.csr_matrix((np.ones(2 * len(edges), dtype=np.int8), (edges.ravel(), edges[:, ::-1].ravel())),
+                              shape=(n_points, n_points))
+    reach = adjacency.copy()
+    step = adjacency + sp.identity(n_points, dtype=np.int8, format='csr')
+    for _ in range(rings - 1):
+        reach = reach @ step
+        reach.data[:] = 1
+    reach.setdiag(0)
+    reach.eliminate_zeros()
+    return reach.tocsr(), adjacency
+
+# Columns of the per-vertex moment sums, and where each lands in the 5 x 5 normal matrix of the design
+# [x^2, xy, y^2, x, y]
+MOMENTS = ('x4', 'x3y', 'x2y2', 'xy3', 'y4', 'x3', 'x2y', 'xy2', 'y3', 'x2', 'xy', 'y2', 'x2z', 'xyz', 'y2z', 'xz', 'yz')
+NORMAL_MATRIX = np.array([
+    [0, 1, 2, 5, 6],
+    [1, 2, 3, 6, 7],
+    [2, 3, 4, 7, 8],
+    [5, 6, 7, 9, 10],
+    [6, 7, 8, 10, 11],
+])
+
+def _tangent_frames(normals):
+    helper = np.zeros_like(normals)
+    helper[np.arange(len(normals)), np.argmin(np.abs(normals), axis=1)] = 1.0
+    u = np.cross(normals, helper)
+    u /= np.maximum(np.linalg.norm(u, axis=1, keepdims=True), 1e-12)
+    return u, np.cross(normals, u)
+
+@profiling.span('principal_curvatures')
+def principal_curvatures(points, normals, neighbourhood, chunk_size=8192):
+    """Per-vertex principal curvatures (k1 >= k2) from a least-squares quadric over each vertex's neighbourhood.
+
+    Every neighbour is written in the vertex's tangent frame and z = a x^2 + b xy + c y^2 + d x + e y is fitted; the
+    normal equations of all vertices are summed with one reduceat over the rows of the sparse neighbourhood and
+    solved as a batch of 5 x 5 systems, a chunk of vertices at a time. Positive curvature bends away from the normal, so with normals
+    into the lumen a polyp has k1, k2 > 0.
+    """
+    n = len(points)
+    u, v = _tangent_frames(normals)
+    mean = np.empty(n)
+    gauss = np.empty(n)
+    frames = np.stack([u, v, normals], axis=2)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        m = stop - start
+        block = neighbourhood[start:stop]
+        counts = np.diff(block.indptr)
+        i = np.repeat(np.arange(start, stop), counts)
+        x, y, z = np.einsum('ij,ijk->ki', points[block.indices] - points[i], frames[i])
+
+        # The normal equations only need these moments of each neighbourhood: A^T A holds the degree 2-4 monomials
+        # of (x, y) and A^T z the design columns times z
+        moments = np.empty((len(MOMENTS), len(i)))
+        xx, xy, yy = moments[9], moments[10], moments[11]
+        np.multiply(x, x, out=xx)
+        np.multiply(x, y, out=xy)
+        np.multiply(y, y, out=yy)
+        for k, (a, b) in enumerate(((xx, xx), (xx, xy), (xx, yy), (xy, yy), (yy, yy), (xx, x), (xx, y), (x, yy), (y, yy),
+                                    (xx, z), (xy, z), (yy, z), (x, z), (y, z))):
+            np.multiply(a, b, out=moments[k if k < 9 else k + 3])
+        # CSR rows are contiguous, so one reduceat sums every vertex's moments; rows without neighbours stay zero
+        sums = np.zeros((m, len(MOMENTS)))
+        has = counts > 0
+        if has.any():
+            sums[has] = np.add.reduceat(moments, block.indptr[:-1][has], axis=1).T
+        ata = sums[:, NORMAL_MATRIX]
+        atz = sums[:, 12:]
+        # A small ridge keeps vertices with too few neighbours (mesh borders) solvable; they come out flat
+        ridge = 1e-9 * np.maximum(np.trace(ata, axis1=1, axis2=2), 1e-12)
+        ata += ridge[:, None, None] * np.eye(5)
+        a, b, c, fx, fy = np.linalg.solve(ata, atz[..., None])[..., 0].T
+
+        # Shape operator of the graph z = f(x, y) at the origin, from its first and second fundamental forms
+        w = np.sqrt(1.0 + fx * fx + fy * fy)
+        E, F, G = 1.0 + fx * fx, fx * fy, 1.0 + fy * fy
+        L, M, N = 2.0 * a / w, b / w, 2.0 * c / w
+        det = E * G - F * F
+        gauss[start:stop] = (L * N - M * M) / det
+        mean[start:stop] = -(E * N - 2.0 * F * M + G * L) / (2.0 * det)
+    spread = np.sqrt(np.maximum(mean * mean - gauss, 0.0))
+    return mean + spread, mean - spread
+
+def shape_index(k1, k2):
+    return (2.0 / np.pi) * np.arctan2(k1 + k2, k1 - k2)
+
+def curvedness(k1, k2):
+    return np.sqrt(0.5 * (k1 * k1 + k2 * k2))
+
+@profiling.span('surface_curvature')
+def surface_curvature(mesh, rings=2, chunk_size=8192):
+    """Per-vertex k1, k2, shape_index, curvedness, normal (into the lumen) and area, with points, faces and adjacency."""
+    points, faces = mesh_arrays(mesh)
+    normals, area = vertex_normals(points, faces)
+    normals *= lumen_orientation(points, faces)
+    neighbourhood, adjacency = ring_neighbourhood(faces, len(points), rings)
+    k1, k2 = principal_curvatures(points, normals, neighbourhood, chunk_size)
+    return {'points': points, 'faces': faces, 'adjacency': adjacency, 'normal': normals, 'area': area,
+            'k1': k1, 'k2': k2, 'shape_index': shape_index(k1, k2), 'curvedness': curvedness(k1, k2)}
+
+@profiling.span('cluster_candidates')
+def cluster_candidates(curvature, graph=None, shape_index_min=SHAPE_INDEX_MIN, grow_shape_index=GROW_SHAPE_INDEX,
+                       curvedness_range=CURVEDNESS_RANGE, min_area_mm2=MIN_AREA_MM2):
+    """Polyp candidates, largest first, by hysteresis on the shape index.
+
+    Vertices with shape index >= shape_index_min seed the candidates, which grow over mesh edges through vertices
+    with shape index >= grow_shape_index; both need curvedness within curvedness_range. Returns (candidates,
+    vertex_label): one dict per candidate with its cap area, extent, curvature statistics and centroid, and, given a
+    CenterlineGraph, the branch, arc length and distance of the nearest centerline point; vertex_label is the
+    candidate index of every vertex (-1 elsewhere).
+    """
+    si, cv = curvature['shape_index'], curvature['curvedness']
+    grow = (si >= grow_shape_index) & (cv >= curvedness_range[0]) & (cv <= curvedness_range[1])
+    vertex_label = np.full(len(si), -1, dtype=np.int64)
+    ids = np.flatnonzero(grow)
+    if len(ids) == 0:
+        return [], vertex_label
+
+    _, labels = csgraph.connected_components(curvature['adjacency'][ids][:, ids], directed=False)
+    area = curvature['area'][ids]
+    cluster_area = np.bincount(labels, weights=area)
+    seeded = np.bincount(labels, weights=si[ids] >= shape_index_min) > 0
+    keep = np.flatnonzero(seeded & (cluster_area >= min_area_mm2))
+    keep = keep[np.argsort(-cluster_area[keep], kind='stable')]
+    if len(keep) == 0:
+        return [], vertex_label
+    remap = np.full(len(cluster_area), -1, dtype=np.int64)
+    remap[keep] = np.arange(len(keep))
+    labels = remap[labels]
+    vertex_label[ids] = labels
+    inside = labels >= 0
+    ids, labels, area = ids[inside], labels[inside], area[inside]
+
+    count = np.bincount(labels)
+    weight = np.bincount(labels, weights=area)
+    mean_of = lambda values: np.bincount(labels, weights=area * values) / weight
+    points = curvature['points'][ids]
+    centroid = np.stack([mean_of(points[:, k]) for k in range(3)], axis=1)
+    extent = np.zeros(len(keep))
+    np.maximum.at(extent, labels, np.linalg.norm(points - centroid[labels], axis=1))
+    mean_curvature = mean_of(0.5 * (curvature['k1'][ids] + curvature['k2'][ids]))
+    mean_si, mean_cv = mean_of(si[ids]), mean_of(cv[ids])
+    normal = np.stack([mean_of(curvature['normal'][ids, k]) for k in range(3)], axis=1)
+    normal /= np.maximum(np.linalg.norm(normal, axis=1, keepdims=True), 1e-12)
+
+    candidates = []
+    for index in range(len(keep)):
+        candidates.append({
+            'id': index, 'n_vertices': int(count[index]), 'cap_area_mm2': float(weight[index]),
+            'extent_mm': float(2.0 * extent[index]), 'radius_mm': float(1.0 / max(mean_curvature[index], 1e-6)),
+            'shape_index': float(mean_si[index]), 'curvedness': float(mean_cv[index]),
+            'centroid': centroid[index].tolist(), 'normal': normal[index].tolist(),
+        })
+    if graph is not None:
+        branch, arc_length, position, distance = graph.nearest(centroid)
+        for candidate, b, s, p, d in zip(candidates, branch, arc_length, position, distance):
+            candidate.update({'branch': int(b), 'arc_length_mm': float(s), 'centerline_point': p.tolist(), 'centerline_distance_mm': float(d)})
+            if graph.radius is not None:
+                candidate['lumen_radius_mm'] = float(graph.radius_at(s, b)[0])
+    return candidates, vertex_label
+
+@profiling.span('detect_polyps')
+def detect_polyps(mesh, graph=None, rings=2, shape_index_min=SHAPE_INDEX_MIN, grow_shape_index=GROW_SHAPE_INDEX,
+                  curvedness_range=CURVEDNESS_RANGE, min_area_mm2=MIN_AREA_MM2, chunk_size=8192):
+    """Polyp candidates on a colon surface mesh (e.g. from visualize.load_nifti_as_surface), in mm.
+
+    Returns (candidates, curvature, vertex_label); see surface_curvature and cluster_candidates.
+    """
+    curvature = surface_curvature(mesh, rings=rings, chunk_size=chunk_size)
+    candidates, vertex_label = cluster_candidates(curvature, graph, shape_index_min, grow_shape_index, curvedness_range, min_area_mm2)
+    return candidates, curvature, vertex_label
+
+def annotate(mesh, curvature, vertex_label):
+    """Copy of the mesh with ShapeIndex, Curvedness and Candidate point arrays for display."""
+    out = mesh.triangulate() if not mesh.is_all_triangles else mesh.copy()
+    out.point_data['ShapeIndex'] = curvature['shape_index'].astype(np.float32)
+    out.point_data['Curvedness'] = curvature['curvedness'].astype(np.float32)
+    out.point_data['Candidate'] = vertex_label.astype(np.int32)
+    return out
+
+def save_candidates(candidates, path, **settings):
+    with open(path, 'w') as f:
+        json.dump({'settings': settings, 'candidates': candidates}, f, indent=1)
+
+def print_candidates(candidates):
+    print(f"{'id':>4}{'area mm2':>10}{'extent mm':>11}{'radius mm':>11}{'SI':>7}{'arc mm':>9}{'axis mm':>9}")
+    for c in candidates:
+        arc = f"{c['arc_length_mm']:>9.1f}" if 'arc_length_mm' in c else f"{'-':>9}"
+        axis = f"{c['centerline_distance_mm']:>9.1f}" if 'centerline_distance_mm' in c else f"{'-':>9}"
+        print(f"{c['id']:>4}{c['cap_area_mm2']:>10.1f}{c['extent_mm']:>11.1f}{c['radius_mm']:>11.1f}{c['shape_index']:>7.2f}{arc}{axis}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find polyp candidates (cap-shaped regions) on a colon surface by shape index and curvedness.")
+    parser.add_argument("surface", help="Surface mesh (.vtp/.vtk/.stl) or label NIfTI, which is meshed with load_nifti_as_surface")
+    parser.add_argument("--smoothing-iterations", type=int, default=DETECTION_SMOOTHING, help="Smoothing of a NIfTI input's surface")
+    parser.add_argument("--centerline", help="centerline.vtp, to locate candidates by arc length and distance from the axis")
+    parser.add_argument("--output", default="polyp_candidates.json")
+    parser.add_argument("--annotated", help="Also write the surface with ShapeIndex/Curvedness/Candidate arrays (.vtp)")
+    parser.add_argument("--rings", type=int, default=2, help="Neighbourhood size of the curvature fit, in edge rings")
+    parser.add_argument("--shape-index-min", type=float, default=SHAPE_INDEX_MIN, help="Shape index that seeds a candidate")
+    parser.add_argument("--grow-shape-index", type=float, default=GROW_SHAPE_INDEX, help="Shape index a candidate grows through")
+    parser.add_argument("--curvedness", type=float, nargs=2, default=CURVEDNESS_RANGE, metavar=("MIN", "MAX"), help="Per mm")
+    parser.add_argument("--min-area", type=float, default=MIN_AREA_MM2, help="Smallest cap area kept, in mm^2")
+    args = parser.parse_args()
+
+    if args.surface.endswith(('.nii', '.nii.gz')):
+        import visualize
+        mesh = visualize.load_nifti_as_surface(args.surface, 0.5, n_iter=args.smoothing_iterations)
+    else:
+        mesh = pv.read(args.surface)
+    graph = None
+    if args.centerline:
+        import centerline_graph
+        graph = centerline_graph.CenterlineGraph.load(args.centerline)
+
+    start = time.perf_counter()
+    candidates, curvature, vertex_label = detect_polyps(mesh, graph, rings=args.rings, shape_index_min=args.shape_index_min,
+                                                        grow_shape_index=args.grow_shape_index, curvedness_range=tuple(args.curvedness), min_area_mm2=args.min_area)
+    print(f"{len(candidates)} candidates on {mesh.n_points} vertices in {time.perf_counter() - start:.2f}s")
+    print_candidates(candidates)
+    save_candidates(candidates, args.output, rings=args.rings, shape_index_min=args.shape_index_min,
+                    grow_shape_index=args.grow_shape_index, curvedness_range=list(args.curvedness), min_area_mm2=args.min_area)
+    print(f"Wrote {args.output}")
+    if args.annotated:
+        annotate(mesh, curvature, vertex_label).save(args.annotated)
+        print(f"Wrote {args.annotated}")
+    sys.exit(0)
@@ -0,0 +1,217 @@
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import tracemalloc
+from functools import wraps
+
+# Path of the JSON-lines log; set it (or call enable) to switch profiling on. Spawned workers inherit it.
+PROFILE_ENV = 'COLON_PROFILE'
+# Set to 1 (or pass track_allocations to enable) to also trace allocations, which slows the code being timed
+ALLOC_ENV = 'COLON_PROFILE_ALLOC'
+
+_enabled = False
+_log_file = None
+_track_allocations = False
+_lock = threading.Lock()
+_local = threading.local()
+
+def enable(log_file, track_allocations=False):
+    """Start writing span records to log_file, for this process and the worker processes it starts later.
+
+    By default spans record times and RSS only. With track_allocations, tracemalloc also records the peak
+    Python/NumPy allocation inside each span; tracing every allocation inflates the wall and CPU times, so use it
+    for memory runs rather than timing runs. Every record notes whether tracing was on.
+    """
+    global _enabled, _log_file, _track_allocations
+    _log_file = os.path.abspath(log_file)
+    _track_allocations = track_allocations
+    os.environ[PROFILE_ENV] = _log_file
+    if track_allocations:
+        os.environ[ALLOC_ENV] = '1'
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    else:
+        os.environ.pop(ALLOC_ENV, None)
+    _enabled = True
+
+def disable():
+    global _enabled, _track_allocations
+    _enabled = False
+    _track_allocations = False
+    os.environ.pop(PROFILE_ENV, None)
+    os.environ.pop(ALLOC_ENV, None)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def is_enabled():
+    return _enabled
+
+def current_rss_mb():
+    """Resident set size of this process in MB, or None when it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1 << 20)
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1 << 20)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far in MB, or None where the resource module is unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024.0
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def _write(record):
+    line = json.dumps(record, default=str) + '\n'
+    with _lock:
+        # One O_APPEND write per record keeps lines whole when several processes share the log
+        fd = os.open(_log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+class span:
+    """Named, nestable stage timer, used as `with span('meshing'):` or as a `@span('meshing')` decorator.
+
+    Each finished span appends one JSON line with its wall and CPU seconds, RSS at exit and its change, the process
+    peak RSS so far and, with allocation tracking, the peak of traced allocations above the level at entry. Nested
+    spans are recorded with their full path ('pipeline;mesh;extract_surface'). When profiling is disabled entering
+    and leaving a span only checks one flag.
+    """
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.active = False
+
+    def __enter__(self):
+        if not _enabled:
+            return self
+        self.active = True
+        stack = _stack()
+        if _track_allocations and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # Fold the parent's peak so far in before the peak counter is reset for this span
+                stack[-1].traced_peak = max(stack[-1].traced_peak, peak)
+            tracemalloc.reset_peak()
+            self.traced_start = self.traced_peak = current
+        self.path = ';'.join([s.name for s in stack] + [self.name])
+        stack.append(self)
+        self.rss_start = current_rss_mb()
+        self.start = time.time()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.active:
+            return False
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        self.active = False
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        rss = current_rss_mb()
+        record = {
+            'name': self.name, 'path': self.path, 'start': self.start, 'wall': wall, 'cpu': cpu,
+            'rss_mb': rss, 'rss_delta_mb': rss - self.rss_start if rss is not None and self.rss_start is not None else None,
+            'peak_rss_mb': peak_rss_mb(), 'pid': os.getpid(), 'thread': threading.get_ident(),
+            'status': 'error' if exc_type is not None else 'ok', 'track_allocations': _track_allocations, **self.fields,
+        }
+        if _track_allocations and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.traced_peak = max(self.traced_peak, peak)
+            record['alloc_peak_mb'] = (self.traced_peak - self.traced_start) / (1 << 20)
+            record['alloc_net_mb'] = (current - self.traced_start) / (1 << 20)
+            if stack:
+                stack[-1].traced_peak = max(stack[-1].traced_peak, self.traced_peak)
+        if exc_type is not None:
+            record['error'] = f"{exc_type.__name__}: {exc}"
+        _write(record)
+        return False
+
+    def __call__(self, function):
+        name, fields = self.name, self.fields
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with span(name, **fields):
+                return function(*args, **kwargs)
+        return wrapper
+
+def read_log(log_file):
+    with open(log_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def folded_stacks(records):
+    """Self wall time per span path in microseconds, in the folded format flamegraph.pl and speedscope read."""
+    inclusive, children = {}, {}
+    for record in records:
+        inclusive[record['path']] = inclusive.get(record['path'], 0.0) + record['wall']
+        parent = record['path'].rpartition(';')[0]
+        if parent:
+            children[parent] = children.get(parent, 0.0) + record['wall']
+    return {path: max(total - children.get(path, 0.0), 0.0) * 1e6 for path, total in inclusive.items()}
+
+def write_folded(records, path):
+    with open(path, 'w') as f:
+        for stack, micros in sorted(folded_stacks(records).items()):
+            f.write(f"{stack} {int(round(micros))}\n")
+
+def print_summary(records):
+    """Span tree with call count, total wall and CPU time, and the largest RSS growth and allocation peak seen."""
+    rows = {}
+    for record in records:
+        row = rows.setdefault(record['path'], {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'rss': None, 'alloc': None, 'errors': 0})
+        row['calls'] += 1
+        row['wall'] += record['wall']
+        row['cpu'] += record['cpu']
+        row['errors'] += record['status'] == 'error'
+        for key, field in (('rss', 'rss_delta_mb'), ('alloc', 'alloc_peak_mb')):
+            if record.get(field) is not None:
+                row[key] = max(row[key] if row[key] is not None else float('-inf'), record[field])
+    mb = lambda v: f"{v:>10.1f}" if v is not None else f"{'-':>10}"
+    print(f"{'span':<48}{'calls':>7}{'wall (s)':>10}{'cpu (s)':>10}{'+RSS MB':>10}{'alloc MB':>10}")
+    # Sort on the components so a child stays under its parent even when a sibling name (mesh-x) sorts before ';'
+    for path in sorted(rows, key=lambda p: p.split(';')):
+        row = rows[path]
+        depth = path.count(';')
+        label = '  ' * depth + path.rpartition(';')[2] + (f" ({row['errors']} failed)" if row['errors'] else '')
+        print(f"{label:<48}{row['calls']:>7}{row['wall']:>10.2f}{row['cpu']:>10.2f}{mb(row['rss'])}{mb(row['alloc'])}")
+
+if os.environ.get(PROFILE_ENV):
+    enable(os.environ[PROFILE_ENV], track_allocations=os.environ.get(ALLOC_ENV) == '1')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise a profiling JSON-lines log as a span tree or folded stacks.")
+    parser.add_argument("log_file")
+    parser.add_argument("--folded", help="Also write folded stacks (self time in microseconds) for flamegraph.pl or speedscope")
+    args = parser.parse_args()
+
+    records = read_log(args.log_file)
+    print_summary(records)
+    if args.folded:
+        write_folded(records, args.folded)
+        print(f"Wrote {args.folded}")
@@ -0,0 +1,126 @@
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+FRAME_PATTERN = 'frame_%06d.png'
+
+def frame_chunks(n_frames, n_chunks):
+    """Split frame indices into contiguous [start, stop) ranges, one per worker."""
+    bounds = np.linspace(0, n_frames, max(1, min(n_chunks, n_frames)) + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+def render_chunk(nifti_file, centerline_file, out_dir, frames, first_output, window_size=(640, 480), contour_value=0.5, fov=140,
+                 software=False):
+    """Render one contiguous run of path frames to PNG files numbered from first_output; returns (frames, seconds)."""
+    if software:
+        # Mesa's off-screen software rasteriser, for CPU nodes without a GPU or X server
+        os.environ.setdefault('VTK_DEFAULT_OPENGL_WINDOW', 'vtkOSOpenGLRenderWindow')
+    import pyvista as pv
+    import visualize
+    import camera_path
+
+    # Both come from their on-disk caches, which the parent process has already filled
+    mesh = visualize.load_nifti_as_surface(nifti_file, contour_value)
+    path = camera_path.CameraPath.from_centerline(centerline_file)
+
+    plotter = pv.Plotter(off_screen=True, window_size=list(window_size))
+    plotter.add_mesh(mesh, color=(240, 125, 100), opacity=1.0, specular=1.0, specular_power=100, smooth_shading=False)
+    plotter.camera.view_angle = fov
+
+    start = time.perf_counter()
+    for output, index in enumerate(frames, start=first_output):
+        position, direction, up = path.frame(index)
+        camera = plotter.camera
+        camera.SetPosition(*position)
+        camera.SetFocalPoint(*(position + direction * path.step))
+        camera.SetViewUp(*up)
+        plotter.renderer.ResetCameraClippingRange()
+        plotter.screenshot(os.path.join(out_dir, FRAME_PATTERN % output))
+    seconds = time.perf_counter() - start
+    plotter.close()
+    return len(frames), seconds
+
+def encode_video(out_dir, video_file, fps=30):
+    """Encode the PNG sequence with ffmpeg (H.264); returns False when ffmpeg is not on PATH."""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return False
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-framerate', str(fps), '-i', os.path.join(out_dir, FRAME_PATTERN),
+                    '-c:v', 'libx264', '-pix_fmt', 'yuv420p', video_file], check=True)
+    return True
+
+def render_flythrough(nifti_file, centerline_file, out_dir, workers=None, every=1, window_size=(640, 480), contour_value=0.5,
+                      fov=140, software=False):
+    """Render the whole endoluminal path off screen, split into contiguous chunks across worker processes.
+
+    Returns a summary with the frame count, wall time and throughput. Frames are written as out_dir/frame_NNNNNN.png
+    numbered in path order, so chunks can finish in any order and the sequence still encodes directly.
+    """
+    import visualize
+    import camera_path
+
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    # Build the mesh and path caches once here so the workers only load them
+    start = time.perf_counter()
+    visualize.load_nifti_as_surface(nifti_file, contour_value)
+    path = camera_path.CameraPath.from_centerline(centerline_file)
+    prepare = time.perf_counter() - start
+
+    indices = np.arange(0, path.n_frames, every)
+    chunks = frame_chunks(len(indices), workers)
+    start = time.perf_counter()
+    worker_fps = []
+    # Spawned workers each create their own render window instead of inheriting VTK state through fork
+    with ProcessPoolExecutor(max_workers=len(chunks), mp_context=mp.get_context('spawn')) as executor:
+        futures = [executor.submit(render_chunk, nifti_file, centerline_file, out_dir, indices[a:b].tolist(), a, window_size,
+                                   contour_value, fov, software) for a, b in chunks]
+        for future in as_completed(futures):
+            n, seconds = future.result()
+            worker_fps.append(n / seconds if seconds > 0 else 0.0)
+    wall = time.perf_counter() - start
+
+    return {
+        'frames': len(indices),
+        'workers': len(chunks),
+        'prepare_seconds': prepare,
+        'render_seconds': wall,
+        'fps': len(indices) / wall if wall > 0 else 0.0,
+        'fps_per_worker': float(np.mean(worker_fps)) if worker_fps else 0.0,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render an endoluminal flythrough off screen as PNG frames or a video.")
+    parser.add_argument("nifti_file")
+    parser.add_argument("centerline_file")
+    parser.add_argument("--out-dir", default="flythrough_frames")
+    parser.add_argument("--video", help="Encode the frames to this file (needs ffmpeg on PATH)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--every", type=int, default=1, help="Render every n-th path frame")
+    parser.add_argument("--size", default="640x480", help="Frame size as WIDTHxHEIGHT")
+    parser.add_argument("--fps", type=int, default=30, help="Frame rate of the encoded video")
+    parser.add_argument("--contour-value", type=float, default=0.5)
+    parser.add_argument("--software", action="store_true", help="Use OSMesa software rendering")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    summary = render_flythrough(args.nifti_file, args.centerline_file, args.out_dir, workers=args.workers, every=args.every,
+                                window_size=(width, height), contour_value=args.contour_value, software=args.software)
+    print(f"Rendered {summary['frames']} frames with {summary['workers']} workers in {summary['render_seconds']:.1f}s: "
+          f"{summary['fps']:.1f} fps overall, {summary['fps_per_worker']:.1f} fps per worker "
+          f"(mesh and path preparation {summary['prepare_seconds']:.1f}s)")
+
+    if args.video:
+        if encode_video(args.out_dir, args.video, fps=args.fps):
+            print(f"Wrote {args.video}")
+        else:
+            print(f"ffmpeg not found; the frames are in {args.out_dir}")
+            sys.exit(1)
@@ -0,0 +1,40 @@
+
+import numpy as np
+from scipy import ndimage
+import profiling
+
+@profiling.span('threshold_lumen')
+def threshold_lumen(hu, air_hu=-500.0):
+    """Gas-filled lumen of a CT colonography volume: air voxels in components that do not touch the volume border.
+
+    Air outside the body touches the border and is dropped, so no model is needed; meant for phantoms and quick
+    looks rather than clinical segmentation.
+    """
+    air = hu < air_hu
+    labels, n = ndimage.label(air)
+    border = np.unique(np.concatenate([labels[[0, -1]].ravel(), labels[:, [0, -1]].ravel(), labels[:, :, [0, -1]].ravel()]))
+    keep = np.ones(n + 1, dtype=bool)
+    keep[border] = False
+    keep[0] = False
+    return keep[labels].astype(np.uint8)
+
+def load_unet(model_file):
+    import tensorflow as tf
+    return tf.keras.models.load_model(model_file, compile=False)
+
+@profiling.span('unet_inference')
+def unet_inference(model, hu, batch_size=8):
+    """Slice-wise U-Net prediction on a HU volume (x-y-z order), preprocessed as predict.py does; returns a uint8 mask."""
+    import tensorflow as tf
+
+    height, width, channels = model.input_shape[1:4]
+    mask = np.zeros(hu.shape, dtype=np.uint8)
+    for k0 in range(0, hu.shape[2], batch_size):
+        x = hu[:, :, k0:k0 + batch_size].T  # (slices, ny, nx): each slice as the DICOM pixel_array the model was trained on
+        x = x - x.min(axis=(1, 2), keepdims=True)
+        x = x / np.maximum(x.max(axis=(1, 2), keepdims=True), 1e-6)
+        x = tf.image.resize(x[..., None], (height, width)).numpy()
+        y = model.predict(np.repeat(x, channels, axis=-1), verbose=0)[..., 0]
+        y = tf.image.resize(y[..., None], (hu.shape[1], hu.shape[0])).numpy()[..., 0] > 0.5
+        mask[:, :, k0:k0 + batch_size] = np.transpose(y, (2, 1, 0))
+    return mask
@@ -0,0 +1,182 @@
+
+import sys
+import time
+import numpy as np
+import pyvista as pv
+import scipy.sparse as sp
+from scipy import ndimage
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+from skimage.morphology import skeletonize
+import vtk
+import nifti_io
+import profiling
+
+# Half of the 26-neighbourhood; the other half is the same edges seen from the far end
+NEIGHBOUR_OFFSETS = np.array([(di, dj, dk) for di in (-1, 0, 1) for dj in (-1, 0, 1) for dk in (-1, 0, 1)
+                              if (di, dj, dk) > (0, 0, 0)])
+
+def label_mask(data, label_value, margin=1, chunk_slices=32):
+    """Boolean mask of voxels at or above label_value cropped to their bounding box, and the (i, j, k) offset of the crop."""
+    nz = data.shape[2]
+    in_x = np.zeros(data.shape[0], dtype=bool)
+    in_y = np.zeros(data.shape[1], dtype=bool)
+    in_z = np.zeros(nz, dtype=bool)
+    for k in range(0, nz, chunk_slices):
+        mask = data[:, :, k:k + chunk_slices] >= label_value
+        in_z[k:k + chunk_slices] = mask.any(axis=(0, 1))
+        in_y |= mask.any(axis=(0, 2))
+        in_x |= mask.any(axis=(1, 2))
+    if not in_z.any():
+        return None, None
+
+    # Keep a background margin so the distance transform and thinning see the object's outside
+    lo, hi = [], []
+    for hits, n in ((in_x, data.shape[0]), (in_y, data.shape[1]), (in_z, nz)):
+        idx = np.flatnonzero(hits)
+        lo.append(int(idx[0]))
+        hi.append(int(idx[-1]) + 1)
+    mask = np.pad(np.asarray(data[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]) >= label_value, margin)
+    return mask, np.array(lo) - margin
+
+def skeleton_graph(skeleton, spacing):
+    """Voxel coordinates of a skeleton and its 26-connected adjacency, weighted by the physical step length."""
+    coords = np.argwhere(skeleton)
+    index = np.full(np.array(skeleton.shape) + 2, -1, dtype=np.int32)
+    index[tuple((coords + 1).T)] = np.arange(len(coords), dtype=np.int32)
+
+    rows, cols, weights = [], [], []
+    for offset in NEIGHBOUR_OFFSETS:
+        neighbour = index[tuple((coords + 1 + offset).T)]
+        hit = neighbour >= 0
+        rows.append(np.flatnonzero(hit))
+        cols.append(neighbour[hit])
+        weights.append(np.full(np.count_nonzero(hit), np.linalg.norm(offset * spacing)))
+    rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+    graph = sp.csr_matrix((weights, (rows, cols)), shape=(len(coords), len(coords)))
+    return coords, graph + graph.T
+
+def longest_path(graph):
+    """Node ids along the longest shortest path of the largest connected component (double Dijkstra sweep)."""
+    n_components, labels = csgraph.connected_components(graph, directed=False)
+    largest = np.argmax(np.bincount(labels))
+    start = int(np.flatnonzero(labels == largest)[0])
+
+    distances = csgraph.dijkstra(graph, directed=False, indices=start)
+    distances[~np.isfinite(distances)] = -1
+    source = int(np.argmax(distances))
+
+    distances, predecessors = csgraph.dijkstra(graph, directed=False, indices=source, return_predecessors=True)
+    distances[~np.isfinite(distances)] = -1
+    node = int(np.argmax(distances))
+
+    path = [node]
+    while predecessors[node] >= 0:
+        node = int(predecessors[node])
+        path.append(node)
+    return np.array(path[::-1])
+
+def centerline_polydata(points, radius):
+    """Single polyline in the layout vmtkCenterlines writes, with MaximumInscribedSphereRadius per point."""
+    centerline = pv.PolyData(np.asarray(points, dtype=np.float64))
+    centerline.lines = np.concatenate([[len(points)], np.arange(len(points))])
+    centerline.point_data['MaximumInscribedSphereRadius'] = np.asarray(radius, dtype=np.float64)
+    return centerline
+
+@profiling.span('skeleton_centerline')
+def skeleton_centerline(data, spacing, label_value=1, smooth_window=5, verbose=False):
+    """Centerline of the labelled lumen from its distance transform and 3D thinning.
+
+    The skeleton is turned into a graph and its longest path kept as the centerline. Points are in the coordinate
+    frame of vtkNIFTIImageReader (spacing applied, origin at zero); the radius is the distance from the centerline
+    voxel to the nearest background voxel, less half a voxel so that it measures to the iso-surface.
+    """
+    spacing = np.asarray(spacing, dtype=np.float64)
+    timings = {}
+
+    start = time.perf_counter()
+    mask, offset = label_mask(data, label_value)
+    if mask is None:
+        raise ValueError(f"No voxels at or above label value {label_value}")
+    distance = ndimage.distance_transform_edt(mask, sampling=spacing).astype(np.float32)
+    timings['distance'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    skeleton = skeletonize(mask)
+    timings['thinning'] = time.perf_counter() - start
+    del mask
+
+    start = time.perf_counter()
+    coords, graph = skeleton_graph(skeleton, spacing)
+    path = coords[longest_path(graph)]
+    points = (path + offset) * spacing
+    radius = distance[tuple(path.T)] - 0.5 * spacing.min()
+    if smooth_window > 1 and len(points) > smooth_window:
+        points = ndimage.uniform_filter1d(points, smooth_window, axis=0, mode='nearest')
+        radius = ndimage.uniform_filter1d(radius, smooth_window, mode='nearest')
+    timings['graph'] = time.perf_counter() - start
+
+    if verbose:
+        print(f"Skeleton: {len(coords)} voxels, centerline {len(points)} points; " +
+              ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return centerline_polydata(points, np.maximum(radius, 0.0))
+
+def extract_centerline(nifti_file, output_centerline_file, label_value=1, smooth_window=5, verbose=False):
+    """Read a NIfTI segmentation, compute its skeleton centerline and write it as a .vtp polyline."""
+    data, spacing, _ = nifti_io.load_nifti_volume(nifti_file)
+    centerline = skeleton_centerline(data, spacing, label_value=label_value, smooth_window=smooth_window, verbose=verbose)
+    centerline.save(output_centerline_file)
+    return centerline
+
+def vmtk_centerline(nifti_file, source_point, target_point, label_value=1, reduction_factor=0.3,
+                    smoothing_iterations=20, relaxation_factor=0.1):
+    """The surface-based vmtkCenterlines path, seeded with the given end points so it runs without interaction."""
+    import vmtk.vmtkscripts as vmtk
+    import surface_extraction
+    import smoothing
+
+    surface = surface_extraction.extract_surface(nifti_io.read_nifti_image(nifti_file), label_value)
+    surface = smoothing.smooth_mesh(surface, n_iter=smoothing_iterations, relaxation_factor=relaxation_factor, boundary_smoothing=True)
+    decimate = vtk.vtkDecimatePro()
+    decimate.SetInputData(surface)
+    decimate.SetTargetReduction(reduction_factor)
+    decimate.PreserveTopologyOn()
+    decimate.Update()
+
+    centerline_filter = vmtk.vmtkCenterlines()
+    centerline_filter.Surface = decimate.GetOutput()
+    centerline_filter.SeedSelectorName = 'pointlist'
+    centerline_filter.SourcePoints = [float(v) for v in source_point]
+    centerline_filter.TargetPoints = [float(v) for v in target_point]
+    centerline_filter.Execute()
+    return pv.wrap(centerline_filter.Centerlines)
+
+def compare_with_vmtk(nifti_file, label_value=1, reference_file=None):
+    """Time the skeleton backend against vmtkCenterlines and report how far apart the two curves are."""
+    start = time.perf_counter()
+    data, spacing, _ = nifti_io.load_nifti_volume(nifti_file)
+    skeleton = skeleton_centerline(data, spacing, label_value=label_value, verbose=True)
+    print(f"Skeleton centerline: {time.perf_counter() - start:.2f}s, {skeleton.n_points} points")
+
+    reference = None
+    try:
+        start = time.perf_counter()
+        reference = vmtk_centerline(nifti_file, skeleton.points[0], skeleton.points[-1], label_value=label_value)
+        print(f"vmtk centerline: {time.perf_counter() - start:.2f}s, {reference.n_points} points")
+    except ImportError:
+        print("vmtk is not installed; skipping the vmtk timing")
+        if reference_file:
+            reference = pv.read(reference_file)
+            print(f"Comparing against {reference_file} instead")
+
+    if reference is not None and reference.n_points > 0:
+        distance, _ = cKDTree(reference.points).query(skeleton.points)
+        print(f"Distance to the reference centerline: mean {distance.mean():.2f} mm, max {distance.max():.2f} mm")
+    return skeleton
+
+if __name__ == "__main__":
+    nifti_file = sys.argv[1] if len(sys.argv) > 1 else 'new seg.nii.gz'
+    output_centerline_file = sys.argv[2] if len(sys.argv) > 2 else 'centerline_skeleton.vtp'
+    skeleton = compare_with_vmtk(nifti_file, reference_file='centerline.vtp')
+    skeleton.save(output_centerline_file)
+    print(f"Wrote {output_centerline_file}")
@@ -0,0 +1,120 @@
+
+import os
+import json
+import time
+import hashlib
+import vtk
+import pyvista as pv
+import mesh_cache
+import nifti_io
+import profiling
+
+# Bump when a stage's computation or stored layout changes so stale entries are ignored
+STAGE_CACHE_VERSION = 1
+
+def stage_key(name, params, input_keys):
+    """Key from the stage name, its own parameters and the keys of the stages it reads from."""
+    payload = json.dumps({'version': STAGE_CACHE_VERSION, 'stage': name, 'params': params, 'inputs': list(input_keys)},
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def write_polydata(polydata, path):
+    """Write a .vtp atomically so an interrupted run never leaves a truncated cache entry."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    writer = vtk.vtkXMLPolyDataWriter()
+    writer.SetFileName(tmp_path)
+    writer.SetInputData(polydata)
+    writer.SetDataModeToAppended()
+    writer.Write()
+    os.replace(tmp_path, path)
+
+def read_polydata(path):
+    reader = vtk.vtkXMLPolyDataReader()
+    reader.SetFileName(path)
+    reader.Update()
+    return pv.wrap(reader.GetOutput())
+
+class Stage:
+    """One pipeline step whose output is computed, or loaded from the cache, the first time it is asked for."""
+
+    def __init__(self, pipeline, name, params, inputs, compute, persist):
+        self.pipeline = pipeline
+        self.name = name
+        self.inputs = inputs
+        self.compute = compute
+        self.persist = persist
+        self.key = stage_key(name, params, [stage.key for stage in inputs])
+        self.path = os.path.join(pipeline.cache_dir, f"{name}_{self.key}.vtp")
+        self._value = None
+        self._done = False
+
+    def value(self):
+        if self._done:
+            return self._value
+        record = self.pipeline.records[self.name]
+        if self.persist and self.pipeline.use_cache and os.path.exists(self.path):
+            start = time.perf_counter()
+            with profiling.span(self.name, cache='hit'):
+                self._value = read_polydata(self.path)
+            record.update(status='hit', seconds=time.perf_counter() - start)
+        else:
+            # Upstream stages are resolved first so their time is not counted against this one
+            args = [stage.value() for stage in self.inputs]
+            start = time.perf_counter()
+            try:
+                with profiling.span(self.name, cache='computed'):
+                    self._value = self.compute(*args)
+            except Exception:
+                record.update(status='failed', seconds=time.perf_counter() - start)
+                raise
+            record.update(status='computed', seconds=time.perf_counter() - start)
+            if self.persist and self.pipeline.use_cache:
+                write_polydata(self._value, self.path)
+        if self.pipeline.verbose:
+            print(f"[{self.name}] {record['status']} in {record['seconds']:.2f}s")
+        self._done = True
+        return self._value
+
+class StagePipeline:
+    """Chain of stages keyed by content hash, persisted under <mesh cache dir>/stages.
+
+    Asking for the last stage's value pulls in only what is missing: a stage whose key is on disk is loaded, and the
+    stages above it are never run. Changing one stage's parameters changes its key and every key downstream of it.
+    """
+
+    def __init__(self, nifti_file, use_cache=True, verbose=False):
+        self.nifti_file = nifti_file
+        self.cache_dir = os.path.join(mesh_cache.cache_dir_for(nifti_file), 'stages')
+        self.use_cache = use_cache
+        self.verbose = verbose
+        self.records = {}
+
+    def _add(self, stage):
+        self.records[stage.name] = {'stage': stage.name, 'key': stage.key[:12], 'status': 'skipped', 'seconds': 0.0}
+        return stage
+
+    def source(self, name, load, params=None):
+        """The stage that reads the input file; keyed by the file's content hash and never persisted."""
+        stage = Stage(self, name, {'file': nifti_io.file_digest(self.nifti_file), **(params or {})}, [],
+                      lambda: load(self.nifti_file), persist=False)
+        return self._add(stage)
+
+    def stage(self, name, params, inputs, compute, persist=True):
+        return self._add(Stage(self, name, params, inputs, compute, persist))
+
+    def timings(self):
+        """Wall time per stage that ran or was loaded, in the shape extract_network_and_center_curves reports."""
+        return {name: record['seconds'] for name, record in self.records.items() if record['status'] != 'skipped'}
+
+    def report(self):
+        return list(self.records.values())
+
+def print_cache_report(records):
+    print(f"{'stage':<16}{'status':<10}{'time (s)':>10}  key")
+    for record in records:
+        print(f"{record['stage']:<16}{record['status']:<10}{record['seconds']:>10.2f}  {record['key']}")
+    hits = sum(record['status'] == 'hit' for record in records)
+    computed = sum(record['status'] == 'computed' for record in records)
+    skipped = sum(record['status'] == 'skipped' for record in records)
+    print(f"{hits} cache hits, {computed} stages computed, {skipped} skipped, {len(records) - hits - computed - skipped} failed")
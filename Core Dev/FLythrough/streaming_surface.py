@@ -0,0 +1,101 @@
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import nibabel as nib
+import nifti_io
+import surface_extraction
+
+def _write_npy(path, raw_path, dtype, shape, chunk_bytes=64 << 20):
+    """Turn a raw append-only file into a .npy file by streaming it behind a header."""
+    with open(path, 'wb') as out, open(raw_path, 'rb') as raw:
+        np.lib.format.write_array_header_1_0(out, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': shape})
+        while True:
+            chunk = raw.read(chunk_bytes)
+            if not chunk:
+                break
+            out.write(chunk)
+    os.remove(raw_path)
+
+def stream_surface(nifti_file, contour_value, out_dir=None, slab_slices=64, n_threads=None, method='marching_cubes', verbose=False):
+    """Marching cubes over z-slabs of a NIfTI file, appending triangles to disk as each slab finishes.
+
+    Slabs overlap by one slice; the vertices on each shared slice are merged with the previous slab's, so the result
+    equals a whole-volume run of the surface_extraction backend given by method. Peak memory is bounded by one slab plus
+    its surface. Returns memory-mapped (points, faces) arrays stored as points.npy and faces.npy in out_dir, which
+    the caller owns and removes. Without out_dir the files go to a temporary directory that is removed before
+    returning, so the arrays are read into memory instead. Coordinates follow vtkNIFTIImageReader: voxel spacing
+    applied, origin at zero.
+    """
+    if out_dir is None:
+        with tempfile.TemporaryDirectory(prefix='surface_') as tmp:
+            points, faces = stream_surface(nifti_file, contour_value, tmp, slab_slices, n_threads, method, verbose)
+            result = np.array(points), np.array(faces)
+            del points, faces
+            return result
+    os.makedirs(out_dir, exist_ok=True)
+    spacing = tuple(float(z) for z in nib.load(nifti_file).header.get_zooms()[:3])
+    tol = 1e-3 * spacing[2]
+
+    points_raw = os.path.join(out_dir, 'points.f32')
+    faces_raw = os.path.join(out_dir, 'faces.i64')
+    seam_keys = np.zeros(0, dtype=np.uint64)
+    seam_ids = np.zeros(0, dtype=np.int64)
+    seam_z = None
+    n_points = 0
+    n_faces = 0
+
+    with open(points_raw, 'wb') as points_file, open(faces_raw, 'wb') as faces_file:
+        for k0, slab in nifti_io.iter_nifti_slabs(nifti_file, slab_slices=slab_slices, overlap=1):
+            start = time.perf_counter()
+            image = nifti_io.array_to_image(slab, spacing, k0=k0)
+            surface = surface_extraction.extract_surface(image, contour_value, method=method, n_threads=n_threads,
+                                                         compute_normals=False)
+            points = np.asarray(surface.points, dtype=np.float32).reshape(-1, 3)
+            faces = np.asarray(surface.faces, dtype=np.int64).reshape(-1, 4)[:, 1:]
+
+            ids = np.full(len(points), -1, dtype=np.int64)
+            if seam_z is not None:
+                ids = surface_extraction.match_seam(seam_keys, seam_ids, points, seam_z, tol)
+            new = ids < 0
+            ids[new] = n_points + np.arange(np.count_nonzero(new))
+
+            points_file.write(np.ascontiguousarray(points[new]).tobytes())
+            faces_file.write(np.ascontiguousarray(ids[faces]).tobytes())
+            n_points += int(np.count_nonzero(new))
+            n_faces += len(faces)
+
+            # Vertices on this slab's last slice are shared with the next slab
+            seam_z = (k0 + slab.shape[2] - 1) * spacing[2]
+            on_seam = surface_extraction.seam_mask(points, seam_z, tol)
+            seam_keys = surface_extraction.xy_keys(points[on_seam])
+            seam_ids = ids[on_seam]
+
+            if verbose:
+                print(f"Slices {k0}-{k0 + slab.shape[2] - 1}: {len(faces)} triangles in {time.perf_counter() - start:.2f}s")
+
+    _write_npy(os.path.join(out_dir, 'points.npy'), points_raw, np.float32, (n_points, 3))
+    _write_npy(os.path.join(out_dir, 'faces.npy'), faces_raw, np.int64, (n_faces, 3))
+    return (np.load(os.path.join(out_dir, 'points.npy'), mmap_mode='r'),
+            np.load(os.path.join(out_dir, 'faces.npy'), mmap_mode='r'))
+
+def volume_bytes(nifti_file):
+    """Size of the decoded voxel block, read from the header only."""
+    img = nib.load(nifti_file)
+    return int(np.prod(img.shape)) * img.get_data_dtype().itemsize
+
+if __name__ == "__main__":
+    nifti_file = sys.argv[1] if len(sys.argv) > 1 else 'new seg.nii.gz'
+    contour_value = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='surface_') as out_dir:
+        points, faces = stream_surface(nifti_file, contour_value, out_dir, verbose=True)
+        print(f"{len(points)} points, {len(faces)} triangles in {time.perf_counter() - start:.2f}s")
+        del points, faces
+    try:
+        import resource
+        print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    except ImportError:
+        pass
@@ -0,0 +1,115 @@
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.spatial import cKDTree
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where the resource module is unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024.0
+
+def measure_backend(nifti_file, method, contour_value, n_threads, repeats, points_file):
+    """Run one backend in this (fresh) process; returns its timing and memory, and saves the vertices to points_file."""
+    import nifti_io
+    import surface_extraction
+
+    image = nifti_io.read_nifti_image(nifti_file)
+    baseline = peak_rss_mb()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        surface = surface_extraction.extract_surface(image, contour_value, method=method, n_threads=n_threads, compute_normals=False)
+        times.append(time.perf_counter() - start)
+    peak = peak_rss_mb()
+    np.save(points_file, np.asarray(surface.points, dtype=np.float32).reshape(-1, 3))
+    return {
+        'seconds': min(times),
+        'peak_mb': peak,
+        'extra_mb': peak - baseline if peak is not None else None,
+        'triangles': surface.n_cells,
+        'points': surface.n_points,
+    }
+
+def hausdorff(points, reference):
+    """Symmetric (max, mean) vertex-to-vertex distance between two point sets; (inf, inf) if either is empty."""
+    if len(points) == 0 or len(reference) == 0:
+        return float('inf'), float('inf')
+    forward = cKDTree(reference).query(points)[0]
+    backward = cKDTree(points).query(reference)[0]
+    return float(max(forward.max(), backward.max())), float(0.5 * (forward.mean() + backward.mean()))
+
+def run_benchmark(nifti_files, methods=None, reference='marching_cubes', contour_value=0.5, n_threads=None, repeats=3, verbose=True):
+    """Time every backend on every volume, each in its own spawned process so peak memory is per backend.
+
+    Returns one result dict per (volume, backend) with time, peak and extra memory over the loaded volume, triangle
+    count and the Hausdorff distance to the reference backend's surface of the same volume.
+    """
+    import surface_extraction
+
+    methods = list(methods or surface_extraction.BACKENDS)
+    if reference not in methods:
+        methods.insert(0, reference)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='surface_benchmark_') as tmp:
+        for nifti_file in nifti_files:
+            points = {}
+            for method in methods:
+                points_file = os.path.join(tmp, f'{method}.npy')
+                # A new process per run so ru_maxrss is not inflated by the backends before it
+                with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as executor:
+                    try:
+                        result = executor.submit(measure_backend, nifti_file, method, contour_value, n_threads, repeats, points_file).result()
+                    except Exception as error:
+                        result = {'error': f'{type(error).__name__}: {error}'}
+                result.update(file=nifti_file, method=method)
+                if 'error' not in result:
+                    points[method] = np.load(points_file)
+                results.append(result)
+
+            for result in results[-len(methods):]:
+                if result['method'] in points and reference in points:
+                    result['hausdorff'], result['mean_distance'] = hausdorff(points[result['method']], points[reference])
+            if verbose:
+                print_results(results[-len(methods):], reference)
+    return results
+
+def print_results(results, reference):
+    print(f"== {results[0]['file']} (distances to {reference})")
+    print(f"{'backend':<24} {'time (s)':>9} {'peak MB':>9} {'extra MB':>9} {'triangles':>10} {'hausdorff':>10} {'mean dist':>10}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['method']:<24} failed: {r['error']}")
+            continue
+        mb = lambda v: f"{v:>9.0f}" if v is not None else f"{'-':>9}"
+        print(f"{r['method']:<24} {r['seconds']:>9.3f} {mb(r['peak_mb'])} {mb(r['extra_mb'])} {r['triangles']:>10} "
+              f"{r.get('hausdorff', float('nan')):>10.3f} {r.get('mean_distance', float('nan')):>10.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the surface extraction backends on the same volumes.")
+    parser.add_argument("nifti_files", nargs='*', default=['new seg.nii.gz'])
+    parser.add_argument("--methods", nargs='+', help="Backends to run (default: all registered)")
+    parser.add_argument("--reference", default='marching_cubes', help="Backend the Hausdorff distances are measured to")
+    parser.add_argument("--contour-value", type=float, default=0.5)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.nifti_files, methods=args.methods, reference=args.reference, contour_value=args.contour_value,
+                            n_threads=args.threads, repeats=args.repeats)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if any('error' in r for r in results) else 0)
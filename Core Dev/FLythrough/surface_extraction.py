@@ -0,0 +1,232 @@
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pyvista as pv
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+import mesh_cache
+import profiling
+
+def label_bounding_box(image, contour_value, margin=2, chunk_slices=32):
+    """Voxel extent (i0, i1, j0, j1, k0, k1) of the voxels at or above contour_value, grown by margin; None if empty."""
+    nx, ny, nz = image.GetDimensions()
+    x0, _, y0, _, z0, _ = image.GetExtent()
+    values = vtk_to_numpy(image.GetPointData().GetScalars()).reshape(nz, ny, nx)
+
+    # Project the mask onto each axis slab by slab so no full-size boolean volume is allocated
+    in_x = np.zeros(nx, dtype=bool)
+    in_y = np.zeros(ny, dtype=bool)
+    in_z = np.zeros(nz, dtype=bool)
+    for k in range(0, nz, chunk_slices):
+        mask = values[k:k + chunk_slices] >= contour_value
+        in_z[k:k + chunk_slices] = mask.any(axis=(1, 2))
+        in_y |= mask.any(axis=(0, 2))
+        in_x |= mask.any(axis=(0, 1))
+
+    if not in_z.any():
+        return None
+
+    def _span(hits, n, offset):
+        idx = np.flatnonzero(hits)
+        return offset + max(int(idx[0]) - margin, 0), offset + min(int(idx[-1]) + margin, n - 1)
+
+    return (*_span(in_x, nx, x0), *_span(in_y, ny, y0), *_span(in_z, nz, z0))
+
+def crop_image(image, extent):
+    """Sub-volume of image over a voxel extent; origin and spacing are kept so world coordinates do not change."""
+    voi = vtk.vtkExtractVOI()
+    voi.SetInputData(image)
+    voi.SetVOI(*extent)
+    voi.Update()
+    return voi.GetOutput()
+
+def slab_bounds(k0, k1, n_slabs):
+    """Split [k0, k1] into slabs that share their boundary slice, each at least two slices thick."""
+    n_slabs = max(1, min(n_slabs, k1 - k0))
+    return np.unique(np.linspace(k0, k1, n_slabs + 1).round().astype(int))
+
+def xy_keys(points):
+    """Exact 64-bit key from the float32 bit patterns of x and y."""
+    bits = np.ascontiguousarray(points[:, :2], dtype=np.float32).view(np.uint32)
+    return (bits[:, 0].astype(np.uint64) << np.uint64(32)) | bits[:, 1].astype(np.uint64)
+
+def seam_mask(points, z, tol):
+    return np.abs(points[:, 2] - z) <= tol
+
+def match_seam(seam_keys, seam_ids, points, z, tol):
+    """Global id of the identical seam vertex from the previous slab for each point, or -1."""
+    matched = np.full(len(points), -1, dtype=np.int64)
+    on_seam = np.flatnonzero(seam_mask(points, z, tol))
+    if len(on_seam) == 0 or len(seam_keys) == 0:
+        return matched
+
+    order = np.argsort(seam_keys)
+    sorted_keys = seam_keys[order]
+    keys = xy_keys(points[on_seam])
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    hit = sorted_keys[pos] == keys
+    matched[on_seam[hit]] = seam_ids[order[pos[hit]]]
+    return matched
+
+def stitch_slabs(pieces, seam_zs, tol):
+    """Merge per-slab (points, faces) into one mesh, sharing the vertices that lie on each seam plane."""
+    all_points, all_faces = [], []
+    seam_keys = np.zeros(0, dtype=np.uint64)
+    seam_ids = np.zeros(0, dtype=np.int64)
+    n_points = 0
+
+    for s, (points, faces) in enumerate(pieces):
+        ids = np.full(len(points), -1, dtype=np.int64)
+        if s > 0:
+            ids = match_seam(seam_keys, seam_ids, points, seam_zs[s - 1], tol)
+        new = ids < 0
+        ids[new] = n_points + np.arange(np.count_nonzero(new))
+        n_points += np.count_nonzero(new)
+
+        all_points.append(points[new])
+        all_faces.append(ids[faces])
+
+        if s < len(seam_zs):
+            on_seam = seam_mask(points, seam_zs[s], tol)
+            seam_keys = xy_keys(points[on_seam])
+            seam_ids = ids[on_seam]
+
+    if n_points == 0:
+        return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.int64)
+    return np.concatenate(all_points), np.concatenate(all_faces)
+
+# Surface extraction backends by name; each takes (cropped image, contour value, thread count) and returns PolyData
+BACKENDS = {}
+
+def register_backend(name):
+    """Decorator adding a backend function to BACKENDS under name."""
+    def register(function):
+        BACKENDS[name] = function
+        return function
+    return register
+
+def _run_contour_filter(contour_filter, image, contour_value):
+    contour_filter.SetInputData(image)
+    contour_filter.SetValue(0, contour_value)
+    contour_filter.ComputeNormalsOff()
+    contour_filter.ComputeScalarsOff()
+    contour_filter.Update()
+    return contour_filter.GetOutput()
+
+def _marching_cubes(image, contour_value):
+    return _run_contour_filter(vtk.vtkMarchingCubes(), image, contour_value)
+
+def _flying_edges(image, contour_value):
+    return _run_contour_filter(vtk.vtkFlyingEdges3D(), image, contour_value)
+
+def set_vtk_threads(n_threads):
+    """Route vtkSMPTools (used by flying edges) through native threads with the given thread count."""
+    smp = vtk.vtkSMPTools()
+    if hasattr(smp, 'SetBackend'):
+        smp.SetBackend('STDThread')
+    smp.Initialize(n_threads)
+
+@register_backend('marching_cubes')
+def marching_cubes_backend(image, contour_value, n_threads):
+    """vtkMarchingCubes over z-slabs in a thread pool, with the seam vertices merged."""
+    extent = image.GetExtent()
+    bounds = slab_bounds(extent[4], extent[5], n_threads)
+    slabs = [crop_image(image, (*extent[:4], k0, k1)) for k0, k1 in zip(bounds[:-1], bounds[1:])]
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        outputs = list(executor.map(lambda slab: pv.wrap(_marching_cubes(slab, contour_value)), slabs))
+
+    pieces = [(np.asarray(out.points), np.asarray(out.faces).reshape(-1, 4)[:, 1:]) for out in outputs]
+    origin_z, spacing_z = image.GetOrigin()[2], image.GetSpacing()[2]
+    seam_zs = origin_z + bounds[1:-1] * spacing_z
+    points, faces = stitch_slabs(pieces, seam_zs, tol=1e-3 * spacing_z)
+    return mesh_cache.arrays_to_mesh(points, faces)
+
+@register_backend('flying_edges')
+def flying_edges_backend(image, contour_value, n_threads):
+    """Multi-threaded vtkFlyingEdges3D over the whole box."""
+    set_vtk_threads(n_threads)
+    return pv.wrap(_flying_edges(image, contour_value))
+
+@register_backend('discrete_marching_cubes')
+def discrete_marching_cubes_backend(image, contour_value, n_threads):
+    """vtkDiscreteMarchingCubes around one label value.
+
+    The filter meshes voxels equal to its value, so a contour value between labels selects the next label up:
+    0.5 on a 0/1 mask meshes label 1, as the other backends do.
+    """
+    return pv.wrap(_run_contour_filter(vtk.vtkDiscreteMarchingCubes(), image, float(np.ceil(contour_value))))
+
+@register_backend('skimage')
+def skimage_backend(image, contour_value, n_threads):
+    """scikit-image's Lewiner marching cubes on the voxel array, mapped to VTK world coordinates."""
+    from skimage.measure import marching_cubes
+
+    nx, ny, nz = image.GetDimensions()
+    x0, _, y0, _, z0, _ = image.GetExtent()
+    values = vtk_to_numpy(image.GetPointData().GetScalars()).reshape(nz, ny, nx)
+    spacing, origin = np.array(image.GetSpacing()), np.array(image.GetOrigin())
+    try:
+        verts, faces, _, _ = marching_cubes(values, level=contour_value, spacing=tuple(spacing[::-1]), allow_degenerate=False)
+    except (ValueError, RuntimeError):
+        # Raised when the level is outside the volume's range, i.e. there is no surface
+        return pv.PolyData()
+    points = verts[:, ::-1] + origin + np.array([x0, y0, z0]) * spacing
+    # skimage winds triangles the opposite way to VTK's filters
+    return mesh_cache.arrays_to_mesh(points.astype(np.float32), faces[:, ::-1])
+
+@profiling.span('extract_surface')
+def extract_surface(image, contour_value, method='marching_cubes', margin=2, n_threads=None, compute_normals=True):
+    """Iso-surface of image at contour_value, cropped to the label's bounding box, with the named backend.
+
+    method is a key of BACKENDS: 'marching_cubes' splits the box into z-slabs that run vtkMarchingCubes in a thread
+    pool and stitches the seams, 'flying_edges' runs the multi-threaded vtkFlyingEdges3D, 'discrete_marching_cubes'
+    meshes one label with vtkDiscreteMarchingCubes and 'skimage' uses scikit-image's marching cubes.
+    """
+    if method not in BACKENDS:
+        raise ValueError(f"Unknown surface extraction method: {method} (available: {', '.join(BACKENDS)})")
+    n_threads = n_threads or os.cpu_count() or 1
+    extent = label_bounding_box(image, contour_value, margin=margin)
+    if extent is None:
+        return pv.PolyData()
+    surface = pv.wrap(BACKENDS[method](crop_image(image, extent), contour_value, n_threads))
+
+    if compute_normals and surface.n_points > 0:
+        surface = surface.compute_normals(cell_normals=False, split_vertices=False, consistent_normals=False)
+    return surface
+
+def benchmark_extraction(image, contour_value, method='marching_cubes', thread_counts=None, repeats=3):
+    """Print wall time, speedup and parallel efficiency of extract_surface for each thread count."""
+    cores = os.cpu_count() or 1
+    thread_counts = thread_counts or sorted({1, 2, 4, 8, 16, cores} & set(range(1, cores + 1)))
+
+    start = time.perf_counter()
+    full = _marching_cubes(image, contour_value)
+    reference_time = time.perf_counter() - start
+    print(f"Uncropped single-threaded vtkMarchingCubes: {reference_time:.3f}s, {full.GetNumberOfCells()} triangles")
+
+    print(f"{'threads':>8} {'time (s)':>10} {'speedup':>8} {'efficiency':>10} {'triangles':>10}")
+    baseline = None
+    for n in thread_counts:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            surface = extract_surface(image, contour_value, method=method, n_threads=n, compute_normals=False)
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        baseline = baseline or best
+        print(f"{n:>8} {best:>10.3f} {baseline / best:>8.2f} {baseline / best / n:>10.2f} {surface.n_cells:>10}")
+
+if __name__ == "__main__":
+    nifti_file = sys.argv[1] if len(sys.argv) > 1 else 'new seg.nii.gz'
+    contour_value = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+
+    reader = vtk.vtkNIFTIImageReader()
+    reader.SetFileName(nifti_file)
+    reader.Update()
+
+    for method in ('marching_cubes', 'flying_edges'):
+        print(f"== {method} on {nifti_file} at {contour_value} ({os.cpu_count()} cores)")
+        benchmark_extraction(reader.GetOutput(), contour_value, method=method)
@@ -0,0 +1,85 @@
+
+import os
+import sys
+import json
+import time
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import pipeline
+import phantom
+
+# Task functions are looked up by module name in the spawned workers, so they live at module level
+
+def write_inputs(inputs, out_dir, params, n_threads):
+    # The source task's params hold the case's path, so every case gets its own outputs and store keys
+    with open(os.path.join(out_dir, 'inputs.json'), 'w') as f:
+        json.dump({'inputs': sorted(inputs), 'params': params}, f)
+
+def slow_write_inputs(inputs, out_dir, params, n_threads):
+    # Still running when a crash task that started after it dies
+    time.sleep(1.0)
+    write_inputs(inputs, out_dir, params, n_threads)
+
+def crash(inputs, out_dir, params, n_threads):
+    # Dies like an OOM kill or a segfault would: no exception reaches the pool
+    time.sleep(0.2)
+    os._exit(1)
+
+def make_case(directory, name, crashes):
+    path = os.path.join(directory, f'{name}.nii.gz')
+    with open(path, 'wb') as f:
+        f.write(name.encode())
+    case = pipeline.Case(path)
+    write = write_inputs if crashes else slow_write_inputs
+    case.tasks = {
+        'segmentation': pipeline.Task(write, (), cpu=1, memory_gb=0.1, gpu=0),
+        'mesh': pipeline.Task(crash if crashes else write, ('segmentation',), cpu=1, memory_gb=0.1, gpu=0),
+        'render_assets': pipeline.Task(write, ('mesh',), cpu=1, memory_gb=0.1, gpu=0),
+        'centerline': pipeline.Task(write, ('segmentation',), cpu=1, memory_gb=0.1, gpu=0),
+    }
+    return case
+
+def run(tmp_path, cpus):
+    cases = [make_case(str(tmp_path), name, name.startswith('crash')) for name in ('crash_a', 'ok', 'crash_b')]
+    store = str(tmp_path / 'store')
+    return pipeline.Scheduler(store, cpus=cpus, memory_gb=1.0).run(cases), store
+
+def test_worker_crash_fails_only_the_crashed_task(tmp_path):
+    records, store = run(tmp_path, cpus=1)
+    for name in ('crash_a', 'crash_b'):
+        assert records[name]['mesh']['status'] == 'failed'
+        assert 'BrokenProcessPool' in records[name]['mesh']['error']
+        assert records[name]['render_assets']['status'] == 'skipped'
+        assert records[name]['segmentation']['status'] == 'computed'
+        assert records[name]['centerline']['status'] == 'computed'
+    assert all(record['status'] == 'computed' for record in records['ok'].values())
+    assert not [d for _, dirs, _ in os.walk(store) for d in dirs if '.tmp.' in d]
+
+def test_worker_crash_with_parallel_workers_fails_only_the_crashed_task(tmp_path):
+    records, _ = run(tmp_path, cpus=2)
+    for name in ('crash_a', 'crash_b'):
+        assert records[name]['mesh']['status'] == 'failed'
+        assert 'BrokenProcessPool' in records[name]['mesh']['error']
+        assert records[name]['render_assets']['status'] == 'skipped'
+        assert records[name]['segmentation']['status'] == 'computed'
+        assert records[name]['centerline']['status'] == 'computed'
+    # Tasks that merely shared the pool with a crash are retried, not failed
+    assert all(record['status'] == 'computed' for record in records['ok'].values())
+
+def test_find_cases_registers_only_directories_with_dicom_files(tmp_path):
+    hu = np.full((8, 6, 3), -1000.0)
+    phantom.write_dicom_series(hu, (1.0, 1.0, 2.0), str(tmp_path / 'dicom'))
+    # A longer series below it, which would win the largest-series pick if the parent indexed it
+    phantom.write_dicom_series(np.full((8, 6, 5), -1000.0), (1.0, 1.0, 2.0), str(tmp_path / 'dicom' / 'other'))
+    phantom.save_nifti(np.zeros((8, 6, 3), dtype=np.uint8), (1.0, 1.0, 2.0), str(tmp_path / 'labels.nii.gz'))
+    (tmp_path / 'polyps.json').write_text('[]')
+    (tmp_path / 'notes').mkdir()
+    (tmp_path / 'notes' / 'README.txt').write_text('not a series')
+
+    cases = pipeline.find_cases([str(tmp_path)])
+    assert sorted(cases) == sorted(str(tmp_path / p) for p in ('labels.nii.gz', 'dicom', 'dicom/other'))
+
+    assert [os.path.basename(p) for p in pipeline.dicom_files(str(tmp_path / 'dicom'))] == [f'slice_{k:04d}.dcm' for k in range(3)]
+    pipeline.index_dicom({}, str(tmp_path), {'path': str(tmp_path / 'dicom')}, 1)
+    with open(tmp_path / 'index.json') as f:
+        assert json.load(f)['files'] == [f'slice_{k:04d}.dcm' for k in range(3)]
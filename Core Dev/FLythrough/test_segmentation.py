@@ -0,0 +1,57 @@
+
+import os
+import sys
+import types
+import numpy as np
+from scipy import ndimage
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import segmentation
+
+class Resized:
+    def __init__(self, array):
+        self.array = array
+
+    def numpy(self):
+        return self.array
+
+def resize(images, size):
+    # Bilinear like tf.image.resize, on (batch, height, width, channels)
+    images = np.asarray(images, dtype=np.float32)
+    zoom = (1, size[0] / images.shape[1], size[1] / images.shape[2], 1)
+    return Resized(ndimage.zoom(images, zoom, order=1))
+
+class StubModel:
+    """Non-square U-Net stand-in: records what it is fed and predicts the normalised intensity itself."""
+
+    def __init__(self, height, width):
+        self.input_shape = (None, height, width, 1)
+        self.seen = []
+
+    def predict(self, x, verbose=0):
+        assert x.shape[1:] == self.input_shape[1:]
+        self.seen.append(x[..., 0])
+        return x
+
+def test_unet_inference_feeds_pixel_array_slices_and_keeps_orientation(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'tensorflow', types.SimpleNamespace(image=types.SimpleNamespace(resize=resize)))
+    nx, ny, nz = 64, 48, 5
+    hu = np.full((nx, ny, nz), -1000.0)
+    hu[10:30, 5:15] = 0.0  # bright block off the diagonal, so a transpose would move it
+    hu[:, :, 0] += np.arange(nx)[:, None]  # each slice needs its own range for the per-slice normalisation
+    model = StubModel(ny, nx)
+    mask = segmentation.unet_inference(model, hu, batch_size=2)
+    assert mask.shape == hu.shape
+    seen = np.concatenate(model.seen)
+    for k in range(nz):
+        # DICOM pixel_array order is (rows, columns) = (y, x), the transpose of the x-y-z volume
+        expected = hu[:, :, k].T - hu[:, :, k].min()
+        np.testing.assert_allclose(seen[k], expected / expected.max(), atol=1e-6)
+    np.testing.assert_array_equal(mask[:, :, 1:], (hu[:, :, 1:] == 0.0).astype(np.uint8))
+
+def test_unet_inference_resizes_back_to_the_volume_grid(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'tensorflow', types.SimpleNamespace(image=types.SimpleNamespace(resize=resize)))
+    hu = np.full((64, 48, 3), -1000.0)
+    hu[16:48, 12:36] = 0.0
+    mask = segmentation.unet_inference(StubModel(32, 32), hu)
+    assert mask.shape == hu.shape
+    assert mask[32, 24].all() and not mask[2, 2].any()
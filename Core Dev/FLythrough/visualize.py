@@ -1,27 +1,67 @@
 
+import tempfile
 import pyvista as pv
 import vtk
 import numpy as np
 from scipy.ndimage import gaussian_filter1d
+import nifti_io
+import mesh_cache
+import smoothing
+import lod
+import surface_extraction
+import streaming_surface
 
-def load_nifti_as_surface(nifti_file, contour_value, n_iter=50, relaxation_factor=0.5):
-        reader = vtk.vtkNIFTIImageReader()
-        reader.SetFileName(nifti_file)
-        reader.Update()
-
-        marching_cubes = vtk.vtkMarchingCubes()
-        marching_cubes.SetInputConnection(reader.GetOutputPort())
-        marching_cubes.SetValue(0, contour_value)
-        marching_cubes.Update()
-    
-        output = marching_cubes.GetOutput()
-        if output.GetNumberOfPoints() == 0:
+# Volumes whose decoded voxels exceed this many bytes are meshed slab by slab from disk
+STREAMING_THRESHOLD = 1 << 30
+
+def load_nifti_as_surface(nifti_file, contour_value, n_iter=50, relaxation_factor=0.5, use_cache=True, streaming=None,
+                          method='marching_cubes'):
+    """Smoothed iso-surface of a NIfTI file; method names a surface_extraction backend.
+
+    Streaming bounds the memory of meshing only: the returned mesh, and its smoothing, still has to fit in RAM.
+    """
+    params = {
+        'algorithm': method,
+        'contour_value': contour_value,
+        'n_iter': n_iter,
+        'relaxation_factor': relaxation_factor,
+        'ordering': smoothing.DEFAULT_ORDERING,
+    }
+
+    def build():
+        use_streaming = streaming if streaming is not None else streaming_surface.volume_bytes(nifti_file) > STREAMING_THRESHOLD
+        if use_streaming:
+            # The slab files live only until the mesh has its own copy of the arrays
+            with tempfile.TemporaryDirectory(prefix='surface_') as out_dir:
+                points, faces = streaming_surface.stream_surface(nifti_file, contour_value, out_dir, method=method)
+                surface = mesh_cache.arrays_to_mesh(np.array(points), faces)
+                del points, faces
+            if surface.n_points > 0:
+                surface = surface.compute_normals(cell_normals=False, split_vertices=False, consistent_normals=False)
+        else:
+            surface = surface_extraction.extract_surface(nifti_io.read_nifti_image(nifti_file), contour_value, method=method)
+        if surface.n_points == 0:
             print(f"Warning: No surface was created with contour value {contour_value}.")
             return None
 
-        surface = pv.wrap(output)
-        smoothed_surface = surface.smooth(n_iter=n_iter, relaxation_factor=relaxation_factor)
-        return smoothed_surface
+        return smoothing.smooth_mesh(surface, n_iter=n_iter, relaxation_factor=relaxation_factor)
+
+    if not use_cache:
+        return build()
+    return mesh_cache.cached_surface(nifti_file, params, build)
+
+def load_nifti_as_lod(nifti_file, contour_value, n_iter=50, relaxation_factor=0.5, reductions=lod.LOD_REDUCTIONS,
+                      method='marching_cubes'):
+    params = {
+        'algorithm': method,
+        'contour_value': contour_value,
+        'n_iter': n_iter,
+        'relaxation_factor': relaxation_factor,
+        'ordering': smoothing.DEFAULT_ORDERING,
+    }
+    load_full = lambda: load_nifti_as_surface(nifti_file, contour_value, n_iter=n_iter, relaxation_factor=relaxation_factor,
+                                              method=method)
+    return lod.cached_pyramid(nifti_file, params, load_full, reductions)
 
 def smooth_centerline_points(points, sigma=5):
     smoothed_points = gaussian_filter1d(points, sigma=sigma, axis=0)
@@ -0,0 +1,50 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FLythrough'))
+import time
+import argparse
+import pipeline
+import profiling
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run DICOM index -> volume -> segmentation -> post-processing -> mesh/centerline -> camera path -> "
+                                                 "render assets and polyp candidates for many cases, skipping every task whose inputs have not changed.")
+    parser.add_argument("inputs", nargs="+", help="DICOM directories, segmentation .nii/.nii.gz files (which start at post-processing), "
+                                                  "directories of either, or manifest files (.txt/.csv, one path per line)")
+    parser.add_argument("--out-dir", default="pipeline_out", help="Writes <out-dir>/<case>.json; task outputs go to <out-dir>/store")
+    parser.add_argument("--store", help="Content-addressed task store shared between runs (default <out-dir>/store)")
+    parser.add_argument("--cpus", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--memory-gb", type=float, default=None, help="Memory budget (default: what is available now)")
+    parser.add_argument("--gpus", type=int, default=0, help="GPUs for U-Net segmentation")
+    parser.add_argument("--segmenter", choices=("threshold", "unet"), default="threshold")
+    parser.add_argument("--model", help="U-Net .h5 model for --segmenter unet")
+    parser.add_argument("--closing-radius", type=float, default=0, help="Morphological closing of the mask, in voxels")
+    parser.add_argument("--mesh-method", default="flying_edges")
+    parser.add_argument("--centerline-backend", choices=("vmtk", "skeleton"), default="skeleton")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every task instead of reusing stored outputs")
+    parser.add_argument("--profile", help="Append per-stage time and memory records to this JSON-lines log")
+    parser.add_argument("--profile-memory", action="store_true", help="With --profile, also trace allocation peaks (slows the run)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable(args.profile, track_allocations=args.profile_memory)
+
+    params = {
+        'segmentation': {'segmenter': args.segmenter, 'model': args.model},
+        'postprocess': {'closing_radius': args.closing_radius},
+        'mesh': {'method': args.mesh_method},
+        'polyp_candidates': {'method': args.mesh_method},
+        'centerline': {'backend': args.centerline_backend},
+    }
+    cases = pipeline.make_cases(pipeline.find_cases(args.inputs), params)
+    print(f"{len(cases)} cases, {args.cpus} CPUs, {args.gpus} GPUs")
+    scheduler = pipeline.Scheduler(args.store or os.path.join(args.out_dir, 'store'), cpus=args.cpus, memory_gb=args.memory_gb,
+                                   gpus=args.gpus, use_cache=not args.no_cache, verbose=args.verbose)
+    start = time.perf_counter()
+    records = scheduler.run(cases)
+    pipeline.write_case_summaries(records, cases, args.out_dir)
+    pipeline.print_report(records)
+    print(f"Finished in {time.perf_counter() - start:.1f}s")
+    if args.profile:
+        profiling.print_summary(profiling.read_log(args.profile))
+    sys.exit(1 if any(r['status'] in ('failed', 'skipped') for tasks in records.values() for r in tasks.values()) else 0)
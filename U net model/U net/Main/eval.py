@@ -11,6 +11,10 @@ from tensorflow.keras.utils import CustomObjectScope
 from sklearn.metrics import accuracy_score, f1_score, jaccard_score, precision_score, recall_score
 from metrics import dice_loss, dice_coef, iou
 from train import load_data
+import sys
+# profiling.py lives in Core Dev/FLythrough
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Core Dev", "FLythrough"))
+import profiling
 
 H = 512
 W = 512
@@ -61,25 +65,28 @@ if __name__ == "__main__":
         name = os.path.basename(x).split(".")[0]
 
         """ Reading the image """
-        image = cv2.imread(x, cv2.IMREAD_COLOR)
-        x = image/255.0
-        x = np.expand_dims(x, axis=0)
+        with profiling.span("read_image"):
+            image = cv2.imread(x, cv2.IMREAD_COLOR)
+            x = image/255.0
+            x = np.expand_dims(x, axis=0)
 
-        """ Reading the mask """
-        mask = cv2.imread(y, cv2.IMREAD_GRAYSCALE)
-        y = mask/255.0
-        y = y > 0.5
-        y = y.astype(np.int32)
+            """ Reading the mask """
+            mask = cv2.imread(y, cv2.IMREAD_GRAYSCALE)
+            y = mask/255.0
+            y = y > 0.5
+            y = y.astype(np.int32)
 
         """ Prediction """
-        y_pred = model.predict(x)[0]
-        y_pred = np.squeeze(y_pred, axis=-1)
-        y_pred = y_pred > 0.5
-        y_pred = y_pred.astype(np.int32)
+        with profiling.span("unet_inference"):
+            y_pred = model.predict(x)[0]
+            y_pred = np.squeeze(y_pred, axis=-1)
+            y_pred = y_pred > 0.5
+            y_pred = y_pred.astype(np.int32)
 
         """ Saving the prediction """
-        save_image_path = os.path.join("results3", f"{name}.png")
-        save_results(image, mask, y_pred, save_image_path)
+        with profiling.span("save_results"):
+            save_image_path = os.path.join("results3", f"{name}.png")
+            save_results(image, mask, y_pred, save_image_path)
 
         """ Flatten the array """
         y = y.flatten()
@@ -12,6 +12,11 @@ from sklearn.metrics import accuracy_score, f1_score, jaccard_score, precision_s
 from metrics import dice_loss, dice_coef, iou
 import pydicom
 import nibabel as nib
+import sys
+# profiling.py and mask_postprocess.py live in Core Dev/FLythrough
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Core Dev", "FLythrough"))
+import profiling
+import mask_postprocess
 
 H = 512
 W = 512
@@ -37,11 +42,13 @@ def save_results(image, mask, y_pred, save_image_path):
     cat_images = np.concatenate([image, line, mask, line, y_pred], axis=1)
     cv2.imwrite(save_image_path, cat_images)
 
+@profiling.span("dicom_decode")
 def load_dicom_series(directory):
     dicom_files = sorted(glob(os.path.join(directory, "*.dcm")))
     dicom_series = [pydicom.dcmread(file) for file in dicom_files]
     return dicom_series
 
+@profiling.span("unet_inference")
 def create_mask(image, model):
     x = image / 255.0
     x = np.expand_dims(x, axis=0)
@@ -68,6 +75,7 @@ if __name__ == "__main__":
 
     """ Processing each DICOM image """
     SCORE = []
+    MASKS = []
     for i, dicom in tqdm(enumerate(dicom_series), total=len(dicom_series)):
         """ Extract the name """
         name = f"dicom_{i}"
@@ -77,6 +85,7 @@ if __name__ == "__main__":
 
         """ Create mask prediction """
         mask = create_mask(image, model)
+        MASKS.append(mask.T)
 
         """ Save the prediction as PNG """
         save_image_path = os.path.join("results", f"{name}.png")
@@ -97,6 +106,14 @@ if __name__ == "__main__":
         precision_value = precision_score(y.flatten(), y_pred.flatten(), labels=[0, 1], average="binary", zero_division=1)
         SCORE.append([name, acc_value, f1_value, jac_value, recall_value, precision_value])
 
+    """ Assemble the slices into one volume and clean it in 3D before meshing """
+    volume = np.stack(MASKS, axis=2) > 0
+    pixel_spacing = dicom_series[0].PixelSpacing
+    spacing = (float(pixel_spacing[1]), float(pixel_spacing[0]), float(getattr(dicom_series[0], "SliceThickness", 1.0) or 1.0))
+    volume, stats = mask_postprocess.postprocess_mask(volume.astype(np.uint8), closing_radius=1)
+    nib.save(nib.Nifti1Image(volume, np.diag([*spacing, 1.0])), os.path.join("results", "mask_3d.nii.gz"))
+    mask_postprocess.print_report(stats)
+
     """ Metrics values """
 #     score = np.mean(np.array([s[1:] for s in SCORE]), axis=0)
 #    # print(f"Accuracy: {score[0]:0.5f}")
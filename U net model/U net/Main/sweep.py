@@ -0,0 +1,182 @@
+
+import os
+import json
+import time
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+""" Default search space, used when no --spec file is given """
+DEFAULT_SPEC = {
+    "mode": "grid",
+    "params": {
+        "lr": [1e-4, 3e-4, 1e-3],
+        "batch_size": [1, 2],
+        "num_epochs": [10],
+    },
+}
+
+def create_dir(path):
+    """ Create a directory. """
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+def sample_value(rng, space):
+    """ Draw one value from a list of choices or a {"uniform"/"log_uniform": [low, high]} range. """
+    if isinstance(space, dict):
+        if "log_uniform" in space:
+            low, high = space["log_uniform"]
+            return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        if "uniform" in space:
+            low, high = space["uniform"]
+            return float(rng.uniform(low, high))
+        raise ValueError(f"Unknown search space: {space}")
+    return space[rng.integers(len(space))]
+
+def expand_spec(spec, seed=42):
+    """ Turn a grid or random search spec into a list of trial parameter dicts. """
+    params = spec["params"]
+    names = sorted(params)
+
+    if spec.get("mode", "grid") == "grid":
+        grids = [params[name] for name in names]
+        return [dict(zip(names, values)) for values in itertools.product(*grids)]
+
+    rng = np.random.default_rng(seed)
+    return [{name: sample_value(rng, params[name]) for name in names} for _ in range(spec["trials"])]
+
+def should_prune(history, lock, trial_id, epoch, val_loss, grace_epochs=2, min_trials=3, margin=0.1):
+    """ Median stopping rule: prune a trial whose val_loss is clearly worse than the median of its peers at the same epoch. """
+    with lock:
+        losses = dict(history.get(epoch, {}))
+        losses[trial_id] = val_loss
+        history[epoch] = losses
+
+    others = [v for k, v in losses.items() if k != trial_id]
+    if epoch + 1 < grace_epochs or len(others) < min_trials:
+        return False
+    return val_loss > np.median(others) * (1.0 + margin)
+
+def run_trial(trial_id, params, cache, threads, history, lock, prune_cfg, log_dir, cpu_only):
+    """ Train one model with the given hyperparameters on the shared dataset cache. """
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    if cpu_only:
+        os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(2)
+
+    from tensorflow.keras.callbacks import CSVLogger, LambdaCallback
+    from tensorflow.keras.optimizers import Adam
+    from tensorflow.keras.metrics import Recall, Precision
+    from train import H, W, tf_cached_dataset
+    from model import build_unet
+    from metrics import dice_loss, dice_coef, iou
+
+    np.random.seed(42)
+    tf.random.set_seed(42)
+
+    train_dataset = tf_cached_dataset(*cache["train"], batch=params["batch_size"])
+    valid_dataset = tf_cached_dataset(*cache["valid"], batch=params["batch_size"])
+
+    model = build_unet((H, W, 3))
+    model.compile(loss=dice_loss, optimizer=Adam(params["lr"]), metrics=[dice_coef, iou, Recall(), Precision()])
+
+    state = {"pruned": False}
+    def on_epoch_end(epoch, logs):
+        if should_prune(history, lock, trial_id, epoch, logs["val_loss"], **prune_cfg):
+            state["pruned"] = True
+            model.stop_training = True
+
+    callbacks = [
+        CSVLogger(os.path.join(log_dir, f"trial_{trial_id}.csv")),
+        LambdaCallback(on_epoch_end=on_epoch_end),
+    ]
+
+    start = time.time()
+    hist = model.fit(
+        train_dataset,
+        epochs=params["num_epochs"],
+        validation_data=valid_dataset,
+        callbacks=callbacks,
+        shuffle=False,
+        verbose=0
+    ).history
+    best = int(np.argmin(hist["val_loss"]))
+
+    return {
+        "trial": trial_id,
+        **params,
+        "best_val_loss": hist["val_loss"][best],
+        "best_val_dice_coef": hist["val_dice_coef"][best],
+        "best_epoch": best + 1,
+        "epochs_run": len(hist["val_loss"]),
+        "pruned": state["pruned"],
+        "wall_time": time.time() - start,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep for the U-Net.")
+    parser.add_argument("--spec", help="JSON file with {'mode': 'grid'|'random', 'params': {...}, 'trials': N}")
+    parser.add_argument("--workers", type=int, default=2, help="Number of trials run at once")
+    parser.add_argument("--threads", type=int, default=max(1, (os.cpu_count() or 1) // 2), help="CPU threads per trial")
+    parser.add_argument("--dataset", default="new_data")
+    parser.add_argument("--cache-dir", default=os.path.join("files", "cache"))
+    parser.add_argument("--results", default=os.path.join("files", "sweep.csv"))
+    parser.add_argument("--grace-epochs", type=int, default=2, help="Epochs before a trial can be pruned")
+    parser.add_argument("--prune-margin", type=float, default=0.1, help="Prune when val_loss exceeds the peer median by this fraction")
+    parser.add_argument("--cpu-only", action="store_true", help="Hide GPUs from the trial processes")
+    args = parser.parse_args()
+
+    from train import load_data, shuffling, cache_dataset
+
+    spec = DEFAULT_SPEC
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    trials = expand_spec(spec)
+    print(f"Trials: {len(trials)}")
+
+    """ Decode the dataset once; every trial memory-maps the same files """
+    train_x, train_y = load_data(os.path.join(args.dataset, "train"))
+    train_x, train_y = shuffling(train_x, train_y)
+    valid_x, valid_y = load_data(os.path.join(args.dataset, "valid"))
+    cache = {
+        "train": cache_dataset(train_x, train_y, os.path.join(args.cache_dir, "train")),
+        "valid": cache_dataset(valid_x, valid_y, os.path.join(args.cache_dir, "valid")),
+    }
+
+    log_dir = os.path.join("files", "sweep")
+    create_dir(log_dir)
+    prune_cfg = {"grace_epochs": args.grace_epochs, "margin": args.prune_margin}
+
+    ctx = mp.get_context("spawn")
+    results = []
+    with ctx.Manager() as manager:
+        history = manager.dict()
+        lock = manager.Lock()
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as executor:
+            futures = {
+                executor.submit(run_trial, i, params, cache, args.threads, history, lock, prune_cfg, log_dir, args.cpu_only): i
+                for i, params in enumerate(trials)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Trial {i} failed: {e}")
+                    result = {"trial": i, **trials[i], "error": str(e)}
+                results.append(result)
+                print(f"Trial {i} done: {result}")
+
+    df = pd.DataFrame(results).sort_values("trial")
+    if "best_val_loss" in df:
+        df = df.sort_values("best_val_loss")
+    df.to_csv(args.results, index=False)
+    print(df.to_string(index=False))
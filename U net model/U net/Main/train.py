@@ -83,6 +83,116 @@ def tf_dataset(x, y, batch=8):
     dataset = dataset.prefetch(10)
     return dataset
 
+def cache_dataset(x, y, cache_dir):
+    """ Decode the images and masks once into memory-mapped .npy files that several processes can share. """
+    create_dir(cache_dir)
+    images_path = os.path.join(cache_dir, "images.npy")
+    masks_path = os.path.join(cache_dir, "masks.npy")
+    paths_path = os.path.join(cache_dir, "paths.npz")
+
+    if os.path.exists(paths_path) and os.path.exists(images_path) and os.path.exists(masks_path):
+        cached = np.load(paths_path)
+        if list(cached["x"]) == list(x) and list(cached["y"]) == list(y):
+            return images_path, masks_path
+
+    images = np.lib.format.open_memmap(images_path, mode="w+", dtype=np.uint8, shape=(len(x), H, W, 3))
+    masks = np.lib.format.open_memmap(masks_path, mode="w+", dtype=np.uint8, shape=(len(y), H, W, 1))
+    for i, (image_path, mask_path) in enumerate(zip(x, y)):
+        images[i] = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+        masks[i, ..., 0] = mask > 127
+    images.flush()
+    masks.flush()
+    del images, masks
+
+    np.savez(paths_path, x=np.array(x), y=np.array(y))
+    return images_path, masks_path
+
+def tf_cached_dataset(images_path, masks_path, batch=8):
+    """ Dataset reading pre-decoded slices from a cache written by cache_dataset. """
+    images = np.load(images_path, mmap_mode="r")
+    masks = np.load(masks_path, mmap_mode="r")
+
+    def _parse(i):
+        x = images[i].astype(np.float32) / 255.0
+        y = masks[i].astype(np.float32)
+        return x, y
+
+    def _tf_parse(i):
+        x, y = tf.numpy_function(_parse, [i], [tf.float32, tf.float32])
+        x.set_shape([H, W, 3])
+        y.set_shape([H, W, 1])
+        return x, y
+
+    dataset = tf.data.Dataset.range(len(images))
+    dataset = dataset.map(_tf_parse)
+    dataset = dataset.batch(batch)
+    dataset = dataset.prefetch(10)
+    return dataset
+
+def build_foreground_index(mask_paths, max_points=4096, seed=42):
+    """ Collect a subsample of foreground pixel indices (row * W + col) for every mask. """
+    rng = np.random.default_rng(seed)
+    coords = []
+    offsets = np.zeros(len(mask_paths) + 1, dtype=np.int64)
+    for i, path in enumerate(mask_paths):
+        mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        mask = cv2.resize(mask, (W, H), interpolation=cv2.INTER_NEAREST)
+        fg = np.flatnonzero(mask > 127).astype(np.int32)
+        if len(fg) > max_points:
+            fg = rng.choice(fg, max_points, replace=False)
+        coords.append(fg)
+        offsets[i + 1] = offsets[i] + len(fg)
+    coords = np.concatenate(coords) if coords else np.zeros(0, dtype=np.int32)
+    return coords, offsets
+
+def load_foreground_index(mask_paths, index_path, max_points=4096):
+    """ Load the foreground index from disk, rebuilding it when the mask list has changed. """
+    if os.path.exists(index_path):
+        cached = np.load(index_path)
+        if list(cached["paths"]) == list(mask_paths):
+            return cached["coords"], cached["offsets"]
+
+    coords, offsets = build_foreground_index(mask_paths, max_points=max_points)
+    np.savez(index_path, coords=coords, offsets=offsets, paths=np.array(mask_paths))
+    return coords, offsets
+
+def patch_origin(fg, rng, patch_size, fg_ratio):
+    """ Pick the top-left corner of a crop, centred on a foreground pixel with probability fg_ratio. """
+    if len(fg) > 0 and rng.random() < fg_ratio:
+        cy, cx = divmod(int(fg[rng.integers(len(fg))]), W)
+    else:
+        cy, cx = rng.integers(H), rng.integers(W)
+    y0 = int(np.clip(cy - patch_size // 2, 0, H - patch_size))
+    x0 = int(np.clip(cx - patch_size // 2, 0, W - patch_size))
+    return y0, x0
+
+def tf_patch_dataset(x, y, fg_index, patch_size=256, fg_ratio=0.7, batch=8, seed=42):
+    """ Training dataset of fixed-size crops drawn from the full slices. """
+    coords, offsets = fg_index
+    rng = np.random.default_rng(seed)
+
+    def _parse(x, y, i):
+        x = read_image(x)
+        y = read_mask(y)
+        fg = coords[offsets[i]:offsets[i + 1]]
+        y0, x0 = patch_origin(fg, rng, patch_size, fg_ratio)
+        x = x[y0:y0 + patch_size, x0:x0 + patch_size]
+        y = y[y0:y0 + patch_size, x0:x0 + patch_size]
+        return x, y
+
+    def _tf_parse(x, y, i):
+        x, y = tf.numpy_function(_parse, [x, y, i], [tf.float32, tf.float32])
+        x.set_shape([patch_size, patch_size, 3])
+        y.set_shape([patch_size, patch_size, 1])
+        return x, y
+
+    dataset = tf.data.Dataset.from_tensor_slices((x, y, np.arange(len(x), dtype=np.int64)))
+    dataset = dataset.map(_tf_parse)
+    dataset = dataset.batch(batch)
+    dataset = dataset.prefetch(10)
+    return dataset
+
 
 if __name__ == "__main__":
     """ Seeding """
@@ -96,6 +206,13 @@ if __name__ == "__main__":
     batch_size = 1
     lr = 1e-4
     num_epochs = 10
+
+    """ Patch sampling: set patch_size to None to train on full 512x512 slices """
+    patch_size = None
+    patch_batch_size = 8
+    fg_ratio = 0.7
+    fg_index_path = os.path.join("files", "fg_index.npz")
+
     model_path = os.path.join("files", "model3.h5")
     csv_path = os.path.join("files", "data3.csv")
 
@@ -111,11 +228,17 @@ if __name__ == "__main__":
     print(f"Train: {len(train_x)} - {len(train_y)}")
     print(f"Valid: {len(valid_x)} - {len(valid_y)}")
 
-    train_dataset = tf_dataset(train_x, train_y, batch=batch_size)
+    if patch_size:
+        fg_index = load_foreground_index(train_y, fg_index_path)
+        train_dataset = tf_patch_dataset(train_x, train_y, fg_index, patch_size=patch_size, fg_ratio=fg_ratio, batch=patch_batch_size)
+    else:
+        train_dataset = tf_dataset(train_x, train_y, batch=batch_size)
+
+    """ Validation always runs on full slices so metrics stay comparable """
     valid_dataset = tf_dataset(valid_x, valid_y, batch=batch_size)
 
-    """ Model """
-    model = build_unet((H, W, 3))
+    """ Model (fully convolutional, so patch-trained weights also accept full slices) """
+    model = build_unet((None, None, 3) if patch_size else (H, W, 3))
     metrics = [dice_coef, iou, Recall(), Precision()]
     model.compile(loss=dice_loss, optimizer=Adam(lr), metrics=metrics)
 